@@ -1,8 +1,14 @@
+import os
 import pandas as pd
 import numpy as np
 import paths
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from utilities import *
+from utilities_io import read_df
+from utilities_params import load_item_params
+from pipeline_scheduler import in_worker
 
 pd.options.display.width = 250
 pd.options.display.max_columns = 999
@@ -11,6 +17,32 @@ pd.options.display.max_columns = 999
 RANDOM_SEED = 3
 N_TRIALS = 10000
 
+# Draw trials in rounds until centiles converge, instead of always drawing N_TRIALS (which becomes the maximum).
+# Footprint types stop once no centile of any country, diet, and output group changes by more than REL_TOL
+# (relative to the group's previous centiles) between rounds; at least MIN_TRIALS are always drawn.
+ADAPTIVE_TRIALS = True
+REL_TOL = 0.005
+MIN_TRIALS = 1000
+
+# Maximum number of values (groups x trials) held in memory at once when summarizing trials
+CHUNK_SIZE = 10**7
+
+# Trials are drawn in chunks of this size, each from its own random number stream spawned from RANDOM_SEED,
+# so results are the same no matter how many workers are used (but change if TRIAL_CHUNK changes)
+TRIAL_CHUNK = 1000
+
+# Number of worker processes, at most one per CPU; set to 1 (or set the PIPELINE_BOOTSTRAP_WORKERS environment variable)
+# to run everything in the current process. Inside a pipeline worker process, which shares the CPUs w/other steps,
+# trials are always drawn in that process (see pipeline_scheduler.in_worker)
+N_WORKERS = int(os.environ.get('PIPELINE_BOOTSTRAP_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Summarize trials w/a histogram of each group's total footprints (SKETCH_BINS bins between the smallest and largest
+# possible totals) instead of keeping every trial in memory, so memory use doesn't grow w/the number of trials.
+# Centiles are then accurate to within 1 bin width, i.e., (largest - smallest possible total) / SKETCH_BINS;
+# the bound for each footprint type is reported in diet_footprints_bootstrap_trials.csv.
+SKETCH = False
+SKETCH_BINS = 2000
+
 # For reporting on script runtime
 startTime = datetime.now()
 
@@ -130,44 +162,136 @@ def gather_footprints(fp, items):
     return fp_merge.merge(fp_valid_types, how='inner', on=['output_group', 'footprint_type'])
 
 
-def summarize_footprint(diet_data, trial_data):
-    # Summarize footprints, return centiles by country, diet, and output group
-    # TODO: add documentation
+def trial_rng(fp_type_key, chunk):
+    # Independent random number stream for each footprint type and chunk of trials.
+    # fp_type_key is the footprint type's sort order, which stays the same when footprint types are renamed or added.
+    return np.random.default_rng(np.random.SeedSequence(RANDOM_SEED, spawn_key=(fp_type_key, chunk)))
+
+
+def sample_footprints(dists, fp_type_key, chunk, n_trials):
+    # Draw n_trials footprints for each item from its distribution, given as a list of (footprints, weights) arrays.
+    # Returns an (items x trials) array of samples.
+
+    rng = trial_rng(fp_type_key, chunk)
+    return np.array([rng.choice(footprints, n_trials, p=weights) for footprints, weights in dists])
+
+
+def total_bounds(quants, dists):
+    # Smallest and largest possible total footprint of each group (row of quants), i.e., if every item
+    # took its smallest (largest) footprint value; this holds since diet quantities are >= 0
+
+    lo = quants @ np.array([footprints.min() for footprints, weights in dists])
+    hi = quants @ np.array([footprints.max() for footprints, weights in dists])
+    return lo, hi
+
+
+def sketch_trials(quants, lo, hi, dists, fp_type_key, chunks, chunk_sizes):
+    # Draw the given chunks of trials and count each group's total footprints in SKETCH_BINS equal bins between
+    # lo and hi; samples are discarded after each chunk. Returns (groups x bins) counts.
+    # Counts are integers, so counts from different tasks can be added up in any order w/o changing results.
+
+    n_groups = quants.shape[0]
+    width = (hi - lo) / SKETCH_BINS
+    counts = np.zeros(n_groups * SKETCH_BINS, dtype=np.int64)
+    for chunk, n_trials in zip(chunks, chunk_sizes):
+        samples = sample_footprints(dists, fp_type_key, chunk, n_trials)
+        chunk_rows = max(1, CHUNK_SIZE // n_trials)
+        for start in range(0, n_groups, chunk_rows):
+            rows = slice(start, start + chunk_rows)
+            totals = quants[rows] @ samples
+            # Groups where every total is the same (width 0) go in the first bin
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bins = np.floor((totals - lo[rows, None]) / width[rows, None])
+            bins = np.clip(np.nan_to_num(bins, nan=0, posinf=0, neginf=0), 0, SKETCH_BINS - 1).astype(np.int64)
+            bins += np.arange(start, start + len(totals))[:, None] * SKETCH_BINS
+            counts += np.bincount(bins.ravel(), minlength=counts.size)
+    return counts.reshape(n_groups, SKETCH_BINS)
+
+
+def sketch_centiles(counts, lo, hi):
+    # 25th, 50th, and 75th centiles from histogram counts. As in np.percentile, the centile p interpolates between
+    # the trials at ranks floor(p * (n - 1)) and the next one up; each of these is estimated by finding the bin
+    # that holds it and assuming trials are spread evenly within the bin, so it's off by at most 1 bin width,
+    # and so is the result. Returns a (groups x 3) array.
+
+    width = (hi - lo) / SKETCH_BINS
+    n = counts.sum(axis=1)
+    cum = np.cumsum(counts, axis=1)
+    rows = np.arange(len(counts))
+
+    def trial_at_rank(k):
+        b = np.minimum((cum <= k[:, None]).sum(axis=1), SKETCH_BINS - 1)
+        before = np.where(b > 0, cum[rows, np.maximum(b - 1, 0)], 0)
+        return lo + (b + (k - before + 0.5) / counts[rows, b]) * width
 
-    group_members = diet_data['fbs_item_code']
-    diet_data = diet_data.set_index('fbs_item_code')
-    diet_quants = diet_data['kg/cap/yr']
+    centiles = []
+    for p in [25, 50, 75]:
+        rank = p / 100 * (n - 1)
+        k = np.floor(rank)
+        centiles.append(trial_at_rank(k) + (rank - k) * (trial_at_rank(np.minimum(k + 1, n - 1)) - trial_at_rank(k)))
+    return np.column_stack(centiles)
 
-    # TODO: restructure diet_model.py outputs to already have 0s instead of NAs if an item
-    #       is not consumed in a country/diet/output group
 
-    # This is a little hack: append the list of items from the footprint data with zeroes, then drop
-    # duplicates, keeping the first entries. This ensures that anything not in the quants is added with
-    # a quant of 0. (There's no left join method available for series-list, so this was cleaner).
-    new_quants = pd.Series(data=0,
-                           index=group_members)
-    diet_quants = diet_quants._append(new_quants)
-    diet_quants = diet_quants.groupby(diet_quants.index).first()
-    trial_data = trial_data[group_members]
+def max_relative_change(old, new):
+    # Largest change between two (groups x 3) arrays of centiles, relative to the scale of each group (its largest
+    # old centile, so that small 25th centiles don't dominate); unchanged values (e.g., 0 -> 0) are 0.
+    # NB: a centile that falls right between two footprint values of a discrete distribution may keep jumping
+    # between them, in which case the footprint type runs to N_TRIALS
 
-    mat_result = trial_data.dot(diet_quants)
-    # NB: np.percentile accepts centiles between 0 and 100, not 0 and 1
-    mat_centile_result = np.percentile(mat_result, [25, 50, 75])
+    scale = np.abs(old).max(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.abs(new - old) / scale
+    change[new == old] = 0
+    return change.max() if change.size > 0 else 0
 
-    return [mat_centile_result[0], mat_centile_result[1], mat_centile_result[2]]
 
+def run_tasks(executor, func, *args):
+    # Run func over each set of args, in the process pool if there is one; results are returned in task order
+    return list(executor.map(func, *args)) if executor is not None else list(map(func, *args))
+
+
+def diet_quantities(dm, item_codes):
+    # Dense (groups x items) matrix of diet quantities in kg/cap/yr, w/one row per diet, output group, and country,
+    # and one column per item in item_codes; items not consumed in a group are 0.
+    # Returns the group keys (sorted, as in groupby) and the matrix.
+
+    dm = dm[dm['fbs_item_code'].isin(item_codes)]
+    dm = dm.drop_duplicates(['diet', 'output_group', 'country', 'fbs_item_code'])
+
+    grouped = dm.groupby(['diet', 'output_group', 'country'])
+    keys = grouped.size().index.to_frame(index=False)
+    rows = grouped.ngroup().to_numpy()
+    cols = pd.Index(item_codes).get_indexer(dm['fbs_item_code'])
+
+    # Rows w/NaN group keys are left out, as in groupby
+    valid = rows >= 0
+    quants = np.zeros((len(keys), len(item_codes)))
+    quants[rows[valid], cols[valid]] = dm['kg/cap/yr'].to_numpy()[valid]
+    return keys, quants
+
+
+def bootstrap_centiles(quants, samples):
+    # Total footprint of each group (row of quants) in every trial, summarized as 25th, 50th, and 75th centiles.
+    # All groups are computed w/a single matrix product, in chunks of rows to limit memory use.
+    # Returns a (groups x 3) array.
+
+    chunk_rows = max(1, CHUNK_SIZE // samples.shape[1])
+    centiles = [np.empty((0, 3))]
+    for start in range(0, quants.shape[0], chunk_rows):
+        totals = quants[start:start + chunk_rows] @ samples
+        # NB: np.percentile accepts centiles between 0 and 100, not 0 and 1
+        centiles.append(np.percentile(totals, [25, 50, 75], axis=1).T)
+    return np.concatenate(centiles)
 
 
 # Main method
 def diet_footprints_bootstrap():
 
-    np.random.seed(RANDOM_SEED)
-
     # Input
-    items = pd.read_excel(paths.input/'item_parameters.xlsx', sheet_name='fbs_items').pipe(snake_case_cols)
+    items = load_item_params().pipe(snake_case_cols)
     fp = pd.read_excel(paths.input/'ghge/ghge_lit_review_distributions.xlsx', sheet_name='ghge_combined', skiprows=3)
     fp_params = pd.read_csv(paths.input/'footprint_type_bootstrap_parameters.csv')
-    dm = pd.read_csv(paths.output/'diet_model_by_country_diet_item.csv').pipe(snake_case_cols)
+    dm = read_df(paths.output/'diet_model_by_country_diet_item.csv').pipe(snake_case_cols)
     percent_farmed = pd.read_csv(paths.input/'aquatic_percent_farmed.csv').pipe(snake_case_cols)
 
     # Create global list of footprint types for which bootstrap by group applies
@@ -201,54 +325,110 @@ def diet_footprints_bootstrap():
     fp_norm = fp_grouped.apply(normalize_weights)
     fp_norm.to_csv(paths.diagnostic/'item_footprint_distributions_normalized.csv', index=False)
 
-    # Set number of samples of every item and footprint type
+    # Trials are drawn in fixed-size chunks, up to N_TRIALS.
+    # W/adaptive trials, the first round draws MIN_TRIALS, and each round after that doubles the number of trials,
+    # until a footprint type's centiles change by no more than REL_TOL between rounds.
     n_trials = N_TRIALS
+    chunks = [min(TRIAL_CHUNK, n_trials - start) for start in range(0, n_trials, TRIAL_CHUNK)]
+    n_chunks = -(-MIN_TRIALS // TRIAL_CHUNK) if ADAPTIVE_TRIALS else len(chunks)
+    n_chunks = min(max(n_chunks, 1), len(chunks))
 
     fp_types = fp_norm['footprint_type'].unique()
     item_codes = fp_norm['fbs_item_code'].unique()
+    fp_type_keys = fp_params.set_index('footprint_type')['footprint_type_sort_order'].astype(int)
+
+    # Footprint distribution of each footprint type and item, for the items that have data for each footprint type
+    fp_dists = {k: df for k, df in fp_norm.groupby(['footprint_type', 'fbs_item_code'], sort=False)}
+    fp_codes = {t: [i for i in item_codes if (t, i) in fp_dists] for t in fp_types}
+    fp_types = [t for t in fp_types if len(fp_codes[t]) > 0]
+    dists = {t: [(fp_dists[(t, i)]['footprint'].to_numpy(), fp_dists[(t, i)]['weight'].to_numpy())
+                 for i in fp_codes[t]] for t in fp_types}
+
+    # Diet quantities by diet, output group, and country, for the items that have data for each footprint type
+    quants = {t: diet_quantities(dm, fp_codes[t]) for t in fp_types}
 
-    # Initialize empty results data frame
     results_cols = ['diet', 'output_group', 'country',
                        'footprint_type', 'centile_25',
                        'centile_50', 'centile_75']
-    results = pd.DataFrame(columns=results_cols)
-
-    # Iterate over each footprint type
-    for fp_type in fp_types:
-        print('\nbootstrapping',fp_type)
-        fp_trial_data = pd.DataFrame(columns=item_codes)
-        for item_code in item_codes:
-            fp_match = fp_norm['footprint_type'] == fp_type
-            item_match = fp_norm['fbs_item_code'] == item_code
-            fp_data = fp_norm[fp_match & item_match]
-
-            if len(fp_data.index) > 0:
-                fp_trial_data[item_code] = np.random.choice(
-                    fp_data['footprint'], n_trials, p=fp_data['weight'])
-
-        # n_trials*(number of items) data frame with all footprint trial data for
-        # this fp type; remove items that don't have data for this footprint type
-        fp_trial_data = fp_trial_data.dropna(axis=1, how='all')
-
-        # Remove everything from the diet model for this footprint type that doesn't have trial data
-        fp_dm = dm[dm['fbs_item_code'].isin(list(fp_trial_data.columns))]
-
-        # Apply quantile calculations over output groups and return centiles
-        results_by_fp_type = fp_dm.groupby(['diet', 'output_group', 'country']). \
-            apply(lambda x: summarize_footprint(x, fp_trial_data)).rename('centiles').reset_index()
-
-        # Split centiles into individual columns
-        # https: // www.statology.org / pandas - split - column - of - lists - into - columns /
-        centiles = pd.DataFrame(results_by_fp_type['centiles'].to_list(), columns=['centile_25', 'centile_50', 'centile_75'])
-        results_by_fp_type = pd.concat([results_by_fp_type, centiles], axis=1)
-
-        # Set the footprint type to the current one being iterated over
-        results_by_fp_type['footprint_type'] = fp_type
-
-        results = pd.concat([results, results_by_fp_type], sort=False)
+    results = []
+    trials = []
+
+    # Trials drawn so far for each footprint type: sample chunks, or histogram counts if using SKETCH
+    drawn = {t: 0 for t in fp_types}
+    samples = {t: [] for t in fp_types}
+    if SKETCH:
+        bounds = {t: total_bounds(quants[t][1], dists[t]) for t in fp_types}
+        counts = {t: 0 for t in fp_types}
+
+    centiles = {}
+    active = list(fp_types)
+
+    n_workers = 1 if in_worker() else N_WORKERS
+    with ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else nullcontext() as executor:
+        while len(active) > 0:
+
+            print('\nbootstrapping', len(active), 'footprint type(s),', sum(chunks[:n_chunks]), 'trials on up to',
+                  n_workers, 'workers')
+
+            if SKETCH:
+                # Draw the next round of trials and count them in each group's histogram,
+                # splitting each footprint type's chunks of trials across the workers
+                tasks = [(t, c.tolist()) for t in active
+                         for c in np.array_split(np.arange(drawn[t], n_chunks), n_workers) if len(c) > 0]
+                counted = run_tasks(executor, sketch_trials,
+                                    [quants[t][1] for t, c in tasks], [bounds[t][0] for t, c in tasks],
+                                    [bounds[t][1] for t, c in tasks], [dists[t] for t, c in tasks],
+                                    [fp_type_keys[t] for t, c in tasks], [c for t, c in tasks],
+                                    [[chunks[i] for i in c] for t, c in tasks])
+                for (t, c), n in zip(tasks, counted):
+                    counts[t] = counts[t] + n
+            else:
+                # Draw the next round of (items x trials) samples for each footprint type, one chunk of trials per task
+                tasks = [(t, c) for t in active for c in range(drawn[t], n_chunks)]
+                sampled = run_tasks(executor, sample_footprints,
+                                    [dists[t] for t, c in tasks], [fp_type_keys[t] for t, c in tasks],
+                                    [c for t, c in tasks], [chunks[c] for t, c in tasks])
+                for (t, c), s in zip(tasks, sampled):
+                    samples[t].append(s)
+
+            # Total footprints by diet, output group, and country in each trial, summarized as centiles,
+            # one block of groups per task
+            n_drawn = sum(chunks[:n_chunks])
+            chunk_rows = max(1, CHUNK_SIZE // n_drawn)
+            for fp_type in active.copy():
+                drawn[fp_type] = n_chunks
+                keys, q = quants[fp_type]
+
+                if SKETCH:
+                    new_centiles = sketch_centiles(counts[fp_type], *bounds[fp_type])
+                else:
+                    blocks = [q[start:start + chunk_rows] for start in range(0, len(keys), chunk_rows)]
+                    fp_samples = np.concatenate(samples[fp_type], axis=1)
+                    new_centiles = np.concatenate([np.empty((0, 3))] + run_tasks(executor, bootstrap_centiles, blocks,
+                                                                                  [fp_samples] * len(blocks)))
+
+                change = max_relative_change(centiles[fp_type], new_centiles) if fp_type in centiles else np.inf
+                centiles[fp_type] = new_centiles
+
+                if change <= REL_TOL or n_chunks == len(chunks):
+                    print(fp_type, 'done after', n_drawn, 'trials')
+                    error = (bounds[fp_type][1] - bounds[fp_type][0]).max() / SKETCH_BINS \
+                        if SKETCH and len(keys) > 0 else 0
+                    trials.append({'footprint_type': fp_type, 'n_trials': n_drawn,
+                                   'max_relative_change': change, 'converged': 'yes' if change <= REL_TOL else 'no',
+                                   'max_centile_error': error})
+                    results.append(keys.assign(footprint_type=fp_type, centile_25=new_centiles[:, 0],
+                                               centile_50=new_centiles[:, 1], centile_75=new_centiles[:, 2]))
+                    samples.pop(fp_type)
+                    active.remove(fp_type)
+
+            n_chunks = min(n_chunks * 2, len(chunks))
+
+    # Number of trials each footprint type needed
+    pd.DataFrame(trials).to_csv(paths.diagnostic/'diet_footprints_bootstrap_trials.csv', index=False)
 
     # Reorder columns after concat statements
-    results = results[results_cols]
+    results = pd.concat(results, sort=False)[results_cols]
 
     # Merge w/country codes
     coded_results = results.merge(dm[['country', 'country_code']].drop_duplicates(), how='left', on='country')
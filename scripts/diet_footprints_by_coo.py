@@ -2,10 +2,11 @@ import numpy as np
 import pandas as pd
 import gc # Garbage collection module, to save memory
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_diet_climate import *
+from utilities_io import read_df, save_df
+from utilities_dimensions import encode_dimensions
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -13,6 +14,15 @@ pd.options.mode.chained_assignment = None
 COUNTRY_VARS = ['region', 'income_class', 'oecd']
 OUTPUT_DETAILED_BY_COO = False
 
+# Diet footprints are computed for this many consumer countries at a time, to limit memory use;
+# set to None to compute all countries at once
+COUNTRIES_PER_CHUNK = 20
+
+# Columns to group by for each grouped output file
+INDEX_COLS_BY_COO = ['country_code', 'country', 'origin', 'coo_code', 'coo', 'diet', 'footprint_type'] + COUNTRY_VARS
+INDEX_COLS_BY_OG = ['country_code', 'country', 'origin', 'diet', 'type', 'output_group', 'fbs_item_code', 'fbs_item',
+                    'footprint_type'] + COUNTRY_VARS
+
 def compute_diet_footprints(dm, fp):
 
     # Merge diet model w/item footprint by coo, compute diet footprints
@@ -22,7 +32,7 @@ def compute_diet_footprints(dm, fp):
     # it just doesn't get a row in the long-form df (which is effectively footprint = 0).
     # We just have to be careful if we ever pivot by footprint type, because that could create NAN values.
     print('Merging diet model w/item footprints')
-    fp.rename(columns={'country_code': 'coo_code', 'footprint': 'item_footprint_per_kg'}, inplace=True)
+    fp = fp.rename(columns={'country_code': 'coo_code', 'footprint': 'item_footprint_per_kg'})
     fp = fp[['coo_code', 'fbs_item_code', 'fbs_item', 'footprint_type', 'item_footprint_per_kg']]
     fp = pd.merge(dm, fp, on=['coo_code', 'fbs_item', 'fbs_item_code'], how='inner', suffixes=('', '_x'))
     fp.drop(columns=list(fp.filter(regex='_x')), inplace=True)
@@ -43,13 +53,14 @@ def diet_footprints_by_coo():
 
     # Input ************************************************************************************************************
 
-    dm = pd.read_csv(paths.output/'diet_model_by_country_diet_item_coo.csv')
-    fp = pd.read_csv(paths.interim/'item_footprints/item_footprints_by_coo.csv')
-    fp_int = pd.read_csv(paths.interim/'item_footprints/item_footprints_by_coo_intensive.csv')
+    # Country, item, diet, etc. are kept as shared categoricals; see utilities_dimensions
+    dm = encode_dimensions(read_df(paths.output/'diet_model_by_country_diet_item_coo.csv', categorical=True))
+    fp = encode_dimensions(read_df(paths.interim/'item_footprints/item_footprints_by_coo.csv', categorical=True))
+    fp_int = encode_dimensions(read_df(paths.interim/'item_footprints/item_footprints_by_coo_intensive.csv', categorical=True))
 
     # For grouped files
-    countries = pd.read_csv(paths.interim/'fao_countries.csv')[['country_code', 'country'] + COUNTRY_VARS]
-    population = pd.read_csv(paths.interim / 'fao_population.csv')
+    countries = encode_dimensions(pd.read_csv(paths.interim/'fao_countries.csv')[['country_code', 'country'] + COUNTRY_VARS])
+    population = encode_dimensions(pd.read_csv(paths.interim / 'fao_population.csv'))
 
     # Compute diet footprints ******************************************************************************************
 
@@ -60,38 +71,56 @@ def diet_footprints_by_coo():
     #conds = (dm['diet']=='high_income') & (dm['fbs_item'].isin(['Pigmeat', 'Poultry Meat']))
     #dm.loc[conds, 'fbs_item'] += '_intensive'
 
-    fp_int = compute_diet_footprints(dm_int, fp_int)
-    fp = compute_diet_footprints(dm, fp)
-    fp = pd.concat([fp, fp_int], sort=False)
+    # Consumer countries are processed in chunks; only the grouped results of each chunk are kept
+    country_codes = np.sort(pd.concat([dm['country_code'], dm_int['country_code']]).unique())
+    chunk_size = COUNTRIES_PER_CHUNK if COUNTRIES_PER_CHUNK is not None else max(len(country_codes), 1)
+    chunks = [country_codes[i:i + chunk_size] for i in range(0, len(country_codes), chunk_size)]
+
+    fp_by_diet = []
+    fp_by_og = []
+    for i, chunk in enumerate(chunks):
+        print('Consumer countries', i * chunk_size + 1, '-', i * chunk_size + len(chunk), 'of', len(country_codes))
+
+        fp_chunk = pd.concat([compute_diet_footprints(dm[dm['country_code'].isin(chunk)], fp),
+                              compute_diet_footprints(dm_int[dm_int['country_code'].isin(chunk)], fp_int)], sort=False)
 
-    # Remove intermediate columns
-    fp.drop(columns=['kg/cap/yr_by_coo'], inplace=True)
+        # Remove intermediate columns
+        fp_chunk.drop(columns=['kg/cap/yr_by_coo'], inplace=True)
 
-    # Add income and other country vars
-    fp = s_merge(fp, countries, on=['country_code', 'country'], how='left', validate='m:1')
+        # Add income and other country vars
+        fp_chunk = s_merge(fp_chunk, countries, on=['country_code', 'country'], how='left', validate='m:1')
 
-    # Output ***********************************************************************************************************
+        # This file is too large for github so we can deactivate this option;
+        # each chunk of countries is appended to the same csv, so the whole table is never in memory
+        if OUTPUT_DETAILED_BY_COO:
+            if i == 0:
+                detailed_cols = fp_chunk.columns
+            fp_chunk[detailed_cols].to_csv(paths.output / 'by_coo_only/diet_footprints_by_country_diet_item_coo.csv',
+                                           index=False, mode='w' if i == 0 else 'a', header=(i == 0))
 
-    # This file is too large for github so we can deactivate this option
-    if OUTPUT_DETAILED_BY_COO:
-        fp.to_csv(paths.output/'by_coo_only/diet_footprints_by_country_diet_item_coo.csv', index=False)
+        # Whole diet, baseline only, by coo
+        fp_by_diet.append(fp_chunk[fp_chunk['diet'] == 'baseline']
+                          .groupby(INDEX_COLS_BY_COO, observed=True)['diet_footprint'].sum().reset_index())
+
+        # By origin (domestic, imported) and item
+        fp_by_og.append(fp_chunk.groupby(INDEX_COLS_BY_OG, observed=True)['diet_footprint'].sum().reset_index())
+
+        del fp_chunk
+        gc.collect()
 
     # Further grouping *************************************************************************************************
 
+    # Combine the sums from each chunk; since chunks are split by country, which is one of the index columns,
+    # each group only has a sum from one chunk and re-grouping doesn't change any values
+    fp_by_diet = pd.concat(fp_by_diet, sort=False).groupby(INDEX_COLS_BY_COO, observed=True)['diet_footprint'].sum().reset_index()
+    fp_by_og = pd.concat(fp_by_og, sort=False).groupby(INDEX_COLS_BY_OG, observed=True)['diet_footprint'].sum().reset_index()
+
     # Whole diet, baseline only, by coo
     # Optional to-do: add population data
-    fp_by_diet = fp.copy()
-    fp_by_diet = fp_by_diet[fp_by_diet['diet'] == 'baseline']
-    index_cols = ['country_code', 'country', 'origin', 'coo_code', 'coo', 'diet', 'footprint_type'] + COUNTRY_VARS
-    fp_by_diet = fp_by_diet.groupby(index_cols)['diet_footprint'].sum().reset_index()
     fp_by_diet.to_csv(paths.output / 'by_coo_only/diet_footprints_by_coo_baseline_only.csv', index=False)
 
     # By origin (domestic, imported) and item; w/population data
-    fp_by_og = fp.copy()
-    index_cols = ['country_code', 'country', 'origin', 'diet', 'type', 'output_group', 'fbs_item_code', 'fbs_item', 'footprint_type'] + COUNTRY_VARS
-    fp_by_og = fp_by_og.groupby(index_cols)['diet_footprint'].sum().reset_index()
-
     fp_by_og = s_merge(fp_by_og, population, on=['country_code', 'country'], how='left', validate='m:1')
     fp_by_og['diet_footprint_whole_pop'] = fp_by_og['diet_footprint'] * fp_by_og['population']
 
-    fp_by_og.to_csv(paths.output / 'by_coo_only/diet_footprints_by_origin_diet_item.csv', index=False)
+    save_df(fp_by_og, paths.output / 'by_coo_only/diet_footprints_by_origin_diet_item.csv')
@@ -3,6 +3,8 @@ import numpy as np
 import paths
 from datetime import datetime
 from utilities import snake_case_cols
+from utilities_io import save_df
+from utilities_params import load_run_params, load_params_sheet, load_item_params
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -124,14 +126,13 @@ def percent_after_losses(dm, series_name, include_consumption):
 def diet_model_baseline():
 
     # Input
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1)
-    run_params.set_index('parameter', inplace=True)
+    run_params = load_run_params()
 
-    countries_to_run = pd.read_excel(paths.params, sheet_name='countries_incl', skiprows=1)
+    countries_to_run = load_params_sheet('countries_incl')
     fbs = (pd.read_csv(paths.interim/'fao_fbs_avg_loss_unadj.csv')
         [['country_code', 'country', 'fbs_item_code', 'fbs_item', 'imports_1000_mt', 'domestic_supply_1000_mt',
           'supply_kg/cap/yr', 'supply_kcal/cap/day', 'supply_g_pro/cap/day']])
-    item_params = pd.read_excel(paths.input/'item_parameters.xlsx', sheet_name='fbs_items').pipe(snake_case_cols)
+    item_params = load_item_params().pipe(snake_case_cols)
     losses = pd.read_csv(paths.input / 'food_losses.csv')
     losses_regions = (pd.read_csv(paths.interim/'fao_countries.csv')[['country_code', 'food_loss_region']])
     nutrient_comp = pd.read_csv(paths.interim/'nutrient_comp.csv').pipe(snake_case_cols)
@@ -197,4 +198,4 @@ def diet_model_baseline():
     dm = baseline_item_quants(dm, run_params)
 
     # Output
-    dm.to_csv(paths.interim/'diet_model_baseline.csv', index=False)
+    save_df(dm, paths.interim/'diet_model_baseline.csv', keep=True)
@@ -1,64 +1,73 @@
 import numpy as np
 import pandas as pd
 import gc # Garbage collection module, to save memory
+from scipy import sparse
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_diet_climate import *
+from utilities_io import read_df, save_df
+from utilities_dimensions import encode_dimensions, dimension_dtype
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
 
-def domestic(dm_):
-# Compute % domestic based on FBS
+# Shares by country of origin depend only on these columns, not on the diet
+SHARE_COLS = ['country_code', 'country', 'fbs_item_code', '%_imported', 'sum_imports_mt/yr']
 
-    # Make a copy to avoid altering original dataframe
-    dm = dm_.copy()
 
-    dm['coo'] = dm['country']
-    dm['coo_code'] = dm['country_code']
-    dm['%_from_coo'] = 1 - dm['%_imported'] #total % imported is from FBS, not trade matrix
+def drop_nan_zero(shares):
+    # Drop NaN and zero values, and entries w/o a country of origin
+    return shares[(shares['%_from_coo'].notna()) & (shares['%_from_coo'] != 0) &
+                  shares['coo_code'].notna() & shares['coo'].notna()]
 
-    # Drop NaN and zero values
-    dm = dm[(dm['%_from_coo'].notna()) & (dm['%_from_coo'] != 0)]
-    return dm
 
+def domestic(keys):
+# Compute % domestic based on FBS; returns one row per share key (row), country of origin, and % from coo
 
-def world(dm_):
-# Compute % from world avg., i.e., imported items with no coo data in the trade matrix
+    shares = pd.DataFrame({'row': keys.index, 'coo_code': keys['country_code'], 'coo': keys['country'],
+                           '%_from_coo': 1 - keys['%_imported']}) #total % imported is from FBS, not trade matrix
+    return drop_nan_zero(shares)
 
-    # Make a copy to avoid altering original dataframe
-    dm = dm_.copy()
 
-    # If item is imported but has no import data from trade matrix, associate % imported with 'World'
-    dm['coo'] = 'World'
-    dm['coo_code'] = 0
-    dm.loc[(dm['%_imported'] > 0) & (dm['sum_imports_mt/yr'] <= 0), '%_from_coo'] = dm['%_imported']
+def world(keys):
+# Compute % from world avg., i.e., imported items with no coo data in the trade matrix
 
-    # Drop NaN and zero values
-    dm = dm[(dm['%_from_coo'].notna()) & (dm['%_from_coo'] != 0)]
-    return dm
+    # If item is imported but has no import data from trade matrix, associate % imported with 'World'
+    world_imports = (keys['%_imported'] > 0) & (keys['sum_imports_mt/yr'] <= 0)
+    shares = pd.DataFrame({'row': keys.index, 'coo_code': 0, 'coo': 'World',
+                           '%_from_coo': keys['%_imported'].where(world_imports)})
+    return drop_nan_zero(shares)
 
 
-def imports(dm_, tm):
+def imports(keys, tm):
 # Compute % from coo
 
-    # Make a copy to avoid altering original dataframe
-    dm = dm_.copy()
-
-    # Merge dm w/trade matrix on item and country; drop duplicates
-    dm = pd.merge(dm, tm, on=['fbs_item_code', 'country_code'], how='left', suffixes=('', '_x'))
-    dm.drop(columns=list(dm.filter(regex='_x')), inplace=True)
+    # Merge share keys w/trade matrix on item and country
+    shares = pd.merge(keys.reset_index(names='row'), tm[['country_code', 'fbs_item_code', 'coo_code', 'coo', 'imports_mt/yr']],
+                      on=['fbs_item_code', 'country_code'], how='inner')
 
     # % from coo = % imported from coo * % imported
     # Note that % imported is calculated from FBS data and is not specific to COO;
     # We use it because there are fewer assumptions involved compared to summing imports by COO
-    dm['%_from_coo'] = (dm['imports_mt/yr'] / dm['sum_imports_mt/yr']) * dm['%_imported']
+    shares['%_from_coo'] = (shares['imports_mt/yr'] / shares['sum_imports_mt/yr']) * shares['%_imported']
+    return drop_nan_zero(shares[['row', 'coo_code', 'coo', '%_from_coo']])
+
 
-    # Drop NaN and zero values
-    dm = dm[(dm['%_from_coo'].notna()) & (dm['%_from_coo'] != 0)]
-    return dm
+def share_matrix(keys, tm):
+    # Sparse (share keys x countries of origin) matrix of % from coo, combining % domestic, % from coo,
+    # and % from world avg.; entries for the same key and coo are summed, i.e., when a country imports to itself.
+    # Returns the countries of origin (columns, sorted by code and name) and the matrix in CSR format.
+
+    shares = pd.concat([domestic(keys), imports(keys, tm), world(keys)], sort=False)
+
+    coos = shares[['coo_code', 'coo']].drop_duplicates().sort_values(['coo_code', 'coo']).reset_index(drop=True)
+    cols = pd.MultiIndex.from_frame(coos).get_indexer(pd.MultiIndex.from_frame(shares[['coo_code', 'coo']]))
+
+    matrix = sparse.coo_matrix((shares['%_from_coo'].to_numpy(), (shares['row'].to_numpy(), cols)),
+                               shape=(len(keys), len(coos))).tocsr()
+    matrix.sum_duplicates()
+    return coos, matrix
 
 
 # Main method
@@ -66,7 +75,7 @@ def diet_model_by_coo():
 
     # Input ************************************************************************************************************
 
-    dm = (pd.read_csv(paths.output/'diet_model_by_country_diet_item.csv')
+    dm = (read_df(paths.output/'diet_model_by_country_diet_item.csv')
           [['country_code', 'country', 'diet', 'fbs_item_code', 'fbs_item',
             'output_group', 'type', 'kg/cap/yr', 'loss_adj_kcal/cap/day', '%_imported']])
     tm = pd.read_csv(paths.interim/'fao_trade_matrix_avg_primary.csv').pipe(snake_case_cols)
@@ -83,9 +92,7 @@ def diet_model_by_coo():
 
     # Diagnostic: Check for null %_imported values
     if dm['%_imported'].isna().any():
-        winsound.Beep(400, 400)
-        print("ERROR: NULL VALUE FOUND IN '%_imported':")
-        print(dm[dm['%_imported'].isna()])
+        send_error('nan_values', "ERROR: NULL VALUE FOUND IN '%_imported':\n", dm[dm['%_imported'].isna()])
 
     # Diagnostic: Sum total kg before allocating by coo; referenced below
     total_kg = dm['kg/cap/yr'].sum()
@@ -106,47 +113,62 @@ def diet_model_by_coo():
     dm = dm.fillna(0)
     dm = dm[dm['kg/cap/yr'] > 0]
 
-    print('Modeling diets by country of origin\n')
+    # Store country, item, diet, etc. as shared categoricals; the diet model by coo has millions of rows
+    dm = encode_dimensions(dm)
 
-    # Compute % domestic, % from coo, and % from world avg. (i.e., imported items w/no coo data in the trade matrix);
-    # TODO: where is the "unnamed" column coming from? is that the index? if so, how to remove?
-    dm_domestic = domestic(dm)
-    dm_imports = imports(dm, tm)
-    dm_world = world(dm)
-    dm = pd.concat([dm_domestic, dm_imports, dm_world], sort=False)
+    print('Modeling diets by country of origin\n')
 
     # Define columns
     index_cols = ['country_code','country','diet','fbs_item_code','fbs_item','output_group','type',
                   'coo_code','coo','%_imported']
-
-    # Sum %_from_coo where the same item has multiple coo, i.e., when a country imports to itself
-    dm = dm.groupby(index_cols + ['kg/cap/yr', 'loss_adj_kcal/cap/day'])['%_from_coo'].sum().reset_index()
+    dm_cols = [c for c in index_cols if c not in ['coo_code', 'coo']] + ['kg/cap/yr', 'loss_adj_kcal/cap/day']
+
+    # Compute % domestic, % from coo, and % from world avg. (i.e., imported items w/no coo data in the trade matrix)
+    # as a sparse matrix w/one row per country, item, and % imported, and one column per country of origin
+    keys = dm[SHARE_COLS].drop_duplicates().reset_index(drop=True)
+    coos, shares = share_matrix(keys, tm)
+
+    # Look up the row of shares for each item in each country-diet pair; sorting diets first (w/coo columns already
+    # sorted) keeps rows in the same order as grouping by index_cols
+    dm = dm.sort_values(index_cols[:7], kind='stable').reset_index(drop=True)
+    rows = pd.MultiIndex.from_frame(keys).get_indexer(pd.MultiIndex.from_frame(dm[SHARE_COLS]))
+    dm_shares = shares[rows]
+
+    # Expand the diet model to one row per country-diet pair, item, and coo (the non-zero entries of dm_shares)
+    n_coo = np.diff(dm_shares.indptr)
+    dm = dm[dm_cols].iloc[np.repeat(np.arange(len(dm)), n_coo)].reset_index(drop=True)
+    dm.insert(7, 'coo_code', coos['coo_code'].to_numpy()[dm_shares.indices])
+    dm.insert(8, 'coo', encode_dimensions(coos, ['coo'])['coo'].array.take(dm_shares.indices))
+    dm['%_from_coo'] = dm_shares.data
 
     # Multiply % by coo by quantities of each item in each country-diet pair
     dm['kg/cap/yr_by_coo'] = dm['kg/cap/yr'] * dm['%_from_coo']
     dm['loss_adj_kcal/cap/day_by_coo'] = dm['loss_adj_kcal/cap/day'] * dm['%_from_coo']
 
     # Add flag for domestic v. imported - useful for things like pie charts
-    dm['origin'] = np.where(dm['coo_code'] == dm['country_code'],'domestic','imported')
+    dm['origin'] = pd.Categorical(np.where(dm['coo_code'] == dm['country_code'],'domestic','imported'),
+                                  dtype=dimension_dtype('origin', ['domestic', 'imported']))
 
     # Re-order and filter columns
     dm = dm[index_cols + ['kg/cap/yr', 'loss_adj_kcal/cap/day', 'origin', '%_from_coo',
                           'kg/cap/yr_by_coo', 'loss_adj_kcal/cap/day_by_coo']]
 
     # Add income class
+    income_class = encode_dimensions(income_class)
     dm = s_merge(dm, income_class, on=['country_code', 'country'], how='left', validate='m:1')
     income_class = income_class.rename(columns={'country_code': 'coo_code', 'country': 'coo', 'income_class': 'coo_income_class'})
+    income_class = encode_dimensions(income_class)
     dm = s_merge(dm, income_class, on=['coo_code', 'coo'], how='left', validate='m:1')
 
     # Output diet model
     # To keep the file size manageable we don't include all of the columns here
-    dm[['country_code', 'country', 'diet' ,'fbs_item_code', 'fbs_item', 'output_group', 'type', 'coo_code', 'coo', 'origin', 'kg/cap/yr_by_coo']] \
-        .to_csv(paths.output/'diet_model_by_country_diet_item_coo.csv', index=False)
+    dm_out = dm[['country_code', 'country', 'diet' ,'fbs_item_code', 'fbs_item', 'output_group', 'type', 'coo_code', 'coo', 'origin', 'kg/cap/yr_by_coo']]
+    save_df(dm_out, paths.output/'diet_model_by_country_diet_item_coo.csv')
 
     # Sum by output group and domestic vs. imports, baseline diet only
     # This makes for a much more manageable file size
     dm_by_group_origin = dm[dm['diet'] == 'baseline']
-    dm_by_group_origin = dm_by_group_origin.groupby(['country_code', 'country', 'diet', 'type', 'output_group', 'origin'])[[
+    dm_by_group_origin = dm_by_group_origin.groupby(['country_code', 'country', 'diet', 'type', 'output_group', 'origin'], observed=True)[[
         'kg/cap/yr_by_coo', 'loss_adj_kcal/cap/day_by_coo']].sum().reset_index()
     dm_by_group_origin.to_csv(paths.output/'diet_model_by_country_diet_output_group_origin_baseline_only.csv', index=False)
 
@@ -162,9 +184,8 @@ def diet_model_by_coo():
     # Note: be sure to sum kg/cap/yr_by_coo, and not kg/cap/yr; the latter is repeated for each coo!
     # Check if summed %_from_coo = 100% for all items; control for rounding errors
     dm_by_item = dm.groupby(['country_code','country','diet','fbs_item_code','fbs_item',
-                             'output_group','type'])[['kg/cap/yr_by_coo','%_from_coo']].sum().reset_index()
+                             'output_group','type'], observed=True)[['kg/cap/yr_by_coo','%_from_coo']].sum().reset_index()
     # TODO: refactor this if-statement and throw an exception
     if (round(dm_by_item['%_from_coo'],9)==1).all() == False:
-        print('ERROR: % from country of origin != 1')
-        winsound.Beep(400,400)
+        send_error('coo_shares', 'ERROR: % from country of origin != 1')
     dm_by_item.to_csv(paths.diagnostic/'diet_model_by_country_diet_item_coo_item_total.csv', index=False)
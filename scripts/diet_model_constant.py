@@ -3,6 +3,8 @@ import numpy as np
 import paths
 from datetime import datetime
 from utilities import *
+from utilities_io import read_df, save_df
+from utilities_params import load_run_params, load_params_sheet
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -23,11 +25,11 @@ def diet_model_constant():
     # Hold consumption constant; differences in results by country are explained by COO
 
     # Input ************************************************************************************************************
-    dm = pd.read_csv(paths.interim/'diet_model_baseline.csv')
+    dm = read_df(paths.interim/'diet_model_baseline.csv')
     countries = pd.read_csv(paths.interim/'fao_countries.csv') \
         [['country_code', 'income_class', 'oecd']]
-    countries_to_run = pd.read_excel(paths.params, sheet_name='countries_incl', skiprows=1)
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1).set_index('parameter')
+    countries_to_run = load_params_sheet('countries_incl')
+    run_params = load_run_params()
 
     # ******************************************************************************************************************
 
@@ -39,9 +41,9 @@ def diet_model_constant():
     countries_to_run = countries_to_run[countries_to_run['run'] == 'yes']['country_code'].tolist()
     if countries_to_run:
         print('NOT ENOUGH COUNTRIES IN PARAMETERS TO COMPUTE DIET MODEL CONSTANT; using last saved version')
-        dm = pd.read_csv(paths.interim / 'diet_model_constant.csv')
+        dm = read_df(paths.interim / 'diet_model_constant.csv')
         dm = dm[dm['country_code'].isin(countries_to_run)]
-        dm.to_csv(paths.interim / 'diet_model_constant.csv', index=False)
+        save_df(dm, paths.interim / 'diet_model_constant.csv', keep=True)
         return
 
     baseline_cols = dm.columns[dm.columns.str.startswith('baseline')].tolist()
@@ -77,10 +79,9 @@ def diet_model_constant():
     # So the diets of a few LMICs are not exactly the same as the high-income avg, but it's close enough and much simpler to code this way.
     dm[results_cols] = dm[constant_cols]
     conds = dm['country_code'].isin(country_code_list)
-    for c in range(0, len(results_cols)):
-        dm.loc[conds, results_cols[c]] = dm.loc[conds, baseline_cols[c]]
+    dm.loc[conds, results_cols] = dm.loc[conds, baseline_cols].to_numpy()
 
     dm['diet'] = constant_diet
     dm['scaling_method'] = 'constant'
 
-    dm.to_csv(paths.interim/'diet_model_constant.csv', index=False)
+    save_df(dm, paths.interim/'diet_model_constant.csv', keep=True)
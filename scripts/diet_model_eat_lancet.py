@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import paths
 from utilities import *
+from utilities_io import read_df, save_df
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -13,7 +14,7 @@ def diet_model_eat_lancet():
 
     # TODO: put extraction rates in baseline diet model?
     dm_lancet = pd.read_csv(paths.input/'eat_lancet/eat_lancet_diet.csv')
-    dm_baseline = pd.read_csv(paths.interim/'diet_model_baseline.csv')
+    dm_baseline = read_df(paths.interim/'diet_model_baseline.csv')
 
     extr_rates = (pd.read_csv(paths.interim / 'fao_extraction_rates.csv')
         [['country_code', 'fao_item_code', 'extr_rate_mt/mt']])
@@ -57,5 +58,5 @@ def diet_model_eat_lancet():
 
     dm['scaling_method'] = 'eat_lancet'
 
-    dm.to_csv(paths.interim/'diet_model_eat_lancet.csv', index=False)
+    save_df(dm, paths.interim/'diet_model_eat_lancet.csv', keep=True)
 
@@ -4,6 +4,7 @@ import numpy as np
 import paths
 from datetime import datetime
 from utilities import *
+from utilities_params import load_run_params
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -13,7 +14,7 @@ def fao_countries():
 
     # Input ************************************************************************************************************
 
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1).set_index('parameter')
+    run_params = load_run_params()
 
     countries = pd.read_excel(paths.input / 'fao/fao_countries.xlsx', sheet_name='fao_countries')
     countries_renamed = pd.read_csv(paths.input / 'fao/fao_countries_renamed_for_2022.csv')
@@ -24,7 +25,7 @@ def fao_countries():
 
     # "many:1" merge since countries has multiple rows w/blank iso codes
     countries = s_merge(countries, wb, on='country_iso_code', how='left', validate='m:1',
-                        left_name='countries', right_name='world bank income classes', beep=False)
+                        left_name='countries', right_name='world bank income classes')
 
     countries['income_class'] = countries['income_class'].fillna('Unclassified')
 
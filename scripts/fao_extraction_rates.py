@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 import paths
 from datetime import datetime
-from utilities import wavg
+from utilities import grouped_wavg
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -37,8 +37,8 @@ def fao_extraction_rates():
     # See also the wavg function in utilities.py for details on how missing production data are handled.
     er_wavg = er.merge(item_prod, on=['country_code', 'fao_item_code'], how='left')
     er_wavg.to_csv(paths.diagnostic / 'fao_extraction_rates_before_avg.csv', index=False)
-    er_wavg = er_wavg.groupby(['fao_item_code', 'fao_item'])\
-        .apply(wavg, 'extr_rate_mt/mt', 'mt_production', alerts=False)\
+    er_wavg = grouped_wavg(er_wavg, ['fao_item_code', 'fao_item'], 'extr_rate_mt/mt', 'mt_production', alerts=False,
+                           zero_weight_mean=False)\
         .rename('wavg').reset_index()
 
     # If a weighted avg is available, use it, otherwise use unweighted avg
@@ -4,62 +4,107 @@ import numpy as np
 import paths
 from datetime import datetime
 from utilities import *
+from utilities_params import load_item_params, get_param_years
+from utilities_io import read_faostat
+from utilities_validation import duplicate_rows
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
 
 startTime = datetime.now()
 
+# FBS elements used by the model; other elements are dropped while reading.
+# Country-items w/data for other elements only (e.g., stock variation, seed) are still kept as rows of zeros,
+# see fbs_country_items
+FBS_ELEMENTS = ['Total Population - Both sexes', 'Production', 'Import Quantity', 'Export Quantity',
+                'Domestic supply quantity', 'Feed', 'Losses', 'Food supply quantity (kg/capita/yr)',
+                'Food supply (kcal/capita/day)', 'Protein supply quantity (g/capita/day)']
+
+
+def fbs_file(year):
+    # To get results to match GEC submission 4, needed to use an excel file for 2013 data since
+    # a few manual edits required more decimal points than could be stored in a .csv
+    file = paths.input / 'fao/food_balance_sheets' / (str(year) + '.csv')
+    return file if file.exists() else file.with_suffix('.xlsx')
+
+
+def fbs_country_items(years):
+    # Country-items in the FBS files for the given years, w/data for any element or year
+    cols = ['area_code', 'area', 'item_code', 'item']
+    return pd.concat([read_faostat(fbs_file(year), columns=cols).drop_duplicates() for year in years]).drop_duplicates()
+
+
+def rename_cols(fbs):
+    return fbs.rename(columns={'item': 'fbs_item',
+                                'item_code': 'fbs_item_code',
+                                'area': 'country',
+                                'area_code': 'country_code'})
+
+
+def recode_items(fbs, fbs_recoded):
+    # Recode 2022 FBS items so we don't need to recode the entire model
+    fbs = fbs.merge(fbs_recoded, on=['fbs_item_code', 'fbs_item'], how='left', validate='m:1')
+    fbs['fbs_item_code'] = choose_first_notna(fbs[['fbs_item_code_recoded', 'fbs_item_code']], default_value='ERROR')
+    fbs['fbs_item_code'] = fbs['fbs_item_code'].astype(str).replace('\.0', '', regex=True).astype(int) # This seems unnecessarily complicated but nothing else worked
+    fbs['fbs_item'] = choose_first_notna(fbs[['fbs_item_recoded', 'fbs_item']], default_value='ERROR').astype(str)
+    fbs.drop(columns=['fbs_item_code_recoded', 'fbs_item_recoded'], inplace=True)
+    return fbs
+
+
+def year_mean(by_year):
+    # Mean of each column of a (years x rows) array, skipping NAN values
+    total = np.zeros(by_year.shape[1])
+    for values in by_year:
+        total += np.nan_to_num(values)
+    count = (~np.isnan(by_year)).sum(axis=0)
+    return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
 # Main method
 def fao_fbs():
 
     # Input ************************************************************************************************************
 
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1).set_index('parameter')
+    fao_years = get_param_years('fao_data_years')
 
-    fao_years = run_params.loc['fao_data_years', 'value']
-    fao_years = string_to_int_list(fao_years)
+    fbs_recoded = pd.read_csv(paths.input / 'fao/fbs_recoded_items.csv')
 
-    fbs_recoded = pd.read_csv('../data/input/fao/fbs_recoded_items.csv')
-
-    fbs = pd.DataFrame()
-    for year in fao_years:
-        # To get results to match GEC submission 4, needed to use an excel file for 2013 data since
-        # a few manual edits required more decimal points than could be stored in a .csv
-        try:
-            fbs_year = eval('pd.read_csv(paths.input/"fao/food_balance_sheets/' + str(year) + '.csv")')
-        except:
-            fbs_year = eval('pd.read_excel(paths.input/"fao/food_balance_sheets/' + str(year) + '.xlsx")')
-        fbs = pd.concat([fbs, fbs_year], sort=False)
-    fbs = snake_case_cols(fbs)
+    fbs = pd.concat([read_faostat(fbs_file(year), elements=FBS_ELEMENTS, years=fao_years) for year in fao_years],
+                    sort=False)
+    country_items = fbs_country_items(fao_years)
 
     # Only used when checking if FBS include any items or countries not included in these files
-    item_params = pd.read_excel(paths.input/'item_parameters.xlsx')
+    item_params = load_item_params()
     countries = pd.read_csv(paths.interim/'fao_countries.csv')
 
     # Rename cols ******************************************************************************************************
 
-    fbs = fbs.rename(columns={'item': 'fbs_item',
-                                'item_code': 'fbs_item_code',
-                                'area': 'country',
-                                'area_code': 'country_code'})
+    fbs = rename_cols(fbs)
     fbs = fbs[['country_code', 'country', 'element', 'fbs_item_code', 'fbs_item', 'year', 'value']]
+    country_items = rename_cols(country_items)
 
     # Recode 2022 FBS items so we don't need to recode the entire model ************************************************
 
-    fbs = fbs.merge(fbs_recoded, on=['fbs_item_code', 'fbs_item'], how='left', validate='m:1')
-    fbs['fbs_item_code'] = choose_first_notna(fbs[['fbs_item_code_recoded', 'fbs_item_code']], default_value='ERROR')
-    fbs['fbs_item_code'] = fbs['fbs_item_code'].astype(str).replace('\.0', '', regex=True).astype(int) # This seems unnecessarily complicated but nothing else worked
-    fbs['fbs_item'] = choose_first_notna(fbs[['fbs_item_recoded', 'fbs_item']], default_value='ERROR').astype(str)
-    fbs.drop(columns=['fbs_item_code_recoded', 'fbs_item_recoded'], inplace=True)
+    fbs = recode_items(fbs, fbs_recoded)
+    country_items = recode_items(country_items, fbs_recoded).drop_duplicates()
 
     # Compute avg values over years indicated in parameters ************************************************************
 
-    fbs = s_pivot(fbs, idx=['country_code', 'country', 'element', 'fbs_item_code', 'fbs_item'],
-               cols=['year'], vals=['value'])
-
-    fbs['value'] = fbs[fao_years].mean(axis='columns')
-    fbs.drop(columns = fao_years, inplace=True)
+    # Each country-element-item should have at most one value per year
+    index_cols = ['country_code', 'country', 'element', 'fbs_item_code', 'fbs_item']
+    # Always stop on duplicates, since the assignment below would keep only one of them
+    dupes = duplicate_rows(fbs, index_cols + ['year'])
+    if len(dupes) > 0:
+        send_error('duplicate_indices', 'ERROR: DUPLICATE INDICES FOUND: fbs', dupes)
+        raise ValueError('Duplicate FBS values for a country, element, item, and year: ' + str(len(dupes)) + ' rows')
+
+    # Average over years w/one groupby, adding years one at a time (rather than using a compensated sum)
+    # so results are identical to a mean across year columns
+    groups = fbs.groupby(index_cols, dropna=False)
+    by_year = np.full((len(fao_years), groups.ngroups), np.nan)
+    by_year[fbs['year'].map({year: i for i, year in enumerate(fao_years)}), groups.ngroup()] = fbs['value']
+    fbs = groups.size().index.to_frame(index=False)
+    fbs['value'] = year_mean(by_year)
 
     # Gather population ************************************************************************************************
 
@@ -72,13 +117,22 @@ def fao_fbs():
     # Output
     pop.to_csv(paths.interim/'fao_population.csv', index=False)
 
+    # Pivot on element, convert to snake case ***************************************************************************
+
+    fbs = fbs[fbs['fbs_item'] != 'Population']
+    fbs = s_pivot(fbs, idx=['country_code', 'country', 'fbs_item_code', 'fbs_item'],
+                     cols=['element'], vals=['value']).pipe(snake_case_cols)
+
+    # Add country-items w/o data for the elements read (all NAN, i.e., zero once NANs are filled below)
+    idx = ['country_code', 'country', 'fbs_item_code', 'fbs_item']
+    country_items = country_items.loc[country_items['fbs_item'] != 'Population', idx]
+    fbs = country_items.merge(fbs, on=idx, how='outer').sort_values(idx).reset_index(drop=True)
+
     # Compute nutrient composition *************************************************************************************
 
-    nc = fbs[['country_code', 'country', 'element', 'fbs_item_code', 'fbs_item', 'value']]
-    nc = nc[nc['element'].isin(['Food supply quantity (kg/capita/yr)', 'Food supply (kcal/capita/day)',
-                                'Protein supply quantity (g/capita/day)'])]
-    nc = s_pivot(nc, idx=['country_code', 'country', 'fbs_item_code', 'fbs_item'],
-               cols=['element'], vals=['value']).pipe(snake_case_cols)
+    # Only country-items w/data for at least one of these elements
+    nc_cols = ['food_supply_quantity_kg/capita/yr', 'food_supply_kcal/capita/day', 'protein_supply_quantity_g/capita/day']
+    nc = fbs[['country_code', 'country', 'fbs_item_code', 'fbs_item'] + nc_cols].dropna(subset=nc_cols, how='all')
 
     # Control for population, convert to standard (daily) units
     # Inner merge drops countries with no population data (e.g., Lao People's Republic, Uzbekistan in 2017 data)
@@ -97,10 +151,6 @@ def fao_fbs():
 
     # Adjust food supplies to ignore losses ****************************************************************************
 
-    # Pivot on element, convert to snake case
-    fbs = fbs[fbs['fbs_item'] != 'Population']
-    fbs = s_pivot(fbs, idx=['country_code', 'country', 'fbs_item_code', 'fbs_item'],
-                     cols=['element'], vals=['value']).pipe(snake_case_cols)
     fbs = fbs.rename(columns={'domestic_supply_quantity': 'domestic_supply_1000_mt',
                               'production': 'production_1000_mt',
                               'import_quantity': 'imports_1000_mt',
@@ -150,7 +200,7 @@ def fao_fbs():
     print('Check for missing FBS countries in countries file; China is excluded to avoid double-counting w/sub-regions:')
     fbs_countries = fbs[['country_code', 'country']].drop_duplicates()
     s_merge(fbs_countries, countries, on=['country_code', 'country'], how='left',
-            validate='1:1', left_name='fbs_countries', right_name='countries', beep=False)
+            validate='1:1', left_name='fbs_countries', right_name='countries')
 
     # Drop countries with no match in countries file
     fbs = s_merge(fbs, countries, on=['country_code', 'country'], how='inner')
@@ -1,6 +1,8 @@
 import pandas as pd
 import paths
 from utilities import *
+from utilities_params import get_param_years
+from utilities_io import read_faostat
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -9,29 +11,18 @@ pd.options.mode.chained_assignment = None
 def fao_item_production():
 
     # Input ************************************************************************************************************
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1).set_index('parameter')
-
-    # Terrestrial inputs
-    crops = eval('pd.read_csv(paths.input/"fao//item_production/crops_primary.csv").pipe(snake_case_cols)')
-    crops_proc = eval('pd.read_csv(paths.input/"fao/item_production/crops_processed.csv").pipe(snake_case_cols)')
-    livestock = eval('pd.read_csv(paths.input/"fao/item_production/livestock_primary.csv").pipe(snake_case_cols)')
-    livestock_proc = eval('pd.read_csv(paths.input/"fao/item_production/livestock_processed.csv").pipe(snake_case_cols)')
-
-    # Filter ***********************************************************************************************************
 
     # Convert years parameter to list of integers
-    fao_years = run_params.loc['fao_data_years', 'value']
-    fao_years = string_to_int_list(fao_years)
+    fao_years = get_param_years('fao_data_years')
 
-    proc_years = run_params.loc['fao_processed_item_production_years', 'value']
-    proc_years = string_to_int_list(proc_years)
+    proc_years = get_param_years('fao_processed_item_production_years')
 
-    # Filter by year
+    # Terrestrial inputs, filtered by year and unit while reading
     # Production data for processed items may cover a different set of years, so for these we use a different parameter
-    crops = crops[crops['year'].isin(fao_years)]
-    livestock = livestock[livestock['year'].isin(fao_years)]
-    crops_proc = crops_proc[crops_proc['year'].isin(proc_years)]
-    livestock_proc = livestock_proc[livestock_proc['year'].isin(proc_years)]
+    crops = read_faostat(paths.input/'fao/item_production/crops_primary.csv', years=fao_years, units=['tonnes'])
+    crops_proc = read_faostat(paths.input/'fao/item_production/crops_processed.csv', years=proc_years, units=['tonnes'])
+    livestock = read_faostat(paths.input/'fao/item_production/livestock_primary.csv', years=fao_years, units=['tonnes'])
+    livestock_proc = read_faostat(paths.input/'fao/item_production/livestock_processed.csv', years=proc_years, units=['tonnes'])
 
     # Combine items
     fao_prod = pd.concat([crops, crops_proc, livestock, livestock_proc])
@@ -0,0 +1,141 @@
+import json
+import pandas as pd
+import paths
+from utilities import *
+from utilities_io import PARQUET, read_faostat
+
+pd.options.display.max_columns = 999
+pd.options.mode.chained_assignment = None
+
+# FAOSTAT trade matrix downloads are large and slow to parse, so they're converted once into a store of
+# smaller files, one per year, keeping only the columns the model uses. Within each year's file, rows are sorted by
+# reporter and written in row groups of at most ROW_GROUP_SIZE rows, so each row group holds one or a few reporters.
+# trade_matrix_fao then reads only the years in the fao_data_years run parameter, and parquet files are read
+# w/filters on element, unit, and (optionally) reporter, so row groups w/other rows aren't read at all.
+# Years are (re)built automatically when missing or when their download changes;
+# run this script directly to rebuild every year, e.g., after downloading new trade data.
+
+# Raw downloads are in data/input/RAW_DIR; the store is in data/interim/STORE_DIR
+RAW_DIR = 'fao/trade_matrices'
+STORE_DIR = 'fao_trade_store'
+
+# Raw files: either one file of imports per year, or a full FAOSTAT download with all years and elements
+YEAR_FILE = 'fao_imports_{year}.csv'
+FULL_DOWNLOAD = 'fao_trade_matrix_all_data_normalized.csv'
+
+STORE_COLS = ['reporter_country_code', 'reporter_countries', 'partner_country_code', 'partner_countries',
+              'item_code', 'item', 'element', 'unit', 'year', 'value']
+
+# Rows are sorted by these columns within each year, so parquet row groups can be skipped when filtering on them;
+# a reporter's rows for one element and unit are contiguous
+SORT_COLS = ['reporter_country_code', 'element', 'unit', 'partner_country_code', 'item_code']
+
+# Maximum rows per parquet row group; the default (~1M rows) would put most of a year in one row group,
+# so that no rows could be skipped when filtering
+ROW_GROUP_SIZE = 50000
+
+
+def raw_dir():
+    return paths.input / RAW_DIR
+
+
+def store_dir():
+    return paths.interim / STORE_DIR
+
+
+def raw_file(year):
+    # Raw download holding a given year, or None if there isn't one; per-year files take precedence
+    for file in [raw_dir() / YEAR_FILE.format(year=year), raw_dir() / FULL_DOWNLOAD]:
+        if file.exists():
+            return file
+    return None
+
+
+def partition_file(year):
+    return store_dir() / ('year=' + str(year)) / ('part.parquet' if PARQUET else 'part.csv')
+
+
+def read_sources():
+    # Raw file and its modification time/size for each year in the store: {year: [file name, mtime, size]}
+    file = store_dir() / 'sources.json'
+    return json.loads(file.read_text()) if file.exists() else {}
+
+
+def stamp(file):
+    # Also includes the store layout, so years are rebuilt if SORT_COLS or ROW_GROUP_SIZE change
+    stat = file.stat()
+    return [file.name, stat.st_mtime_ns, stat.st_size, SORT_COLS, ROW_GROUP_SIZE]
+
+
+def ingest(file):
+    # Convert a raw trade matrix download into one store file per year it covers;
+    # years that have their own file of imports are skipped when ingesting the full download
+
+    print('Adding', file.name, 'to the FAO trade matrix store')
+    encoding = 'latin-1' if file.name == FULL_DOWNLOAD else None
+    tm = read_faostat(file, columns=STORE_COLS, encoding=encoding)
+
+    sources = read_sources()
+    for year, tm_year in tm.groupby('year'):
+        if raw_file(year) != file:
+            continue
+        path = partition_file(year)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tm_year = tm_year.sort_values(SORT_COLS)
+        if PARQUET:
+            tm_year.to_parquet(path, index=False, row_group_size=ROW_GROUP_SIZE)
+        else:
+            tm_year.to_csv(path, index=False)
+        sources[str(year)] = stamp(file)
+    (store_dir() / 'sources.json').write_text(json.dumps(sources, indent=1))
+
+
+def update_store(years):
+    # Build any years that are missing from the store, or whose raw download has changed since they were built
+
+    sources = read_sources()
+    stale = set()
+    for year in years:
+        file = raw_file(year)
+        if file is None:
+            if not partition_file(year).exists():
+                raise FileNotFoundError('No FAO trade matrix data for ' + str(year) + ' in ' + str(raw_dir()))
+            continue  # The raw download may be deleted once it's in the store
+        if not partition_file(year).exists() or sources.get(str(year)) != stamp(file):
+            stale.add(file)
+
+    for file in stale:
+        ingest(file)
+
+
+def load_trade_matrix(years, element='Import Quantity', unit='tonnes', reporters=None):
+    # FAO trade matrix rows for the given years, element, and unit, w/the raw download's (snake case) column names.
+    # Reporters: list of reporter country codes to read (None = all)
+
+    update_store(years)
+
+    # Only the requested years' files are read; in parquet files, row groups w/other elements, units,
+    # or reporters are skipped
+    if PARQUET:
+        filters = [('element', '==', element), ('unit', '==', unit)]
+        if reporters is not None:
+            filters.append(('reporter_country_code', 'in', list(reporters)))
+        tm = pd.concat([pd.read_parquet(partition_file(year), filters=filters) for year in years], ignore_index=True)
+    else:
+        tm = pd.concat([pd.read_csv(partition_file(year)) for year in years], ignore_index=True)
+        tm = tm[(tm['element'] == element) & (tm['unit'] == unit)]
+        if reporters is not None:
+            tm = tm[tm['reporter_country_code'].isin(reporters)]
+
+    return tm[STORE_COLS].reset_index(drop=True)
+
+
+# Main method
+def fao_trade_store():
+
+    # Rebuild the store from all raw downloads
+    files = sorted(raw_dir().glob(YEAR_FILE.format(year='*')))
+    if (raw_dir() / FULL_DOWNLOAD).exists():
+        files.append(raw_dir() / FULL_DOWNLOAD)
+    for file in files:
+        ingest(file)
@@ -2,10 +2,10 @@ import numpy as np
 import pandas as pd
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_figs import *
+from utilities_io import read_df
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -17,7 +17,7 @@ pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
 
 MIN_POPULATION = 5000000
-KWARGS = {'show_figs': False, 'file_path':'../figures/'}
+KWARGS = {'show_figs': False, 'file_path': paths.figures}
 MI_COLORS = ['#994f00', '#cc7700', '#ffa500', '#ffd27f']
 WIDTH = 4.1
 PCT_CUTOFF = 0.885
@@ -74,9 +74,6 @@ def prep_inputs(dm, fp, supply, country_names, who_groups_mi):
     # all abx total
     fp = s_filter(fp, col='footprint_type', list=['mg_abx_total'])
 
-    fp.to_csv('../figures/baseline_per_cap/baseline_per_cap.csv', index=False)
-    fp_mi.to_csv('../figures/baseline_per_cap/baseline_per_cap_mi.csv', index=False)
-
     return (dm, supply, fp, fp_mi)
 
 
@@ -102,9 +99,8 @@ def pivot_filter_sort(df, cols, vals, idx_list, idx='', idx_pivot='', idx_sort_f
 
         # Alert on mismatch between new and old columns - this could cause information to be lost
         if set(old_cols) != set(new_cols):
-            print('ALERT: Missing/extra column found when sorting. Original columns:', old_cols)
-            print('New columns:',new_cols)
-            winsound.Beep(400,400)
+            send_alert('sort', 'ALERT: Missing/extra column found when sorting. Original columns:', old_cols,
+                       '\nNew columns:', new_cols)
 
             # Drop new cols that aren't in old cols
             new_cols = [c for c in new_cols if c in old_cols]
@@ -128,8 +124,8 @@ def plot_baseline_fp_per_cap(fp, fp_mi, dm):
     fp = s_filter(fp, col='country', list=country_list)
     fp_mi = s_filter(fp_mi, col='country', list=country_list)
 
-    fp.to_csv('../figures/baseline_per_cap/baseline_per_cap_filtered.csv', index=False)
-    fp_mi.to_csv('../figures/baseline_per_cap/baseline_per_cap_mi_filtered.csv', index=False)
+    fp.to_csv(paths.figures / 'baseline_per_cap/baseline_per_cap_filtered.csv', index=False)
+    fp_mi.to_csv(paths.figures / 'baseline_per_cap/baseline_per_cap_mi_filtered.csv', index=False)
 
     # by MI
     pivot_filter_sort(fp_mi, idx='country', cols='mi', vals='diet_footprint',
@@ -180,8 +176,8 @@ def plot_baseline_fp_per_cap_by_whole_country(fp, fp_mi, dm):
     fp = s_filter(fp, col='country', list=country_list)
     fp_mi = s_filter(fp_mi, col='country', list=country_list)
 
-    fp.to_csv('../figures/baseline_per_cap/baseline_per_cap_filtered_wc.csv', index=False)
-    fp_mi.to_csv('../figures/baseline_per_cap/baseline_per_cap_mi_filtered_wc.csv', index=False)
+    fp.to_csv(paths.figures / 'baseline_per_cap/baseline_per_cap_filtered_wc.csv', index=False)
+    fp_mi.to_csv(paths.figures / 'baseline_per_cap/baseline_per_cap_mi_filtered_wc.csv', index=False)
 
     # by MI
     pivot_filter_sort(fp_mi, idx='country', cols='mi', vals='diet_footprint',
@@ -267,19 +263,28 @@ def plot_supply_demand(supply):
 
 
 
-# Main method
-def figs_columns():
-
-    # Input ************************************************************************************************************
+def read_prep_inputs():
+    # Read and prep inputs; the result is cached (see cache_prepared in utilities_figs)
 
     dm = pd.read_csv(paths.output / 'diet_model_by_country_diet_output_group.csv')
-    fp = pd.read_csv(paths.output / 'by_coo_only/diet_footprints_by_origin_diet_item.csv')
+    fp = read_df(paths.output / 'by_coo_only/diet_footprints_by_origin_diet_item.csv')
     #ifp = pd.read_csv(paths.interim / 'item_footprints/item_footprints_abx_grouped.csv') unused
     supply = pd.read_csv(paths.output / 'by_coo_only/supply_side_footprints_by_country_item.csv')
-    fpc = pd.read_csv(paths.output / 'by_coo_only/diet_footprints_by_coo_baseline_only.csv')
-
     country_names = pd.read_csv(paths.input / 'figures/country_short_names.csv')
-    population = pd.read_csv(paths.interim / 'fao_population.csv')[['country_code', 'population']]
+    who_groups_mi = pd.read_excel(paths.input / 'antibiotic_use/abu_classifications.xlsx', sheet_name='medical_importance', skiprows=3)[
+        ['footprint_type', 'mi']]
+
+    # for LMIC sub-analysis
+    #fp = s_filter(fp, col='income_class', list=['Low income', 'Unclassified', 'Lower middle income'])
+    #supply = s_filter(supply, col='income_class', list=['Low income', 'Unclassified', 'Lower middle income'])
+
+    return prep_inputs(dm, fp, supply, country_names, who_groups_mi)
+
+
+# Main method
+def figs_columns():
+
+    # Input ************************************************************************************************************
 
     global food_groups
     global food_order_abx
@@ -287,9 +292,6 @@ def figs_columns():
     global food_order_all
     global food_colors_all
 
-    who_groups_mi = pd.read_excel(paths.input / 'antibiotic_use/abu_classifications.xlsx', sheet_name='medical_importance', skiprows=3)[
-        ['footprint_type', 'mi']]
-
     food_groups = pd.read_csv(paths.input / 'figures/food_groups.csv')
     food_order_abx = pd.read_csv(paths.input / 'figures/food_groups_abx_order_colors.csv')['food_group'].tolist()
     food_colors_abx = pd.read_csv(paths.input / 'figures/food_groups_abx_order_colors.csv')['color'].tolist()
@@ -302,11 +304,11 @@ def figs_columns():
             'size': 6.1}
     matplotlib.rc('font', **font)
 
-    # for LMIC sub-analysis
-    #fp = s_filter(fp, col='income_class', list=['Low income', 'Unclassified', 'Lower middle income'])
-    #supply = s_filter(supply, col='income_class', list=['Low income', 'Unclassified', 'Lower middle income'])
+    (dm, supply, fp, fp_mi) = cache_prepared(read_prep_inputs)
 
-    (dm, supply, fp, fp_mi) = prep_inputs(dm, fp, supply, country_names, who_groups_mi)
+    # Written here rather than in prep_inputs, so they're written even when prepared data are reused from the cache
+    fp.to_csv(paths.figures / 'baseline_per_cap/baseline_per_cap.csv', index=False)
+    fp_mi.to_csv(paths.figures / 'baseline_per_cap/baseline_per_cap_mi.csv', index=False)
 
     plot_baseline_fp_per_cap(fp, fp_mi, dm)
     plot_baseline_fp_per_cap_by_whole_country(fp, fp_mi, dm)
@@ -3,7 +3,6 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities_figs import *
 from utilities import *
@@ -20,7 +19,7 @@ pd.options.mode.chained_assignment = None
 
 # If SHOW_FIGS == False, figs fig data are saved
 SHOW_FIGS = False
-FILE_PATH = '../figures/diet_shifts_income/'
+FILE_PATH = paths.figures / 'diet_shifts_income'
 FIG_FORMAT = ['png', 'pdf']
 DIETS = ['Baseline', 'High income', 'EAT-Lancet']
 
@@ -233,10 +232,8 @@ def plot_diff_all_scenarios(diff, diets, label_dots=[],  file_suffix=''):
     show_save_plot(show=SHOW_FIGS, path=FILE_PATH, filename='abx_ghg_scatter_all_scenarios_abs_diff',
                    format=FIG_FORMAT)
 
-# Main method
-def figs_diet_shifts_income():
-
-    # Input ************************************************************************************************************
+def read_prep_inputs():
+    # Read and prep inputs; the result is cached (see cache_prepared in utilities_figs)
 
     # Diet footprints
     fp_cols = ['country_code', 'country', 'income_class', 'diet', 'attribute', 'value', 'value_baseline']
@@ -248,6 +245,20 @@ def figs_diet_shifts_income():
 
     income_reclassification = pd.read_csv(paths.input / 'figures/income_reclassification.csv')
 
+    # TODO: NOTE CHANGE IN UNITS FROM MG TO G ANTIBIOTICS, KG TO MT CO2E
+    (abx, ghg) = prep_abx_ghg(fp, diet_names, income_reclassification, population)
+
+    # Compute % diff in footprints from diet shifts
+    diff = prep_diff(abx, ghg)
+
+    return (abx, ghg, diff)
+
+
+# Main method
+def figs_diet_shifts_income():
+
+    # Input ************************************************************************************************************
+
     global income_colors
     income_colors = pd.read_csv(paths.input / 'figures/income_class_order_color.csv') \
         [['income_class', 'color_ghg']].set_index('income_class').T.to_dict('records')[0]
@@ -264,11 +275,7 @@ def figs_diet_shifts_income():
     matplotlib.rc('font', **font)
 
     # Prep data
-    # TODO: NOTE CHANGE IN UNITS FROM MG TO G ANTIBIOTICS, KG TO MT CO2E
-    (abx, ghg) = prep_abx_ghg(fp, diet_names, income_reclassification, population)
-
-    # Compute % diff in footprints from diet shifts
-    diff = prep_diff(abx, ghg)
+    (abx, ghg, diff) = cache_prepared(read_prep_inputs)
 
     # Make a version with LMICs only and just the US
     diff_lmic = s_filter(diff, col='income_class', excl_list=['High income'])
@@ -2,7 +2,6 @@ import numpy as np
 import pandas as pd
 import math
 import paths
-import winsound
 from utilities_figs import *
 from utilities import *
 from utilities_figs import *
@@ -17,7 +16,7 @@ pd.options.mode.chained_assignment = None
 
 # If SHOW_FIGS == False, figs fig data are saved
 SHOW_FIGS = False
-FILE_PATH = '../figures/diets_by_food/'
+FILE_PATH = paths.figures / 'diets_by_food'
 DIETS = ['Baseline', 'High income', 'EAT-Lancet']
 
 def prep_abx_ghg(fp, dm, diet_names, food_groups, food_order, population):
@@ -82,10 +81,8 @@ def plot_diets(abx, ghg, dm, food_colors):
     #plot, x = 'country', y_label = 'kcal/capita/day', colors = food_colors_all, filename = 'kcal_per_cap_by_food')
 
 
-# Main method
-def figs_diets_by_food():
-
-    # Input ************************************************************************************************************
+def read_prep_inputs():
+    # Read and prep inputs; the result is cached (see cache_prepared in utilities_figs)
 
     # Diet footprints
     fp_cols = ['country_code', 'country', 'diet', 'output_group', 'attribute', 'value']
@@ -97,6 +94,15 @@ def figs_diets_by_food():
 
     food_groups = pd.read_csv(paths.input / 'figures/food_groups.csv')
     food_order = pd.read_csv(paths.input / 'figures/food_groups_all_order_colors.csv')['food_group'].tolist()
+
+    return prep_abx_ghg(fp, dm, diet_names, food_groups, food_order, population)
+
+
+# Main method
+def figs_diets_by_food():
+
+    # Input ************************************************************************************************************
+
     food_colors = pd.read_csv(paths.input / 'figures/food_groups_all_order_colors.csv')['color'].tolist()
 
 
@@ -108,7 +114,7 @@ def figs_diets_by_food():
     matplotlib.rc('font', **font)
 
     # Prep data
-    (abx, ghg, dm) = prep_abx_ghg(fp, dm, diet_names, food_groups, food_order, population)
+    (abx, ghg, dm) = cache_prepared(read_prep_inputs)
 
     # Plot
     plot_diets(abx, ghg, dm, food_colors)
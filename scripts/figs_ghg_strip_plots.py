@@ -3,10 +3,10 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_figs import *
+from utilities_io import read_df
 from item_footprints_abx_concat_classify import *
 
 import matplotlib
@@ -19,7 +19,7 @@ pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
 
 SHOW_FIGS = False
-PATH = '../figures/ghg_strip_plot/'
+PATH = paths.figures / 'ghg_strip_plot'
 ORDER = ['Sheep & goat', 'Pig meat',  'Bovine meat', 'Aquatic animals', 'Poultry meat','Crops']
 BKO_ORDER = ['Pigmeat, intensive',  'Pigmeat, extensive', 'Poultry Meat, intensive','Poultry Meat, extensive']
 
@@ -61,7 +61,6 @@ def prep_ghg(ghg_gleam, ghg_coo, ghg_dist):
     ghg = pd.concat([ghg_gleam, ghg_dist], sort=False)
     ghg['item'] = ghg['item'].replace({'plant': 'Crops', 'a_animal': 'Aquatic animals'})
     ghg['footprint_type'] = 'kg_co2e'
-    ghg.to_csv(paths.diagnostic / 'abx/ghg_for_strip_plot.csv', index=False)
 
     return ghg
 
@@ -119,22 +118,34 @@ def plot_strip(df, color='', hue='', palette='', y_max=-999, y_label='', y_axis=
         ax.yaxis.tick_right()
 
 
-# Main method
-def figs_ghg_strip_plots():
-
-    # Input ************************************************************************************************************
+def read_prep_inputs():
+    # Read and prep inputs; the result is cached (see cache_prepared in utilities_figs).
+    # Also returns the prepped ghg data, which are saved as a diagnostic
 
     # item names
     item_names = pd.read_csv(paths.input / 'figures/item_names.csv')
 
     # GHGe footprints, for side-by-side comparisons
     ghg_gleam = pd.read_csv(paths.interim / 'item_footprints/item_footprints_gleam.csv')
-    ghg_coo = pd.read_csv(paths.interim / 'item_footprints/item_footprints_by_coo.csv')
+    ghg_coo = read_df(paths.interim / 'item_footprints/item_footprints_by_coo.csv')
     ghg_dist = pd.read_excel(paths.input/'ghge/ghge_lit_review_distributions.xlsx', sheet_name='ghge_combined', skiprows=3)
 
     # GHGe broken out by system
     ghg_bko = pd.read_csv(paths.interim / 'item_footprints/item_footprints_gleam_by_system.csv')
 
+    # prep abx, ghghe, abx broken out by source
+    ghg = prep_ghg(ghg_gleam, ghg_coo, ghg_dist)
+    bko = prep_ghg_bko(ghg_bko)
+
+    # Rename items
+    fp = s_merge_rename(ghg, item_names, col='item', new_name_col='item_renamed')
+
+    return (fp, bko, ghg)
+
+
+# Main method
+def figs_ghg_strip_plots():
+
     # Prep *************************************************************************************************************
 
     # Set font
@@ -142,12 +153,9 @@ def figs_ghg_strip_plots():
             'size': 6.15}
     matplotlib.rc('font', **font)
 
-    # prep abx, ghghe, abx broken out by source
-    fp = prep_ghg(ghg_gleam, ghg_coo, ghg_dist)
-    bko = prep_ghg_bko(ghg_bko)
+    (fp, bko, ghg) = cache_prepared(read_prep_inputs)
 
-    # Rename items
-    fp = s_merge_rename(fp, item_names, col='item', new_name_col='item_renamed')
+    ghg.to_csv(paths.diagnostic / 'abx/ghg_for_strip_plot.csv', index=False)
 
     # Compute medians
     fp['median'] = fp.groupby(['item', 'footprint_type'])['footprint'].transform('median')
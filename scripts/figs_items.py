@@ -2,10 +2,10 @@ import numpy as np
 import pandas as pd
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_figs import *
+from utilities_io import read_df
 from item_footprints_abx_concat_classify import *
 
 import matplotlib
@@ -18,7 +18,7 @@ pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
 
 SHOW_FIGS = False
-OUTPUT_PATH = '../figures/item_footprints/'
+OUTPUT_PATH = paths.figures / 'item_footprints'
 ORDER = ['Sheep & goat', 'Pig meat',  'Bovine meat', 'Aquatic animals', 'Poultry meat','Crops']
 BKO_ORDER = ['Pigmeat, intensive',  'Pigmeat, extensive', 'Poultry Meat, intensive','Poultry Meat, extensive']
 
@@ -47,8 +47,6 @@ def prep_abx(abx_meat, abx_aqua, abx_crops, abx_groups_drug):
 
     abx['footprint_type'] = 'mg_abx'
 
-    abx.to_csv(paths.diagnostic / 'abx/abx_item_strip_plot_data.csv', index=False)
-
     return abx
 
 
@@ -90,7 +88,6 @@ def prep_ghg(ghg_gleam, ghg_coo, ghg_dist):
     ghg = pd.concat([ghg_gleam, ghg_dist], sort=False)
     ghg['item'] = ghg['item'].replace({'plant': 'Crops', 'a_animal': 'Aquatic animals'})
     ghg['footprint_type'] = 'kg_co2e'
-    ghg.to_csv(paths.diagnostic / 'abx/ghg_for_strip_plot.csv', index=False)
 
     return ghg
 
@@ -110,8 +107,6 @@ def prep_abx_bko(bko_abx_meat, abx_groups_drug):
 
     bko_abx_meat['footprint_type'] = 'mg_abx_bko'
 
-    bko_abx_meat.to_csv(paths.diagnostic / 'abx/abx_item_strip_plot_data_bko.csv', index=False)
-
     return bko_abx_meat
 
 
@@ -130,10 +125,9 @@ def prep_ghg_bko(ghg_bko):
 
 
 
-# Main method
-def figs_items():
-
-    # Input ************************************************************************************************************
+def read_prep_inputs():
+    # Read and prep inputs; the result is cached (see cache_prepared in utilities_figs).
+    # Also returns the prepped abx, ghg, and abx by system data, which are saved as diagnostics
 
     # Aquaculture and crop data undergo numerous adaptations, e.g., to FBS items;
     # strip plots reflect source data for these foods, prior to adaptation
@@ -149,7 +143,7 @@ def figs_items():
 
     # GHGe footprints, for side-by-side comparisons
     ghg_gleam = pd.read_csv(paths.interim / 'item_footprints/item_footprints_gleam.csv')
-    ghg_coo = pd.read_csv(paths.interim / 'item_footprints/item_footprints_by_coo.csv')
+    ghg_coo = read_df(paths.interim / 'item_footprints/item_footprints_by_coo.csv')
     ghg_dist = pd.read_excel(paths.input / 'ghge/ghge_lit_review_distributions.xlsx', sheet_name='ghge_combined', skiprows=3)
 
     # Abx broken out by system / source
@@ -161,13 +155,6 @@ def figs_items():
     # Carcass to edible weight conversions
     edible_wt = pd.read_csv(paths.input / 'edible_wt_factors.csv')[['item', 'edible_fraction']]
 
-    # Prep *************************************************************************************************************
-
-    # Set font
-    font = {'family': 'Arial',
-            'size': 6.15}
-    matplotlib.rc('font', **font)
-
     # prep abx, ghg, abx broken out by source
     abx = prep_abx(abx_meat, abx_aqua, abx_crops, abx_groups_drug)
     ghg = prep_ghg(ghg_gleam, ghg_coo, ghg_dist)
@@ -195,9 +182,28 @@ def figs_items():
     fp = s_categorical_sort(fp, col='item', sort_order=ORDER)
     bko = s_categorical_sort(bko, col='item', sort_order=BKO_ORDER)
 
+    return (fp, bko, abx, ghg, abx_bko)
+
+
+# Main method
+def figs_items():
+
+    # Prep *************************************************************************************************************
+
+    # Set font
+    font = {'family': 'Arial',
+            'size': 6.15}
+    matplotlib.rc('font', **font)
+
+    (fp, bko, abx, ghg, abx_bko) = cache_prepared(read_prep_inputs)
+
+    abx.to_csv(paths.diagnostic / 'abx/abx_item_strip_plot_data.csv', index=False)
+    ghg.to_csv(paths.diagnostic / 'abx/ghg_for_strip_plot.csv', index=False)
+    abx_bko.to_csv(paths.diagnostic / 'abx/abx_item_strip_plot_data_bko.csv', index=False)
+
     # Output files BEFORE formatting item name
-    fp.to_csv('../data/output/per_kg_edible_wt_footprints_by_species.csv', index=False)
-    bko.to_csv('../data/output/per_kg_edible_wt_footprints_by_species_system.csv', index=False)
+    fp.to_csv(paths.output / 'per_kg_edible_wt_footprints_by_species.csv', index=False)
+    bko.to_csv(paths.output / 'per_kg_edible_wt_footprints_by_species_system.csv', index=False)
 
     # Add N to item names so they shop up in plots
     fp['n'] = fp.groupby(['item', 'footprint_type'])['footprint'].transform('size')
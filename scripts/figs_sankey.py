@@ -3,10 +3,10 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_figs import *
+from utilities_io import read_df
 
 import matplotlib
 import matplotlib.pyplot as plt
@@ -19,7 +19,7 @@ pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
 pd.options.display.max_colwidth = 999
 
-FILE_PATH = '../figures/sankey/'
+FILE_PATH = paths.figures / 'sankey'
 SHOW_FIGS = False
 INCOME_ORDER = ['High income', 'Upper middle income', 'Lower middle income',
                 'Low income / unclassified']
@@ -130,7 +130,7 @@ def prep_supply(supply, income_classes):
     # Convert to 1,000 metric tons
     supply['footprint'] /= 1000000000000
 
-    supply.to_csv(FILE_PATH + 'supply.csv', index=False)
+    supply.to_csv(FILE_PATH / 'supply.csv', index=False)
 
     return(supply)
 
@@ -217,8 +217,7 @@ def plot_sankey(df, node_0_name, node_cols, value, filename, node_colors=[], def
     totals = [nodes[n]['value'].sum().round(6) for n in nodes_range]
     print('sankey totals, should match:', totals)
     if not all(t == totals[0] for t in totals):
-        print('ERROR: Totals across node columns do not match')
-        winsound.Beep(400, 400)
+        send_error('sankey_totals', 'ERROR: Totals across node columns do not match')
 
     # Concat nodes
     nodes = pd.concat([nodes[n] for n in nodes_range], sort=False)
@@ -285,8 +284,22 @@ def plot_sankey(df, node_0_name, node_cols, value, filename, node_colors=[], def
         plt.show()
 
     # More on writing plot.ly images: https://plotly.com/python/static-image-export/
-    plt.write_image(FILE_PATH + filename + '.pdf', height=height)
-    plt.write_image(FILE_PATH + filename + '.png', height=height)
+    plt.write_image(FILE_PATH / (filename + '.pdf'), height=height)
+    plt.write_image(FILE_PATH / (filename + '.png'), height=height)
+
+
+def read_prep_abx(results_cols):
+    # Read and prep diet footprints; the result is cached (see cache_prepared in utilities_figs)
+
+    # Since we're mapping FBS items to custom fig groups, inputs need to be at the item level
+    abx = read_df(paths.output / 'by_coo_only/diet_footprints_by_origin_diet_item.csv')
+
+    food_groups = pd.read_csv(paths.input/'figures/food_groups.csv')
+    income_classes = pd.read_csv(paths.input/'figures/income_reclassification.csv')
+    who_groups_mi = pd.read_excel(paths.input / 'antibiotic_use/abu_classifications.xlsx', sheet_name='medical_importance', skiprows=3)[
+        ['footprint_type', 'mi', 'drug']]
+
+    return prep_abx(abx, results_cols, food_groups, income_classes, who_groups_mi)
 
 
 # Main method
@@ -294,15 +307,9 @@ def figs_sankey():
     
       # Input ************************************************************************************************************
 
-    # Since we're mapping FBS items to custom fig groups, inputs need to be at the item level
-    abx = pd.read_csv(paths.output / 'by_coo_only/diet_footprints_by_origin_diet_item.csv')
-
     supply = pd.read_csv(paths.output / 'by_coo_only/supply_side_footprints_by_country_item.csv')
 
-    food_groups = pd.read_csv(paths.input/'figures/food_groups.csv')
     income_classes = pd.read_csv(paths.input/'figures/income_reclassification.csv')
-    who_groups_mi = pd.read_excel(paths.input / 'antibiotic_use/abu_classifications.xlsx', sheet_name='medical_importance', skiprows=3)[
-        ['footprint_type', 'mi', 'drug']]
 
     #global food_colors
     #food_colors = pd.read_csv(paths.input / 'figures/abx/food_groups_all_order_colors.csv')[['food_group', 'color']]
@@ -328,7 +335,7 @@ def figs_sankey():
 
     # Prep abx
     (abx, abx_by_drug, drug_order, abx_lmic, abx_by_drug_lmic, drug_order_lmic) = \
-        prep_abx(abx, results_cols, food_groups, income_classes, who_groups_mi)
+        cache_prepared(read_prep_abx, results_cols)
 
     # Prep supply
     supply = prep_supply(supply, income_classes)
@@ -336,15 +343,15 @@ def figs_sankey():
     # Prep ghg (unused)
     #ghg = prep_ghg(ghg, food_groups_ghg, income_classes)
 
-    abx.to_csv(FILE_PATH + 'sankey.csv', index=False)
-    abx_by_drug.to_csv(FILE_PATH + 'sankey_by_drug.csv', index=False)
+    abx.to_csv(FILE_PATH / 'sankey.csv', index=False)
+    abx_by_drug.to_csv(FILE_PATH / 'sankey_by_drug.csv', index=False)
 
     # By origin
     index_cols = ['region', 'income_class', 'food_group', 'footprint_type']
     abxo = abx.melt(id_vars=index_cols, value_vars=results_cols, var_name='origin', value_name='footprint') \
         .pipe(s_filter, col='origin', list=['demand_side_domestic', 'demand_side_imported']) \
         .replace({'demand_side_domestic': 'Domestic', 'demand_side_imported': 'Imported'})
-    abxo.to_csv(FILE_PATH + 'sankey_by_origin.csv', index=False)
+    abxo.to_csv(FILE_PATH / 'sankey_by_origin.csv', index=False)
 
     abxo_lmic = s_filter(abxo, col='income_class', list=['Low income / unclassified', 'Lower middle income'])
 
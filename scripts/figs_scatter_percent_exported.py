@@ -3,7 +3,6 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities_figs import *
 from utilities import *
@@ -19,7 +18,7 @@ pd.options.mode.chained_assignment = None
 
 # If SHOW_FIGS == False, figs fig data are saved
 SHOW_FIGS = False
-OUTPUT_PATH = '../figures/%_exported/'
+OUTPUT_PATH = paths.figures / '%_exported'
 
 def add_country_labels(df, x_min=0.35, y_min=6, x_offset=0.03, y_offset=0, size=6.15, excl_labels=[]):
 # TODO: make this a shared function w/diet shifts?
@@ -31,31 +30,13 @@ def add_country_labels(df, x_min=0.35, y_min=6, x_offset=0.03, y_offset=0, size=
                 plt.text(x=df['supply_side_total'][i] + x_offset, y=df['%_exported'][i] + y_offset, s=df['country'][i],
                      fontdict=dict(color='k', size=size))
 
-# Main method
-def figs_scatter_percent_exported():
-
-    # Input ************************************************************************************************************
+def read_prep_inputs():
+    # Read and prep supply-side footprints; the result is cached (see cache_prepared in utilities_figs)
 
     supply = pd.read_csv(paths.output / 'by_coo_only/supply_side_footprints_by_country_item.csv')
 
     income_reclassification = pd.read_csv(paths.input / 'figures/income_reclassification.csv')
 
-    # Convert df to dictionary, adapted from https://stackoverflow.com/questions/26716616/convert-a-pandas-dataframe-to-a-dictionary
-    income_colors = pd.read_csv(paths.input / 'figures/income_class_order_color.csv') \
-        [['income_class', 'color_abx']].set_index('income_class').T.to_dict('records')[0]
-    #print(income_colors)
-
-    # hue_order determines order in which each series is displayed in the legend
-    income_order = pd.read_csv(paths.input / 'figures/income_class_order_color.csv')['income_class'].to_list()
-
-    # Set font *********************************************************************************************************
-
-    font = {'family': 'Arial',
-            'size': 6.15}
-    matplotlib.rc('font', **font)
-
-    # ******************************************************************************************************************
-
     results_cols = ['supply_side_total', 'supply_side_exports']
 
     supply = s_filter(supply, col='footprint_type', list=['mg_abx_total'])
@@ -78,7 +59,33 @@ def figs_scatter_percent_exported():
     supply = s_merge_rename(supply, col='income_class', new_names=income_reclassification)
     supply = supply.rename(columns={'income_class': 'Income class'})
 
-    supply.to_csv(OUTPUT_PATH + 'abx_%_exported.csv', index=False)
+    return supply
+
+
+# Main method
+def figs_scatter_percent_exported():
+
+    # Input ************************************************************************************************************
+
+    # Convert df to dictionary, adapted from https://stackoverflow.com/questions/26716616/convert-a-pandas-dataframe-to-a-dictionary
+    income_colors = pd.read_csv(paths.input / 'figures/income_class_order_color.csv') \
+        [['income_class', 'color_abx']].set_index('income_class').T.to_dict('records')[0]
+    #print(income_colors)
+
+    # hue_order determines order in which each series is displayed in the legend
+    income_order = pd.read_csv(paths.input / 'figures/income_class_order_color.csv')['income_class'].to_list()
+
+    # Set font *********************************************************************************************************
+
+    font = {'family': 'Arial',
+            'size': 6.15}
+    matplotlib.rc('font', **font)
+
+    # ******************************************************************************************************************
+
+    supply = cache_prepared(read_prep_inputs)
+
+    supply.to_csv(OUTPUT_PATH / 'abx_%_exported.csv', index=False)
 
     #supply_lmic = s_filter(supply, col='Income class', list=['Low income / unclassified', 'Lower middle income'])
 
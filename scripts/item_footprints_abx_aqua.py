@@ -3,9 +3,9 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
+from utilities_params import load_run_params
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -39,8 +39,7 @@ def allocate_abx_by_drug(abx, drugs):
     abx['diagnostic_check'] = abx.groupby(['schar_item'])['footprint'].transform('sum').astype(int)
     abx['diagnostic_compare'] =  abx['mg/kg'] - abx['diagnostic_check']
     if (abx['diagnostic_compare'] != 0).any():
-        print('ERROR: sum of allocated abx values by drug do not match original totals')
-        winsound.Beep(400, 400)
+        send_error('abx_allocation', 'ERROR: sum of allocated abx values by drug do not match original totals')
 
     abx = abx[['schar_item', 'footprint_type', 'footprint']]
     return abx
@@ -103,7 +102,7 @@ def item_footprints_abx_aqua():
 
     # Input ************************************************************************************************************
 
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1).set_index('parameter')
+    run_params = load_run_params()
 
     # Schar et al.
     abx = pd.read_excel(paths.input/'antibiotic_use/abu_aquatic_animals.xlsx', sheet_name='abu_aqua', skiprows=3)
@@ -179,7 +178,7 @@ def item_footprints_abx_aqua():
 
     # Compute weighted avg for freshwater fish
     index_cols = ['country_code', 'country', 'fbs_item_code', 'fbs_item', 'footprint_type']
-    abx = abx.groupby(index_cols).apply(wavg, 'footprint', 'mt_production_aqua')\
+    abx = grouped_wavg(abx, index_cols, 'footprint', 'mt_production_aqua', zero_weight_mean=False)\
         .rename('footprint').reset_index()
 
     # Weighted avg generates NAN values if weight (production) = zero;
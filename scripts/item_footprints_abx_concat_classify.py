@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import paths
 from utilities import *
+from utilities_io import save_df
 
 pd.options.display.width = 250
 pd.options.display.max_columns = 999
@@ -63,6 +64,6 @@ def item_footprints_abx_concat_classify(production_system='baseline'):
     abx = classify_group_abx(abx, abx_groups_drug, index_cols)
 
     if production_system == 'intensive':
-        abx.to_csv(paths.interim/'item_footprints/item_footprints_abx_all_intensive.csv', index=False)
+        save_df(abx, paths.interim/'item_footprints/item_footprints_abx_all_intensive.csv')
     else:
-        abx.to_csv(paths.interim / 'item_footprints/item_footprints_abx_all.csv', index=False)
\ No newline at end of file
+        save_df(abx, paths.interim / 'item_footprints/item_footprints_abx_all.csv')
\ No newline at end of file
@@ -3,10 +3,10 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_diet_climate import *
+from utilities_params import load_run_params
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -114,7 +114,7 @@ def item_footprints_abx_crops():
     usgs = pd.read_excel(paths.input/INPUT_PATH, sheet_name='abu_usgs_merged_avg', skiprows=3)
     countries = pd.read_csv(paths.interim / 'fao_countries.csv')[
         ['country_code', 'country', 'gleam_region']]
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1).set_index('parameter')
+    run_params = load_run_params()
 
     # Rice data from Taylor and Reeder
     tr = pd.read_excel(paths.input/INPUT_PATH, sheet_name='abu_crops_tr', skiprows=3)
@@ -3,7 +3,6 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_diet_climate import *
@@ -3,7 +3,6 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 #from utilities_stats import test_pearson
@@ -178,15 +177,15 @@ def item_footprints_abx_meat(production_system='baseline'):
 
     print('Merging abx with systems; we don''t know % extensive and % intensive for all countries, so those countries will get dropped.')
     abx = s_merge(abx, systems, on=['country_iso_code', 'fbs_item', 'system'], how='inner', validate='m:1',
-                  left_name='abx', right_name='systems', beep=False)
+                  left_name='abx', right_name='systems')
 
     abx.to_csv(paths.diagnostic/'abx/abx_meat_merged.csv', index=False)
 
     abx['proportion'] = abx['proportion'].fillna(0.5)
 
     # Compute avg drug concentration by country, weighted by proportion intensive/extensive
-    abx = (abx.groupby(['country_iso_code', 'fbs_item_code', 'fbs_item', 'footprint_type', 'source'])
-           .apply(wavg, avg_name='mg/kg_cw', weight_name='proportion')
+    abx = (grouped_wavg(abx, ['country_iso_code', 'fbs_item_code', 'fbs_item', 'footprint_type', 'source'],
+                        avg_name='mg/kg_cw', weight_name='proportion', zero_weight_mean=False)
            .rename('footprint').reset_index())
 
     # Put ruminant meat back in
@@ -197,7 +196,7 @@ def item_footprints_abx_meat(production_system='baseline'):
     # Change iso-3 country codes to FAO country codes and country names
     # Rename columns for compatibility with study model
     # Note some ISO-3 country codes may not have an FAO match, this is ok, we''ll drop them w/an inner merge
-    abx = s_merge(abx, countries, on='country_iso_code', how='inner', left_name='abx', right_name='countries', beep=False) # technically not m:1 because countries has blank codes
+    abx = s_merge(abx, countries, on='country_iso_code', how='inner', left_name='abx', right_name='countries') # technically not m:1 because countries has blank codes
     abx.drop(columns='country_iso_code', inplace=True)
 
     # Concat meat + feed footprints.
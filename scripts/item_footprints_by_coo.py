@@ -3,6 +3,8 @@ import numpy as np
 import paths
 from utilities import *
 from utilities_diet_climate import *
+from utilities_io import read_df, save_df
+from utilities_params import load_run_params, load_item_params
 
 pd.options.display.width = 250
 pd.options.display.max_columns = 999
@@ -15,17 +17,17 @@ def item_footprints_by_coo(production_system = 'baseline'):
     soy_palm = pd.read_csv(paths.interim/'item_footprints/item_footprints_soy_palm_luc.csv')
     countries = pd.read_csv(paths.interim/'fao_countries.csv')\
         [['country_code', 'country', 'gleam_region']]
-    item_params = pd.read_excel(paths.input/'item_parameters.xlsx', sheet_name='fbs_items').pipe(snake_case_cols)
+    item_params = load_item_params().pipe(snake_case_cols)
     prod = pd.read_csv(paths.interim/'fbs_item_production.csv')\
         [['country_code', 'fbs_item_code', 'mt_production']]
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1).set_index('parameter')
+    run_params = load_run_params()
 
     if production_system == 'intensive':
         gleam = pd.read_csv(paths.interim / 'item_footprints/item_footprints_gleam_intensive.csv')
-        abx = pd.read_csv(paths.interim / 'item_footprints/item_footprints_abx_all_intensive.csv')
+        abx = read_df(paths.interim / 'item_footprints/item_footprints_abx_all_intensive.csv')
     else:
         gleam = pd.read_csv(paths.interim / 'item_footprints/item_footprints_gleam.csv')
-        abx = pd.read_csv(paths.interim / 'item_footprints/item_footprints_abx_all.csv')
+        abx = read_df(paths.interim / 'item_footprints/item_footprints_abx_all.csv')
 
     # ******************************************************************************************************************
 
@@ -69,6 +71,6 @@ def item_footprints_by_coo(production_system = 'baseline'):
 
     # Output results
     if production_system=='intensive':
-        fp.to_csv(paths.interim/'item_footprints/item_footprints_by_coo_intensive.csv', index=False)
+        save_df(fp, paths.interim/'item_footprints/item_footprints_by_coo_intensive.csv')
     else:
-        fp.to_csv(paths.interim / 'item_footprints/item_footprints_by_coo.csv', index=False)
\ No newline at end of file
+        save_df(fp, paths.interim / 'item_footprints/item_footprints_by_coo.csv')
\ No newline at end of file
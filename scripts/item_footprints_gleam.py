@@ -72,8 +72,8 @@ def derive_item_footprints(gleam, derived, production):
     offals = derived[derived['fbs_item'].isin(['Bovine offals', 'Swine offals'])] \
         .merge(production, left_on=['country_code', 'parent_item_code'],
                right_on=['country_code', 'fbs_item_code'], how='left')
-    offals = offals.groupby(['country_code', 'country', 'gleam_region', 'footprint_type'])\
-        .apply(wavg, 'footprint', 'mt_production')\
+    offals = grouped_wavg(offals, ['country_code', 'country', 'gleam_region', 'footprint_type'], 'footprint', 'mt_production',
+                          zero_weight_mean=False)\
         .rename('footprint').reset_index()
     offals['fbs_item_code'] = 2736
     offals['fbs_item'] = 'Offals, Edible'
@@ -135,8 +135,8 @@ def item_footprints_gleam(production_system='baseline'):
     gleam = gleam[~gleam['footprint'].isna()]
 
     # Group by country, item, system, footprint type; compute average footprint weighted by item production
-    gleam = gleam.groupby(['country_code', 'country', 'gleam_region', 'fbs_item_code', 'fbs_item', 'system', 'footprint_type']) \
-        .apply(wavg, 'footprint', weight_name='kg_primary/year').rename('footprint').reset_index()
+    gleam = grouped_wavg(gleam, ['country_code', 'country', 'gleam_region', 'fbs_item_code', 'fbs_item', 'system', 'footprint_type'],
+                         'footprint', weight_name='kg_primary/year', zero_weight_mean=False).rename('footprint').reset_index()
 
     # Drop 0 values, mostly (exclusively?) applies to LUC footprints.
     # This is consistent with how we originally output GLEAM data, but it shouldn't make any difference either way,
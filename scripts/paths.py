@@ -1,8 +1,35 @@
+import os
 from pathlib import Path
 
-params = Path('../data/run_parameters.xlsx')
-input = Path('../data/input/')
-#cleaned = Path('../data/cleaned_for_manuscripts')
-interim = Path('../data/interim')
-diagnostic = Path('../data/diagnostic')
-output = Path('../data/output')
\ No newline at end of file
+# Data folders, as absolute paths so scripts can run from any working directory.
+# By default, data is the folder next to scripts; set_data_root (or the PIPELINE_DATA_ROOT environment variable)
+# points them all to another data folder, and PIPELINE_PARAMS to another run parameters workbook.
+# Settings are saved to environment variables so worker processes (see pipeline_scheduler) use the same folders.
+DATA_ROOT_VAR = 'PIPELINE_DATA_ROOT'
+PARAMS_VAR = 'PIPELINE_PARAMS'
+
+
+def set_data_root(root=None, params_file=None):
+    # Point all data folders to root, and the run parameters workbook to params_file (default: root/run_parameters.xlsx)
+
+    global data, params, input, interim, diagnostic, output, scenarios, figures
+
+    if root is not None:
+        os.environ[DATA_ROOT_VAR] = str(Path(root).resolve())
+    if params_file is not None:
+        os.environ[PARAMS_VAR] = str(Path(params_file).resolve())
+
+    data = Path(os.environ.get(DATA_ROOT_VAR, Path(__file__).resolve().parent.parent / 'data'))
+    params = Path(os.environ.get(PARAMS_VAR, data / 'run_parameters.xlsx'))
+    input = data / 'input'
+    #cleaned = data / 'cleaned_for_manuscripts'
+    interim = data / 'interim'
+    diagnostic = data / 'diagnostic'
+    output = data / 'output'
+    scenarios = data / 'scenarios'
+
+    # Figures are saved next to the data folder
+    figures = data.parent / 'figures'
+
+
+set_data_root()
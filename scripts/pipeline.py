@@ -1,13 +1,31 @@
+import os
+import re
+import sys
+import argparse
+import traceback
+
+# Figures are saved to file, not shown, so figure scripts use matplotlib's non-interactive backend;
+# set before matplotlib is imported here or in any worker process
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
 import pandas as pd
 import paths
-import winsound
 import math
 from utilities import *
+from utilities_io import read_df, save_df
+from utilities_params import load_run_params, load_params_sheet
+from utilities_alerts import save_alerts
+from pipeline_scheduler import import_run, run_dag, scan_io, normalize_path, PATH_EXPR
+from pipeline_cache import load_cache, save_cache, resolve_path
+from pipeline_profile import measure, save_manifest
 
-# Check the version
-print('Running on Pandas v',pd.__version__)
+# Number of processes used to run pipeline steps that don't depend on each other;
+# set to 1 to run steps one at a time, in the order listed in run parameters
+N_WORKERS = 4
 
-pd.options.display.width = 250
+# Skip steps whose code, input files, and run parameters are unchanged since the last run, reusing their outputs.
+# A report of reused and rebuilt steps is saved to the diagnostic folder; see pipeline_cache
+USE_CACHE = True
 
 
 def clean_group_output_diet_model(dm, results_cols, run_params):
@@ -45,33 +63,33 @@ def clean_group_output_diet_model(dm, results_cols, run_params):
 
     # Check indices and output diet model
     check_duplicate_indices(dm, ['country_code', 'diet', 'fbs_item'])
-    dm.to_csv(paths.output / 'diet_model_by_country_diet_item.csv', index=False)
+    save_df(dm, paths.output / 'diet_model_by_country_diet_item.csv', keep=True)
 
     # Group by output group, unpivot, filter, and output
+    # (index cols were checked for NAN values above)
     index_cols = ['country_code', 'country', 'diet', 'output_group', 'type']
-    check_nan_values(dm, index_cols)
     dm_by_group = dm.groupby(index_cols)[results_cols].sum().reset_index()
     dm_by_group = dm_by_group.melt(id_vars=index_cols, value_vars=results_cols,
                                    var_name='attribute', value_name='value')
     dm_by_group = dm_by_group[(dm_by_group['value'].notna()) & (dm_by_group['value'] != 0)]
-    check_duplicate_indices(dm_by_group, index_cols + ['attribute'])
+    run_checks(dm_by_group, unique=index_cols + ['attribute'], name='dm_by_group', strict_only=True)
     dm_by_group.to_csv(paths.output / 'diet_model_by_country_diet_output_group.csv', index=False)
 
     # Group by country diet and output
     index_cols = ['country_code', 'country', 'diet']
     dm_by_diet = dm.groupby(index_cols)[results_cols].sum().reset_index()
-    check_duplicate_indices(dm_by_diet, index_cols)
+    run_checks(dm_by_diet, unique=index_cols, name='dm_by_diet', strict_only=True)
     dm_by_diet.to_csv(paths.output / 'diet_model_by_country_diet.csv', index=False)
 
 
-def import_run(script_args):
+def dm_file(expr):
+    # Output file of a diet model, given in the dm_pipeline sheet as a path expression,
+    # e.g., paths.interim/'diet_model_constant.csv'
 
-    script = script_args[0]
-    args = script_args[1]
-    print('\n*****************************************************************************************************')
-    print('Running:', script, args, '\n')
-    exec('from ' + script + ' import ' + script)
-    exec(script + args)
+    m = re.fullmatch(PATH_EXPR, expr.strip())
+    if m is None or m.group('file') is None:
+        raise ValueError('Diet model file must be given as paths.<folder>/\'<file name>\': ' + expr)
+    return resolve_path(normalize_path(m.group('root'), m.group('file')))
 
 
 def scale_diets_to_target_kcal(dm, scaling_targets, results_cols):
@@ -89,51 +107,74 @@ def scale_diets_to_target_kcal(dm, scaling_targets, results_cols):
     return dms
 
 
-# INPUT ****************************************************************************************************************
+def stage_io(script):
+    # Files a pipeline stage reads and writes (see pipeline_scheduler.scan_io). The diet_model stage (pipe_b) runs
+    # the baseline and every diet model in dm_pipeline, then combines them here (see run_diet_model)
+
+    if script != 'diet_model':
+        return scan_io(script)
 
-run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1)
-run_params.set_index('parameter', inplace=True)
-#run_params = run_params[run_params['value'] == 'yes']['parameter'].tolist()
+    dm_pipe = load_params_sheet('dm_pipeline')
+    inputs, outputs = set(), set()
+    for s in ['diet_model_baseline'] + dm_pipe.loc[dm_pipe['run'] == 'yes', 'diet_model'].tolist() + ['pipeline']:
+        i, o = scan_io(s)
+        inputs |= i
+        outputs |= o
+    return inputs - outputs, outputs
 
-# pipe_a: scripts to run before diet_model
-# pipe_b: diet model functions
-# pipe_c: scripts to run after diet_model
-script_pipe = pd.read_excel(paths.params, sheet_name='pipeline', skiprows=1)
-script_pipe = script_pipe[script_pipe['run'] == 'yes']
-script_pipe_a = script_pipe[script_pipe['sequence'] == 'a']
-script_pipe_b = script_pipe[script_pipe['sequence'] == 'b']['script'].tolist()
-script_pipe_c = script_pipe[script_pipe['sequence'] == 'c']
 
-dm_pipe = pd.read_excel(paths.params, sheet_name='dm_pipeline', skiprows=1)
-dm_pipe = dm_pipe[dm_pipe['run'] == 'yes']
+def select_stages(pipe, stages=None, downstream=False):
+    # Rows of the pipeline sheet to run, in pipeline order. By default, every row w/run == 'yes'.
+    # Stages are script names, which select every row for that script, or a script w/its args,
+    # e.g., "item_footprints_gleam(production_system='intensive')"; named stages run regardless of the run column.
+    # W/downstream, every later row (w/run == 'yes') that reads a file written by a selected row is also selected.
 
-# pipe_a ***************************************************************************************************************
+    if stages is None:
+        return pipe[pipe['run'] == 'yes']
 
-for index, row in script_pipe_a.iterrows():
-    import_run(row[['script', 'args']].to_list())
+    ids = pipe['script'] + pipe['args']
+    unknown = [s for s in stages if s not in pipe['script'].values and s not in ids.values]
+    if len(unknown) > 0:
+        raise ValueError('Unknown stage(s): ' + ', '.join(unknown) + '. Stages are listed in the pipeline sheet of '
+                         + str(paths.params))
 
-# pipe_b: diet model functions *****************************************************************************************
+    selected = pipe['script'].isin(stages) | ids.isin(stages)
+    if downstream:
+        written = set()
+        for i, row in pipe.iterrows():
+            if selected[i]:
+                written |= stage_io(row['script'])[1]
+            elif row['run'] == 'yes':
+                inputs, outputs = stage_io(row['script'])
+                if inputs & written:
+                    selected[i] = True
+                    written |= outputs
 
-if 'diet_model' in script_pipe_b:
+    return pipe[selected]
 
-    dm = pd.DataFrame()
+
+def run_diet_model(dm_pipe):
+    # pipe_b: run the baseline and each diet model in dm_pipeline, combine them, and output the diet model
+
+    dms = []
 
     # Prepare the baseline diet as a reference point modeling all the other diets.
     # It has columns for "baseline_kg/cap/yr," etc., but it's not technically recognized as a diet yet by the model
     # because it doesn't have a "diet" column or "kg/cap/yr", etc.
-    import_run(['diet_model_baseline', '()'])
+    import_run(['diet_model_baseline', '()'], kind='diet_model')
 
     for index, row in dm_pipe.iterrows():
-        import_run(row[['diet_model', 'args']].to_list())
-        exec('dm = pd.concat([dm, pd.read_csv(' + row['file'] + ')], sort=False)')
+        import_run(row[['diet_model', 'args']].to_list(), kind='diet_model')
+        # Diet models save their output w/save_df, so this reads it from memory instead of parsing the file again
+        dms.append(read_df(dm_file(row['file'])))
 
     # Append the baseline diet as an actual diet (as opposed to just a reference point)
-    dm_baseline = pd.read_csv(paths.interim / 'diet_model_baseline.csv')
+    dm_baseline = read_df(paths.interim / 'diet_model_baseline.csv')
     dm_baseline['diet'] = 'baseline'
     baseline_cols = dm_baseline.columns[dm_baseline.columns.str.startswith('baseline')].tolist()
     results_cols = [col.replace('baseline_', '') for col in baseline_cols]
     dm_baseline[results_cols] = dm_baseline[baseline_cols]
-    dm = pd.concat([dm, dm_baseline], sort=False)
+    dm = pd.concat(dms + [dm_baseline], sort=False)
 
 
     # Define cols
@@ -142,13 +183,103 @@ if 'diet_model' in script_pipe_b:
     #results_cols = ['kg/cap/yr','kcal/cap/day','g_pro/cap/day','mcg_b12/cap/day'] + \
     #               dm.columns[dm.columns.str.startswith('loss_adj')].tolist()
 
-    clean_group_output_diet_model(dm, results_cols, run_params)
+    with measure('clean_group_output_diet_model', kind='diet_model'):
+        clean_group_output_diet_model(dm, results_cols, load_run_params())
+
+    # This runs in the main process, outside import_run, so save its alerts here;
+    # otherwise they'd be saved w/the next step's alerts, or copied to every pipe_c worker process
+    save_alerts(paths.diagnostic / 'alerts' / 'clean_group_output_diet_model.csv')
 
     # Output list of unique FBS items in the diet model
     dm_unique = dm[['fbs_item_code', 'fbs_item']].drop_duplicates()
     dm_unique.to_csv(paths.diagnostic / 'diet_model_unique_fbs_items.csv', index=False)
 
-# pipe_c ***************************************************************************************************************
 
-for index, row in script_pipe_c.iterrows():
-    import_run(row[['script', 'args']].to_list())
\ No newline at end of file
+def run_pipeline(script_pipe, n_workers=N_WORKERS, use_cache=USE_CACHE):
+    # Run the selected rows of the pipeline sheet (see select_stages)
+
+    # pipe_a: scripts to run before diet_model
+    # pipe_b: diet model functions
+    # pipe_c: scripts to run after diet_model
+    script_pipe_a = script_pipe[script_pipe['sequence'] == 'a']
+    script_pipe_b = script_pipe[script_pipe['sequence'] == 'b']['script'].tolist()
+    script_pipe_c = script_pipe[script_pipe['sequence'] == 'c']
+
+    cache = load_cache() if use_cache else None
+
+    # pipe_a ***************************************************************************************************************
+
+    # Steps that don't share any input/output files run in parallel; see pipeline_scheduler
+    run_dag(script_pipe_a[['script', 'args']].values.tolist(), n_workers=n_workers, cache=cache)
+
+    # pipe_b: diet model functions *****************************************************************************************
+
+    if 'diet_model' in script_pipe_b:
+        dm_pipe = load_params_sheet('dm_pipeline')
+        run_diet_model(dm_pipe[dm_pipe['run'] == 'yes'])
+
+    # pipe_c ***************************************************************************************************************
+
+    run_dag(script_pipe_c[['script', 'args']].values.tolist(), n_workers=n_workers, cache=cache)
+
+    if cache is not None:
+        save_cache(cache)
+
+    # Time, memory, and rows/bytes read and written by each step; see pipeline_profile
+    save_manifest({'n_workers': n_workers, 'use_cache': use_cache, 'data_root': str(paths.data),
+                   'stages': (script_pipe['script'] + script_pipe['args']).tolist()})
+
+
+# Main method
+def main(argv=None):
+    # Command line entry point, e.g., from any folder:
+    #   python scripts/pipeline.py --stages item_footprints_abx_crops --downstream --workers 8
+    # Returns the exit code: 0 if all stages ran, 1 if a stage failed, 2 for invalid options (from argparse)
+
+    parser = argparse.ArgumentParser(prog='pipeline', description='Run the pipeline, or selected stages of it. '
+                                     'Stages and their order are listed in the pipeline sheet of run_parameters.xlsx.')
+    parser.add_argument('--stages', nargs='+', metavar='STAGE',
+                        help='run only these stages: script names, or a script w/its args as listed in the pipeline '
+                             'sheet, e.g., "item_footprints_gleam(production_system=\'intensive\')"')
+    parser.add_argument('--downstream', action='store_true',
+                        help='also run every later stage that depends on the selected stages')
+    parser.add_argument('--data-root', help='data folder (default: the data folder next to scripts)')
+    parser.add_argument('--params', help='run parameters workbook (default: run_parameters.xlsx in the data folder)')
+    parser.add_argument('--workers', type=int, default=N_WORKERS,
+                        help='number of processes for stages that don\'t depend on each other (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='run every selected stage, even if its code, inputs, and parameters are unchanged')
+    parser.add_argument('--dry-run', action='store_true', help='list the stages that would run, then exit')
+    args = parser.parse_args(argv)
+
+    if args.data_root is not None or args.params is not None:
+        paths.set_data_root(args.data_root, args.params)
+    if not paths.params.exists():
+        parser.error('run parameters workbook not found: ' + str(paths.params))
+    if args.downstream and args.stages is None:
+        parser.error('--downstream requires --stages')
+
+    # Check the version
+    print('Running on Pandas v', pd.__version__)
+    pd.options.display.width = 250
+
+    try:
+        script_pipe = select_stages(load_params_sheet('pipeline'), args.stages, args.downstream)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print('Data:', paths.data)
+    print('Stages:', (script_pipe['script'] + script_pipe['args']).tolist())
+    if args.dry_run:
+        return 0
+
+    try:
+        run_pipeline(script_pipe, n_workers=args.workers, use_cache=not args.no_cache)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import re
+import json
+import hashlib
+import pandas as pd
+import paths
+from pipeline_scheduler import SCRIPTS_DIR, COMMENTS, scan_io
+from utilities_params import load_params_sheet, load_run_params
+
+# Cache keys for each step, and hashes of the outputs each step wrote, are saved here between runs
+CACHE_FILE = 'pipeline_cache.json'
+REPORT_FILE = 'pipeline_cache_report.csv'
+
+
+def resolve_path(key):
+    # Convert a normalized path from scan_io (e.g., 'interim/fao_countries.csv') back to a file path
+
+    root, _, file = key.partition('/')
+    return getattr(paths, root) / file if file != '' else getattr(paths, root)
+
+
+def hash_file(path):
+    # Hash file contents; directories are hashed over the names and contents of all files they contain.
+    # Returns None if the file doesn't exist.
+
+    if path.is_dir():
+        h = hashlib.sha256()
+        for f in sorted(p for p in path.rglob('*') if p.is_file()):
+            h.update(str(f.relative_to(path)).encode())
+            h.update(hash_file(f).encode())
+        return h.hexdigest()
+
+    if not path.exists():
+        return None
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def artifact_files(key):
+    # Files that may hold a scanned input/output: tables saved with utilities_io.save_df
+    # may be stored as .parquet instead of (or as well as) the .csv named in the script
+
+    path = resolve_path(key)
+    return [path, path.with_suffix('.parquet')] if path.suffix == '.csv' else [path]
+
+
+def hash_artifact(key):
+    # Hash all the files holding an input/output; returns None if none of them exist
+
+    hashes = [hash_file(f) for f in artifact_files(key)]
+    if all(h is None for h in hashes):
+        return None
+    return hashes[0] if len(hashes) == 1 else hashlib.sha256(str(hashes).encode()).hexdigest()
+
+
+def scan_params(script):
+    # Scan a script for the run_parameters sheets and the individual run parameters it uses
+
+    source = re.sub(COMMENTS, '', (SCRIPTS_DIR / (script + '.py')).read_text(encoding='utf-8'), flags=re.DOTALL)
+    sheets = set(re.findall(r'''paths\.params\s*,\s*sheet_name\s*=\s*['"](\w+)['"]''', source)) \
+             | set(re.findall(r'''load_params_sheet\(\s*['"](\w+)['"]''', source))
+    params = set(re.findall(r'''run_params\.loc\[\s*['"](\w+)['"]''', source)) \
+             | set(re.findall(r'''get_param\w*\(\s*['"](\w+)['"]''', source))
+    return sheets, params
+
+
+def hash_code(script, seen=None):
+    # Hash a script's source along with any local modules it imports (e.g., utilities), recursively
+
+    if seen is None:
+        seen = set()
+    seen.add(script)
+
+    source = (SCRIPTS_DIR / (script + '.py')).read_text(encoding='utf-8')
+    h = hashlib.sha256(source.encode())
+    for module in sorted(set(re.findall(r'^\s*(?:from|import)\s+(\w+)', source, flags=re.MULTILINE))):
+        if module not in seen and (SCRIPTS_DIR / (module + '.py')).exists():
+            h.update(hash_code(module, seen).encode())
+    return h.hexdigest()
+
+
+def load_cache():
+    # Load cache keys from the last run, plus the run parameters used for every step key.
+    # Other run_parameters sheets are loaded only when a step uses them (parsed once; see utilities_params);
+    # run parameter overrides are part of step keys like any other parameter change
+
+    file = paths.interim / CACHE_FILE
+    steps = json.loads(file.read_text()) if file.exists() else {}
+
+    return {'steps': steps, 'run_params': load_run_params(), 'report': []}
+
+
+def params_sheet(sheet):
+    # A run_parameters sheet, or None if the workbook doesn't have it
+    try:
+        return load_params_sheet(sheet, copy=False)
+    except ValueError:
+        return None
+
+
+def step_id(step):
+    return step[0] + step[1]
+
+
+def step_key(cache, step):
+    # Everything a step's outputs depend on: its code, arguments, input files, and the run parameters it uses.
+    # Each part is kept separately so the report can say why a step was rebuilt.
+
+    script = step[0]
+    inputs, outputs = scan_io(script)
+    sheets, params = scan_params(script)
+
+    key = {'code': hash_code(script), 'args': step[1], 'inputs': {}, 'params': {}}
+
+    # Input files; run parameters are handled separately below so unrelated parameter changes don't trigger rebuilds
+    for i in sorted(inputs - {'params'}):
+        key['inputs'][i] = hash_artifact(i)
+
+    for sheet in sorted(sheets - {'parameters'}):
+        df = params_sheet(sheet)
+        key['params']['sheet:' + sheet] = hashlib.sha256(df.to_csv().encode()).hexdigest() if df is not None else None
+
+    run_params = cache['run_params']
+    for p in sorted(params):
+        key['params'][p] = str(run_params.loc[p, 'value']) if p in run_params.index else None
+
+    return key
+
+
+def compare_keys(old, new):
+    # List the reasons a step's cache key changed
+
+    reasons = []
+    if old['code'] != new['code']:
+        reasons.append('code changed')
+    if old['args'] != new['args']:
+        reasons.append('args changed')
+    for part in ['inputs', 'params']:
+        for k in sorted(set(old[part]) | set(new[part])):
+            if old[part].get(k) != new[part].get(k):
+                reasons.append(part[:-1] + ' changed: ' + k)
+    return reasons
+
+
+def check_step(cache, step):
+    # Return (cached, key); a step is cached if its key is unchanged since it last ran
+    # and the outputs it wrote still exist, unmodified.
+
+    key = step_key(cache, step)
+    entry = cache['steps'].get(step_id(step))
+
+    if entry is None:
+        reasons = ['not in cache']
+    else:
+        reasons = compare_keys(entry['key'], key)
+        for f, h in entry['outputs'].items():
+            if hash_artifact(f) != h:
+                reasons.append('output missing or modified: ' + f)
+
+    cache['report'].append({'step': step_id(step),
+                            'status': 'rebuilt' if len(reasons) > 0 else 'reused',
+                            'reason': '; '.join(reasons)})
+    return len(reasons) == 0, key
+
+
+def snapshot_outputs(step):
+    # Record modification times of a step's outputs before it runs, so we can tell afterwards which ones it wrote
+
+    _, outputs = scan_io(step[0])
+    snapshot = {}
+    for o in outputs:
+        snapshot[o] = [f.stat().st_mtime_ns if f.is_file() else None for f in artifact_files(o)]
+    return snapshot
+
+
+def record_step(cache, step, key, snapshot):
+    # After a step runs, save its key and hashes of the outputs it wrote.
+    # Scanned outputs are a superset of what a step writes (e.g., intensive vs. baseline files),
+    # so only files modified during this run are recorded.
+
+    outputs = {}
+    for o, mtimes in snapshot.items():
+        files = artifact_files(o)
+        if any(f.is_file() and f.stat().st_mtime_ns != m for f, m in zip(files, mtimes)):
+            outputs[o] = hash_artifact(o)
+
+    cache['steps'][step_id(step)] = {'key': key, 'outputs': outputs}
+
+
+def save_cache(cache):
+    # Save cache keys and output a report of which steps were reused or rebuilt
+
+    (paths.interim / CACHE_FILE).write_text(json.dumps(cache['steps'], indent=1))
+
+    report = pd.DataFrame(cache['report'], columns=['step', 'status', 'reason'])
+    report.to_csv(paths.diagnostic / REPORT_FILE, index=False)
+
+    print('\nPipeline cache: reused', (report['status'] == 'reused').sum(),
+          'step(s), rebuilt', (report['status'] == 'rebuilt').sum())
+    if (report['status'] == 'rebuilt').any():
+        print(report[report['status'] == 'rebuilt'].to_string(index=False))
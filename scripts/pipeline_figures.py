@@ -0,0 +1,42 @@
+import os
+
+# Figures are saved to file, not shown, so figure scripts use matplotlib's non-interactive backend;
+# set before matplotlib is imported here or in any worker process
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+from utilities_params import load_params_sheet
+from pipeline_scheduler import run_dag
+from pipeline_cache import load_cache, save_cache
+from pipeline_profile import save_manifest
+
+# Rebuild figures only: runs the figs_ steps in the pipeline (run_parameters.xlsx) w/o the rest of the pipeline,
+# e.g., after changing labels or colors. Run the pipeline first; figures are drawn from its outputs.
+# - Figure scripts run in parallel, in separate processes (see pipeline_scheduler.run_dag)
+# - Scripts whose code and input files are unchanged since the last run are skipped (see pipeline_cache)
+# - Within a script, prepared data are reused if its inputs and prep code are unchanged,
+#   so changing how a figure is drawn only redraws it (see cache_prepared in utilities_figs)
+
+# Number of figure scripts drawn at the same time
+N_WORKERS = 4
+
+# Skip figure scripts whose code and input files are unchanged since the last run
+USE_CACHE = True
+
+
+# Main method
+def pipeline_figures():
+
+    pipe = load_params_sheet('pipeline')
+    pipe = pipe[(pipe['run'] == 'yes') & pipe['script'].str.startswith('figs_')]
+    print('Drawing figures:', pipe['script'].tolist())
+
+    cache = load_cache() if USE_CACHE else None
+    run_dag(pipe[['script', 'args']].values.tolist(), n_workers=N_WORKERS, cache=cache)
+    if cache is not None:
+        save_cache(cache)
+
+    save_manifest({'n_workers': N_WORKERS, 'use_cache': USE_CACHE, 'figures_only': True})
+
+
+if __name__ == '__main__':
+    pipeline_figures()
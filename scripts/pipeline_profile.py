@@ -0,0 +1,241 @@
+import os
+import re
+import sys
+import json
+import time
+import cProfile
+import threading
+import pandas as pd
+import paths
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# Resource use of each pipeline step (import_run) and diet model: wall time, CPU time, peak memory,
+# and rows and bytes read and written. Records are saved as a run manifest (.json and .csv) in the diagnostic folder.
+# Set the PIPELINE_PROFILE environment variable to 'yes' to also profile each step:
+#   <step>.folded: sampled call stacks in the "folded" format read by flamegraph.pl and speedscope;
+#   <step>.prof: cProfile output, e.g., for snakeviz or pstats.
+PROFILE = os.environ.get('PIPELINE_PROFILE', 'no') == 'yes'
+PROFILE_DIR = 'profile'
+MANIFEST_FILE = 'pipeline_manifest'
+
+# Call stacks are sampled this many times per second when profiling
+SAMPLE_HZ = 100
+
+# resource isn't available on Windows; peak memory is then read w/psutil if installed, otherwise not recorded
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Records of the steps run in this process (and returned by worker processes; see pipeline_scheduler.run_dag)
+records = []
+
+
+def step_name(script_args):
+    # File name for a step, e.g., ['item_footprints_gleam', "(production_system='intensive')"]
+    # -> 'item_footprints_gleam_production_system_intensive'
+    return re.sub(r'\W+', '_', script_args[0] + script_args[1]).strip('_')
+
+
+def reset_peak_rss():
+    # On Linux, the process's peak memory can be reset so each step reports its own peak;
+    # elsewhere, the peak is the highest since the process started (an upper bound for the step)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 ** 2
+    except ImportError:
+        return None
+
+
+def file_name(path):
+    # File name of a path or an open file; None for buffers, zip members, etc.
+    name = path if isinstance(path, (str, os.PathLike)) else getattr(path, 'name', None)
+    if isinstance(name, (str, os.PathLike)) and os.path.isfile(name):
+        return name
+    return None
+
+
+def file_size(path):
+    name = file_name(path)
+    return os.path.getsize(name) if name is not None else None
+
+
+@contextmanager
+def count_io(io):
+    # Count rows and bytes read and written through pandas while the block runs.
+    # Rows read from .csv files are counted as they're parsed, so files read in chunks are included;
+    # each file counts once towards bytes read, even if it's opened several times (e.g., to read the header first).
+
+    from pandas.io.parsers.readers import TextFileReader
+    files_read = set()
+
+    def read_file(path):
+        name = file_name(path)
+        if name is not None and os.path.realpath(name) not in files_read:
+            files_read.add(os.path.realpath(name))
+            io['bytes_in'] += os.path.getsize(name)
+
+    def first_arg(args, kwargs, names):
+        # The file argument, whether passed by position or by name
+        return args[0] if args else next((kwargs[n] for n in names if n in kwargs), None)
+
+    def reader(func, count_rows=True):
+        def wrapper(*args, **kwargs):
+            df = func(*args, **kwargs)
+            read_file(first_arg(args, kwargs, ['filepath_or_buffer', 'io', 'path']))
+            if count_rows and isinstance(df, pd.DataFrame):
+                io['rows_in'] += len(df)
+            elif count_rows and isinstance(df, dict):
+                io['rows_in'] += sum(len(d) for d in df.values())
+            return df
+        return wrapper
+
+    def csv_chunk(func):
+        def wrapper(self, *args, **kwargs):
+            df = func(self, *args, **kwargs)
+            io['rows_in'] += len(df)
+            return df
+        return wrapper
+
+    def writer(func):
+        def wrapper(df, *args, **kwargs):
+            result = func(df, *args, **kwargs)
+            size = file_size(first_arg(args, kwargs, ['path_or_buf', 'path', 'excel_writer']))
+            if size is not None:
+                io['rows_out'] += len(df)
+                io['bytes_out'] += size
+            return result
+        return wrapper
+
+    patched = [(pd, 'read_csv', reader(pd.read_csv, count_rows=False)),
+               (pd, 'read_excel', reader(pd.read_excel)),
+               (pd, 'read_parquet', reader(pd.read_parquet)),
+               (TextFileReader, 'read', csv_chunk(TextFileReader.read)),
+               (pd.DataFrame, 'to_csv', writer(pd.DataFrame.to_csv)),
+               (pd.DataFrame, 'to_parquet', writer(pd.DataFrame.to_parquet)),
+               (pd.DataFrame, 'to_excel', writer(pd.DataFrame.to_excel))]
+    originals = [(obj, attr, getattr(obj, attr)) for obj, attr, _ in patched]
+    for obj, attr, func in patched:
+        setattr(obj, attr, func)
+    try:
+        yield io
+    finally:
+        for obj, attr, func in originals:
+            setattr(obj, attr, func)
+
+
+def sample_stacks(thread_id, stacks, stop):
+    # Sample the call stack of a thread until stop is set, counting each stack as 'outer;...;inner'
+    while not stop.wait(1 / SAMPLE_HZ):
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(code.co_name + ' (' + Path(code.co_filename).name + ':' + str(code.co_firstlineno) + ')')
+            frame = frame.f_back
+        if stack:
+            stacks[';'.join(reversed(stack))] += 1
+
+
+@contextmanager
+def profile_stacks(name):
+    # Profile the block w/cProfile and a stack sampler; results are saved to diagnostic/PROFILE_DIR
+
+    directory = paths.diagnostic / PROFILE_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+
+    stacks = Counter()
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_stacks, args=(threading.get_ident(), stacks, stop), daemon=True)
+    profiler = cProfile.Profile()
+
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        stop.set()
+        sampler.join()
+        profiler.dump_stats(directory / (name + '.prof'))
+        (directory / (name + '.folded')).write_text(''.join(s + ' ' + str(n) + '\n' for s, n in stacks.items()))
+
+
+@contextmanager
+def measure(name, kind='step'):
+    # Measure a block of code, e.g.,
+    #   with measure('item_footprints_gleam') as record:
+    #       item_footprints_gleam()
+    # The record is added to records once the block finishes, including if it raises an error.
+
+    record = {'step': name, 'kind': kind, 'status': 'ok', 'pid': os.getpid(),
+              'start': datetime.now().isoformat(timespec='seconds'),
+              'rows_in': 0, 'rows_out': 0, 'bytes_in': 0, 'bytes_out': 0}
+    reset_peak_rss()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        with count_io(record):
+            if PROFILE:
+                with profile_stacks(name):
+                    yield record
+            else:
+                yield record
+    except BaseException:
+        record['status'] = 'error'
+        raise
+    finally:
+        record['wall_s'] = round(time.perf_counter() - wall, 3)
+        record['cpu_s'] = round(time.process_time() - cpu, 3)
+        record['peak_rss_mb'] = peak_rss_mb()
+        records.append(record)
+
+
+def record_cached(name):
+    # Record a step that was skipped because its outputs were reused from the pipeline cache
+    records.append({'step': name, 'kind': 'step', 'status': 'cached', 'pid': os.getpid(),
+                    'start': datetime.now().isoformat(timespec='seconds'),
+                    'rows_in': 0, 'rows_out': 0, 'bytes_in': 0, 'bytes_out': 0,
+                    'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': None})
+
+
+def save_manifest(run_info=None):
+    # Save all step records as diagnostic/MANIFEST_FILE.json (w/run_info, e.g., settings) and .csv,
+    # and print the slowest steps
+
+    run_info = dict(run_info or {})
+    run_info.update({'saved': datetime.now().isoformat(timespec='seconds'), 'pandas': pd.__version__,
+                     'python': sys.version.split()[0], 'profile': PROFILE})
+
+    paths.diagnostic.mkdir(parents=True, exist_ok=True)
+    (paths.diagnostic / (MANIFEST_FILE + '.json')).write_text(
+        json.dumps({'run': run_info, 'steps': records}, indent=1, default=str))
+    manifest = pd.DataFrame(records, columns=['step', 'kind', 'status', 'pid', 'start', 'wall_s', 'cpu_s',
+                                              'peak_rss_mb', 'rows_in', 'rows_out', 'bytes_in', 'bytes_out'])
+    manifest.to_csv(paths.diagnostic / (MANIFEST_FILE + '.csv'), index=False)
+
+    print('\nSlowest steps (see', paths.diagnostic / (MANIFEST_FILE + '.csv'), '):')
+    print(manifest.sort_values('wall_s', ascending=False).head(10)[['step', 'wall_s', 'cpu_s', 'peak_rss_mb']]
+          .to_string(index=False))
@@ -0,0 +1,211 @@
+import os
+import shutil
+import itertools
+import pandas as pd
+import paths
+from concurrent.futures import ProcessPoolExecutor
+from utilities_io import read_df, save_df
+from utilities_params import load_params_sheet, set_param_overrides, CACHE_FILE
+from pipeline_scheduler import import_run, scan_io, init_worker
+from pipeline_cache import scan_params, resolve_path, artifact_files
+import pipeline_profile
+
+# Sensitivity scenarios: reruns the pipeline steps affected by a set of run parameters,
+# once for every combination of the parameter values in GRID, without editing run_parameters.xlsx.
+# Run the pipeline first; steps that aren't affected by the parameters are not rerun, and their outputs
+# (in data/interim, etc.) are shared by all scenarios. Each scenario runs in its own folder, data/scenarios/<scenario_id>,
+# w/its own interim, diagnostic, and output folders; results are then combined into a single long table
+# in data/scenarios, keyed by scenario_id.
+
+# Run parameters and the values to run for each
+GRID = {'abx_aqua_low_high': ['low', 'mean', 'high'],
+        'abx_crops_low_high': ['low', 'mean', 'high']}
+
+# Affected steps are rerun up to and including this step; later steps (figures, summary tables, etc.) are not
+LAST_STEP = 'results_combine'
+
+# Number of scenarios run at the same time; steps within a scenario run one after another
+N_WORKERS = 4
+
+# Data folders that each scenario has its own copy of; all other folders (input, params) are shared
+SCENARIO_ROOTS = ['interim', 'diagnostic', 'output']
+
+# Result tables combined over scenarios, and the columns that identify their rows;
+# the other numeric columns are unpivoted into measure and value columns
+RESULTS = {'diet_footprints_by_country_diet.csv': ['country_code', 'country', 'diet', 'attribute'],
+           'diet_footprints_population_total_by_region_diet_food_group.csv': ['region', 'diet', 'output_group',
+                                                                               'attribute'],
+           'diet_footprints_population_total_global_by_diet.csv': ['diet', 'attribute']}
+
+
+def scenario_grid(grid):
+    # All combinations of parameter values as {scenario_id: {parameter: value}},
+    # e.g., 'abx_aqua_low_high=low-abx_crops_low_high=high'
+    scenarios = {}
+    for values in itertools.product(*grid.values()):
+        overrides = dict(zip(grid.keys(), values))
+        scenarios['-'.join(p + '=' + str(v) for p, v in overrides.items())] = overrides
+    return scenarios
+
+
+def affected_steps(parameters):
+    # Steps in the pipeline (pipe_a and pipe_c in run_parameters) that use any of the parameters,
+    # plus every later step that reads a file written by an affected step, up to LAST_STEP
+
+    pipe = load_params_sheet('pipeline')
+    pipe = pipe[(pipe['run'] == 'yes') & pipe['sequence'].isin(['a', 'c'])]
+    steps = pipe[['script', 'args']].values.tolist()
+    scripts = [s[0] for s in steps]
+    if LAST_STEP in scripts:
+        steps = steps[:len(scripts) - scripts[::-1].index(LAST_STEP)]
+
+    # The diet model (pipe_b) isn't rerun by scenarios
+    dm_scripts = ['diet_model_baseline'] + load_params_sheet('dm_pipeline')['diet_model'].tolist()
+    for script in dm_scripts:
+        if scan_params(script)[1] & set(parameters):
+            raise ValueError('Scenarios can\'t vary parameters used by the diet model: ' + script)
+
+    affected = []
+    written = set()
+    for script, args in steps:
+        inputs, outputs = scan_io(script)
+        if (scan_params(script)[1] & set(parameters)) or (inputs & written):
+            affected.append([script, args])
+            written |= outputs
+
+    return affected
+
+
+def shared_artifacts(steps):
+    # Files read by the affected steps that none of them write; these come from the pipeline's own data folders
+
+    inputs, outputs = set(), set()
+    for script, _ in steps:
+        i, o = scan_io(script)
+        inputs |= i
+        outputs |= o
+    return sorted(k for k in inputs - outputs if k.split('/')[0] in SCENARIO_ROOTS)
+
+
+def link_file(src, dst):
+    # Hard link a shared file into a scenario folder (no copy of the data), or copy it if links aren't supported
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def scenario_dir(scenario_id):
+    return paths.scenarios / scenario_id
+
+
+def set_up_scenario(scenario_id, steps, shared):
+    # Create a scenario's data folders w/links to the shared files its steps read, and the folders they write to
+
+    root = scenario_dir(scenario_id)
+    for key in shared:
+        files = [f for f in artifact_files(key) if f.exists()]
+        if len(files) == 0:
+            raise FileNotFoundError('Shared input ' + key + ' not found; run the pipeline before running scenarios')
+        for f in files:
+            dst = root / key if f.suffix == resolve_path(key).suffix else (root / key).with_suffix(f.suffix)
+            if f.is_dir():
+                for src in sorted(p for p in f.rglob('*') if p.is_file()):
+                    link_file(src, dst / src.relative_to(f))
+            else:
+                link_file(f, dst)
+
+    # Parsed parameter workbooks, so scenarios don't parse them again (see utilities_params)
+    if (paths.interim / CACHE_FILE).exists():
+        link_file(paths.interim / CACHE_FILE, root / 'interim' / CACHE_FILE)
+
+    for script, _ in steps:
+        for key in scan_io(script)[1]:
+            if key.split('/')[0] in SCENARIO_ROOTS:
+                path = root / key
+                (path.parent if path.suffix else path).mkdir(parents=True, exist_ok=True)
+
+
+def run_scenario(scenario_id, overrides, steps):
+    # Run the affected steps for one scenario, in its own data folders, usually in a worker process.
+    # Returns the time and memory records of its steps (see pipeline_profile)
+
+    root = scenario_dir(scenario_id)
+    data_roots = {name: getattr(paths, name) for name in SCENARIO_ROOTS}
+    for name in SCENARIO_ROOTS:
+        setattr(paths, name, root / name)
+    set_param_overrides(overrides)
+
+    print('\nRunning scenario', scenario_id)
+    pipeline_profile.records.clear()
+    try:
+        for step in steps:
+            import_run(step)
+        pipeline_profile.save_manifest({'scenario_id': scenario_id, **overrides})
+    finally:
+        # Restore the pipeline's own folders and parameters, e.g., when scenarios run in the main process
+        for name, path in data_roots.items():
+            setattr(paths, name, path)
+        set_param_overrides({})
+
+    return [dict(r, scenario_id=scenario_id) for r in pipeline_profile.records]
+
+
+def combine_scenarios(scenarios):
+    # Combine result tables from all scenarios into a single long table:
+    # scenario_id, scenario parameters, table, the columns identifying each row, measure, value
+
+    results = []
+    for scenario_id, overrides in scenarios.items():
+        for file, index_cols in RESULTS.items():
+            df = read_df(scenario_dir(scenario_id) / 'output' / file)
+            value_cols = [c for c in df.select_dtypes('number').columns if c not in index_cols]
+            df = df.melt(id_vars=index_cols, value_vars=value_cols, var_name='measure', value_name='scenario_value')\
+                .rename(columns={'scenario_value': 'value'})
+            df.insert(0, 'table', file.replace('.csv', ''))
+            for i, (parameter, value) in enumerate(overrides.items()):
+                df.insert(i, parameter, value)
+            df.insert(0, 'scenario_id', scenario_id)
+            results.append(df)
+
+    index_cols = list(dict.fromkeys(c for cols in RESULTS.values() for c in cols))
+    results = pd.concat(results, ignore_index=True)
+    first_cols = ['scenario_id'] + list(next(iter(scenarios.values())).keys()) + ['table']
+    return results[first_cols + index_cols + ['measure', 'value']]
+
+
+# Main method
+def pipeline_scenarios(grid=GRID, n_workers=N_WORKERS):
+
+    scenarios = scenario_grid(grid)
+    steps = affected_steps(list(grid.keys()))
+    shared = shared_artifacts(steps)
+    print('Running', len(scenarios), 'scenarios of', len(steps), 'steps each on up to', n_workers, 'workers:',
+          [s[0] + s[1] for s in steps])
+
+    for scenario_id in scenarios:
+        set_up_scenario(scenario_id, steps, shared)
+
+    records = []
+    if n_workers <= 1:
+        for scenario_id, overrides in scenarios.items():
+            records += run_scenario(scenario_id, overrides, steps)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker) as executor:
+            futures = [executor.submit(run_scenario, scenario_id, overrides, steps)
+                       for scenario_id, overrides in scenarios.items()]
+            for future in futures:
+                records += future.result()
+
+    # Scenario definitions, results, and the time and memory used by each scenario's steps
+    pd.DataFrame([{'scenario_id': s, **o} for s, o in scenarios.items()]) \
+        .to_csv(paths.scenarios / 'scenarios.csv', index=False)
+    save_df(combine_scenarios(scenarios), paths.scenarios / 'scenario_results.csv')
+    pd.DataFrame(records).to_csv(paths.scenarios / 'scenario_manifest.csv', index=False)
+
+
+if __name__ == '__main__':
+    pipeline_scenarios()
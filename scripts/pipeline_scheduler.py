@@ -0,0 +1,287 @@
+import os
+import re
+import importlib
+import paths
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from utilities_alerts import save_alerts, send_alert
+import pipeline_profile
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+# Set in pipeline worker processes, so steps that start their own worker processes (e.g., diet_footprints_bootstrap)
+# run in a single process instead, rather than multiplying the number of processes
+WORKER_VAR = 'PIPELINE_WORKER'
+
+# Functions that read or write files; used when scanning scripts for their inputs and outputs
+READ_FUNCS = ['read_csv', 'read_excel', 'read_df', 'read_faostat']
+WRITE_FUNCS = ['to_csv', 'save_df']
+
+# Path expressions passed to the functions above, e.g.,
+#   paths.interim/'fao_countries.csv', paths.input / "fao/item_production/crops_primary.csv",
+#   paths.interim/file (where file = '...csv' is assigned elsewhere in the script), paths.params,
+#   or a relative path such as '../data/output/diet_footprints_by_country_diet.csv'
+PATH_EXPR = r'''(?:paths\.(?P<root>\w+)(?:\s*/\s*(?:(?P<q>['"])(?P<file>.+?)(?P=q)|(?P<var>\w+)))?''' \
+            r'''|(?P<q2>['"])\.\./data/(?P<rel>.+?)(?P=q2))'''
+
+# File-name variables assigned in scripts, e.g., file = 'item_footprints/item_footprints_abx_meat.csv'
+VAR_ASSIGN = r'''(\w+)\s*=\s*(['"])([^'"]+\.(?:csv|xlsx))\2'''
+
+# Folder variables assigned in scripts, e.g., FILE_PATH = paths.figures / 'sankey', and files in them,
+# e.g., FILE_PATH / 'sankey.csv'
+DIR_ASSIGN = r'''^(\w+)\s*=\s*paths\.(\w+)\s*/\s*(['"])([^'"]+)\3\s*$'''
+DIR_FILE = r'''(\w+)\s*/\s*(['"])([^'"]+)\2'''
+
+# Commented-out code (line comments and triple-quoted blocks) is ignored when scanning
+COMMENTS = r'''""".*?"""|#[^\n]*'''
+
+# Keyword argument names, e.g., path= in save_df(df, path=paths.interim/'...'), are skipped when looking for paths
+KEYWORD = r'''\w+\s*=(?!=)\s*'''
+
+# Run parameter loaders (see utilities_params) and the workbooks they read
+PARAM_FUNCS = {'load_run_params': 'params', 'load_params_sheet': 'params', 'get_param': 'params',
+               'load_item_params': 'input/item_parameters.xlsx'}
+
+# Inputs and outputs that can't be found by scanning, e.g., file names built from run parameters.
+# Directories are treated as a single input/output.
+EXTRA_IO = {
+    'fao_fbs': {'inputs': ['input/fao/food_balance_sheets'], 'outputs': []},
+    'trade_matrix_fao': {'inputs': ['input/fao/trade_matrices', 'interim/fao_trade_store'],
+                         'outputs': ['interim/fao_trade_store']},
+    'fao_trade_store': {'inputs': ['input/fao/trade_matrices'], 'outputs': ['interim/fao_trade_store']},
+    # Diet model files are listed in the dm_pipeline sheet; they're written and read within the diet_model stage,
+    # see pipeline.stage_io
+    'pipeline': {'inputs': [], 'outputs': []},
+}
+
+
+# Calls already alerted on, as (script, line), so each is only reported once per process
+unresolved = set()
+
+
+def init_worker():
+    # Initializer for pipeline worker processes
+    os.environ[WORKER_VAR] = 'yes'
+
+
+def in_worker():
+    return os.environ.get(WORKER_VAR, 'no') == 'yes'
+
+
+def normalize_path(root, file=''):
+    # Convert a path expression to a key that is comparable across scripts, e.g., 'interim/fao_countries.csv'
+
+    if file == '':
+        return root
+    file = re.sub('/+', '/', file.replace('\\', '/')).strip('/')
+    return root + '/' + file
+
+
+def call_args(source, start):
+    # Top-level arguments of the function call whose opening parenthesis ends at start, as a list of strings
+
+    args, depth, quote, arg_start = [], 0, None, start
+    for i in range(start, len(source)):
+        c = source[i]
+        if quote is not None:
+            if c == quote and source[i - 1] != '\\':
+                quote = None
+        elif c in '\'"':
+            quote = c
+        elif c in '([{':
+            depth += 1
+        elif c in ')]}' and depth > 0:
+            depth -= 1
+        elif c in ',)' and depth == 0:
+            args.append(source[arg_start:i].strip())
+            if c == ')':
+                break
+            arg_start = i + 1
+    return args
+
+
+def scan_io(script):
+    # Scan a script's source code for the files it reads and writes.
+    # Returns two sets of normalized paths: (inputs, outputs).
+    # Scanning is static, so a script that chooses between files based on its arguments
+    # (e.g., production_system='intensive') is treated as reading and writing all of them;
+    # this is conservative, i.e., it may add a dependency between steps.
+    # Calls whose file can't be found (e.g., a path built from run parameters) raise a scan alert,
+    # since a step that depends on that file might then run too early; such files are listed in EXTRA_IO.
+
+    source = (SCRIPTS_DIR / (script + '.py')).read_text(encoding='utf-8')
+    source = re.sub(COMMENTS, '', source, flags=re.DOTALL)
+
+    # The same variable may be assigned different file names in different branches; keep all of them
+    variables = {}
+    for m in re.finditer(VAR_ASSIGN, source):
+        variables.setdefault(m.group(1), set()).add(m.group(3))
+    dirs = {m.group(1): normalize_path(m.group(2), m.group(4)) for m in re.finditer(DIR_ASSIGN, source, flags=re.M)}
+
+    def resolve(arg):
+        # Normalized paths an argument refers to, or None if it isn't a path expression; paths in a variable
+        # that's not assigned a file name in the script resolve to the folder only, and are returned w/False
+        arg = re.sub('^' + KEYWORD, '', arg)
+        d = re.match(DIR_FILE, arg)
+        if d is not None and d.group(1) in dirs:
+            return {normalize_path(dirs[d.group(1)], d.group(3))}, True
+        m = re.match(PATH_EXPR, arg)
+        if m is None:
+            return None
+        if m.group('rel') is not None:
+            return {normalize_path(*m.group('rel').split('/', 1))}, True
+        if m.group('file') is not None:
+            return {normalize_path(m.group('root'), m.group('file'))}, True
+        if m.group('var') is not None:
+            if m.group('var') in variables:
+                return {normalize_path(m.group('root'), f) for f in variables[m.group('var')]}, True
+            return {normalize_path(m.group('root'))}, False
+        return {normalize_path(m.group('root'))}, True
+
+    def find(funcs):
+        found = set()
+        # The path may be any argument, e.g., save_df(dm[cols], paths.interim/'...'), so each argument is checked
+        for call in re.finditer(r'\b(?:' + '|'.join(funcs) + r')\(', source):
+            paths_found, resolved = set(), False
+            for arg in call_args(source, call.end()):
+                r = resolve(arg)
+                if r is not None:
+                    paths_found, resolved = r
+                    break
+            found |= paths_found
+            if not resolved and script not in EXTRA_IO:
+                # e.g., a path built from run parameters; list the file in EXTRA_IO so the step's dependencies are complete
+                line = source[call.start():].split('\n', 1)[0].strip()
+                if (script, line) not in unresolved:
+                    unresolved.add((script, line))
+                    send_alert('scan', 'SCAN ALERT: Could not find the file read or written by', script + ':', line)
+        return found
+
+    inputs = find(READ_FUNCS)
+    outputs = find(WRITE_FUNCS)
+
+    for func, file in PARAM_FUNCS.items():
+        if re.search(r'\b' + func + r'\w*\(', source):
+            inputs.add(file)
+
+    if script in EXTRA_IO:
+        inputs |= set(EXTRA_IO[script]['inputs'])
+        outputs |= set(EXTRA_IO[script]['outputs'])
+
+    return inputs, outputs
+
+
+def build_dag(steps):
+    # Given a list of [script, args] steps in pipeline order, return a dict of {step index: set of step indices}
+    # listing the earlier steps each step must wait for. A step depends on an earlier step if it:
+    # reads a file the earlier step writes, writes a file the earlier step writes,
+    # or writes a file the earlier step reads (so the earlier step doesn't read a file that's already been replaced).
+    # Steps that share no files can run at the same time.
+
+    io = {}
+    for script in set(s[0] for s in steps):
+        io[script] = scan_io(script)
+
+    deps = {}
+    for j, (script_j, args_j) in enumerate(steps):
+        inputs_j, outputs_j = io[script_j]
+        deps[j] = set()
+        for i in range(j):
+            inputs_i, outputs_i = io[steps[i][0]]
+            if (outputs_i & inputs_j) or (outputs_i & outputs_j) or (inputs_i & outputs_j):
+                deps[j].add(i)
+
+    return deps
+
+
+def import_run(script_args, kind='step'):
+    # Import and run a pipeline script, e.g., ['item_footprints_gleam', "(production_system='intensive')"].
+    # Returns the step's record of time, memory, and rows/bytes read and written (see pipeline_profile)
+
+    script = script_args[0]
+    args = script_args[1]
+    print('\n*****************************************************************************************************')
+    print('Running:', script, args, '\n')
+    module = importlib.import_module(script)
+    step_name = pipeline_profile.step_name(script_args)
+    with pipeline_profile.measure(step_name, kind) as record:
+        eval(script + args, {script: getattr(module, script)})
+
+    # Save any alerts raised by the step (see utilities_alerts)
+    save_alerts(paths.diagnostic / 'alerts' / (step_name + '.csv'))
+
+    return record
+
+
+def run_dag(steps, n_workers=1, cache=None):
+    # Run a list of [script, args] steps, running steps that don't depend on each other in parallel.
+    # With n_workers=1, steps run one after another in the current process, in pipeline order.
+    # If a cache is provided (see pipeline_cache.load_cache), steps whose code, inputs, and run parameters
+    # are unchanged since the last run are skipped and their existing outputs are reused.
+
+    if cache is not None:
+        import pipeline_cache
+
+    def reuse(step):
+        # Check the cache; if the step can't be reused, return a function that records the step once it's done
+        if cache is None:
+            return False, None
+        cached, key = pipeline_cache.check_step(cache, step)
+        if cached:
+            print('\nReusing cached outputs:', step[0] + step[1])
+            pipeline_profile.record_cached(pipeline_profile.step_name(step))
+            return True, None
+        snapshot = pipeline_cache.snapshot_outputs(step)
+        return False, lambda: pipeline_cache.record_step(cache, step, key, snapshot)
+
+    steps = [list(s) for s in steps]
+
+    if n_workers <= 1 or len(steps) <= 1:
+        for step in steps:
+            cached, record = reuse(step)
+            if not cached:
+                import_run(step)
+                if record is not None:
+                    record()
+        return
+
+    deps = build_dag(steps)
+    # Save scan alerts here, so worker processes don't start w/a copy of them
+    save_alerts(paths.diagnostic / 'alerts' / 'pipeline_scan.csv')
+    print('\nRunning', len(steps), 'pipeline steps on up to', n_workers, 'workers')
+    for j, step in enumerate(steps):
+        if len(deps[j]) > 0:
+            print(step[0] + step[1], 'waits for:', [steps[i][0] + steps[i][1] for i in sorted(deps[j])])
+
+    done = set()
+    running = {}
+    records = {}
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker) as executor:
+        while len(done) < len(steps):
+
+            # Submit every step whose dependencies are complete, in pipeline order;
+            # cached steps complete immediately, which may free up steps later in the list, so repeat until none are left
+            submitted = True
+            while submitted:
+                submitted = False
+                for j, step in enumerate(steps):
+                    if j not in done and j not in running.values() and deps[j] <= done:
+                        cached, records[j] = reuse(step)
+                        if cached:
+                            done.add(j)
+                        else:
+                            running[executor.submit(import_run, step)] = j
+                        submitted = True
+
+            if len(running) == 0:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                j = running.pop(future)
+                # Re-raises any exception from the step; remaining steps are cancelled when the executor closes.
+                # The step's record is kept here, since records added in the worker process are lost
+                pipeline_profile.records.append(future.result())
+                if records[j] is not None:
+                    records[j]()
+                done.add(j)
@@ -3,6 +3,7 @@ import numpy as np
 import paths
 from utilities import *
 from utilities_diet_climate import *
+from utilities_io import read_df
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -121,7 +122,7 @@ def group_by_diet(fp, population):
 
     # Weighted avg
     fp = fp.merge(population, on='country_code', how='left')
-    fp_wavg = fp.groupby(index_cols).apply(wavg, 'value', 'population').rename('w_avg')
+    fp_wavg = grouped_wavg(fp, index_cols, 'value', 'population', zero_weight_mean=False).rename('w_avg')
 
     # Concat
     fp = pd.concat([fp_centile_25, fp_centile_50, fp_centile_75, fp_wavg], axis=1).reset_index()
@@ -137,7 +138,7 @@ def results_combine():
 
     # Input ************************************************************************************************************
 
-    fp_by_coo = pd.read_csv(paths.output/'by_coo_only/diet_footprints_by_origin_diet_item.csv')
+    fp_by_coo = read_df(paths.output/'by_coo_only/diet_footprints_by_origin_diet_item.csv')
     fp_bootstrap = pd.read_csv(paths.interim/'diet_footprints_bootstrap.csv').pipe(snake_case_cols)
     population = pd.read_csv(paths.interim/'fao_population.csv')
     countries = pd.read_csv(paths.interim/'fao_countries.csv')[['country_code', 'country'] + COUNTRY_VARS]
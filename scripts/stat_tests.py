@@ -2,7 +2,6 @@ import numpy as np
 import pandas as pd
 import math
 import paths
-import winsound
 from utilities import *
 from utilities_stats import *
 
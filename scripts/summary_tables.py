@@ -1,11 +1,12 @@
 import numpy as np
 import pandas as pd
+import paths
 from utilities import *
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
 
-OUTPUT_PATH = '../data/output/summary_tables/'
+OUTPUT_PATH = paths.output / 'summary_tables'
 
 def summarize_by_group(df, attributes=[], groupby=''):
 # Generate table of summary statistics by group
@@ -39,10 +40,10 @@ def summary_tables():
     # Input ****************************************************************************************************************
 
     # diet footprints by scenario
-    df = pd.read_csv('../data/output/diet_footprints_by_country_diet.csv')
+    df = pd.read_csv(paths.output / 'diet_footprints_by_country_diet.csv')
 
     # item footprints
-    fp = pd.read_csv('../data/output/per_kg_edible_wt_footprints_by_species.csv')[['item', 'footprint_type', 'footprint']]
+    fp = pd.read_csv(paths.output / 'per_kg_edible_wt_footprints_by_species.csv')[['item', 'footprint_type', 'footprint']]
 
     # **********************************************************************************************************************
 
@@ -55,14 +56,14 @@ def summary_tables():
     # Summarize by scenario
     summarize_by_group(df[['scenario', 'footprint_type', 'footprint']],groupby=['scenario', 'footprint_type']) \
         .sort_values(by=['footprint_type', 'scenario']) \
-        .to_csv(OUTPUT_PATH + 'diet_footprints_by_scenario_summary.csv', index=False)
+        .to_csv(OUTPUT_PATH / 'diet_footprints_by_scenario_summary.csv', index=False)
 
     # Summarize by income class
     s_filter(df, col='scenario', list=['baseline'])[['income_group', 'footprint_type', 'footprint']] \
         .pipe(summarize_by_group, groupby=['income_group', 'footprint_type']) \
         .sort_values(by=['footprint_type', 'income_group']) \
-        .to_csv(OUTPUT_PATH + 'diet_footprints_by_income_summary.csv', index=False)
+        .to_csv(OUTPUT_PATH / 'diet_footprints_by_income_summary.csv', index=False)
 
     # Item footprints
     fp = summarize_by_group(fp, groupby=['item', 'footprint_type']).sort_values(by=['item', 'footprint_type'])
-    fp.to_csv(OUTPUT_PATH + 'per_kg_edible_wt_footprints_summary.csv', index=False)
+    fp.to_csv(OUTPUT_PATH / 'per_kg_edible_wt_footprints_summary.csv', index=False)
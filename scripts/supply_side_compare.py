@@ -3,7 +3,6 @@ import pandas as pd
 import gc # Garbage collection module, to save memory
 import math
 import paths
-import winsound
 from datetime import datetime
 from utilities_figs import *
 from utilities import *
@@ -34,7 +33,7 @@ def line_plot(df):
     #ax.set_xticks(df[x].values[::2])
     #ax.set_xticklabels(x[::2], rotation=45)
 
-    show_save_plot(show=SHOW_FIGS, path='../figures/', filename='abx_supply_side_compare')
+    show_save_plot(show=SHOW_FIGS, path=paths.figures, filename='abx_supply_side_compare')
 
 
 # Main method
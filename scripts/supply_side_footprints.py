@@ -2,10 +2,11 @@ import numpy as np
 import pandas as pd
 import gc # Garbage collection module, to save memory
 import paths
-import winsound
 from datetime import datetime
 from utilities import *
 from utilities_diet_climate import *
+from utilities_io import read_df
+from utilities_params import load_item_params
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -67,13 +68,13 @@ def supply_side_footprints():
     fbs = pd.read_csv(paths.interim/'fao_fbs_avg_loss_unadj.csv')[
         ['country_code', 'country', 'fbs_item_code', 'fbs_item', 'production_1000_mt', 'exports_1000_mt']]
 
-    fp = pd.read_csv(paths.interim/'item_footprints/item_footprints_by_coo.csv')[
+    fp = read_df(paths.interim/'item_footprints/item_footprints_by_coo.csv')[
         ['country_code', 'country', 'fbs_item_code', 'fbs_item', 'footprint_type', 'footprint']]
 
-    item_params = pd.read_excel(paths.input / 'item_parameters.xlsx', sheet_name='fbs_items').pipe(snake_case_cols)[
+    item_params = load_item_params().pipe(snake_case_cols)[
         ['fbs_item_code', 'fbs_item', 'type', 'output_group', 'include_in_model']]
 
-    diet_fp = pd.read_csv(paths.output / 'by_coo_only/diet_footprints_by_origin_diet_item.csv')[
+    diet_fp = read_df(paths.output / 'by_coo_only/diet_footprints_by_origin_diet_item.csv')[
         ['income_class', 'country_code', 'country', 'origin', 'diet', 'fbs_item_code', 'fbs_item', 'footprint_type', 'diet_footprint_whole_pop']]
 
     countries = pd.read_csv(paths.interim /'fao_countries.csv')[
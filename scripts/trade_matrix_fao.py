@@ -4,6 +4,8 @@ import numpy as np
 import paths
 from datetime import datetime
 from utilities import *
+from utilities_params import load_item_params, get_param_years
+from fao_trade_store import load_trade_matrix
 
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
@@ -33,42 +35,25 @@ def trade_matrix_fao():
 
     # Input ************************************************************************************************************
 
-    run_params = pd.read_excel(paths.params, sheet_name='parameters', skiprows=1).set_index('parameter')
-
-    """
-    # Filter raw trade matrix file to imports only so we don't need to load the entire thing every time.
-    # This is commented out because it only needs to be executed once after downloading new trade matrix data.
-    tm_raw = pd.read_csv('../data/input/fao/' + fao_folder + '/fao_trade_matrix_all_data_normalized.csv',  encoding='latin-1').pipe(snake_case_cols)
-    tm_raw = tm_raw[tm_raw['element'] == 'Import Quantity']
-    tm_raw = tm_raw[tm_raw['year'] >= 2011]
-    tm_raw.to_csv('../data/input/fao/' + fao_folder + '/fao_imports.csv', index=False)
-    """
-
     extr_rates = (pd.read_csv(paths.interim / 'fao_extraction_rates.csv')
         [['country_code', 'fao_item_code', 'extr_rate_mt/mt']])
     extr_rates_world = (pd.read_csv(paths.interim / 'fao_extraction_rates_world.csv')
         [['fao_item_code', 'extr_rate_world_mt/mt']])
     fao_to_fbs = (pd.read_excel(paths.input / 'fao_items_to_fbs.xlsx', sheet_name='final_appended')
         [['fao_item_code', 'fbs_item_code']])
-    item_params = (pd.read_excel(paths.input / 'item_parameters.xlsx', sheet_name='fbs_items')
+    item_params = (load_item_params()
         .pipe(snake_case_cols)
         [['fbs_item_code', 'fbs_item', 'ignore_extraction_rate']])
 
-    tm = pd.concat([
-        pd.read_csv(paths.input/'fao/trade_matrices/fao_imports_2016.csv'),
-        pd.read_csv(paths.input / 'fao/trade_matrices/fao_imports_2017.csv'),
-        pd.read_csv(paths.input / 'fao/trade_matrices/fao_imports_2018.csv'),
-        pd.read_csv(paths.input / 'fao/trade_matrices/fao_imports_2019.csv')], sort=False)
+    # Imports in tonnes for the selected years only; raw FAOSTAT downloads are converted to a store
+    # of yearly files the first time they're used, see fao_trade_store
+    fao_years = get_param_years('fao_data_years')
+    tm = load_trade_matrix(fao_years, element='Import Quantity', unit='tonnes')
 
-
-    # Filter to selected years *****************************************************************************************
+    # Filter columns ***************************************************************************************************
 
     tm = rename_filter_cols(tm)
 
-    fao_years = run_params.loc['fao_data_years', 'value']
-    fao_years = string_to_int_list(fao_years)
-    tm = tm[tm['year'].isin(fao_years)]
-
     # Compute average over years ***************************************************************************************
 
     index_cols = ['country_code', 'country', 'coo_code', 'coo', 'item_code', 'item', 'unit']
@@ -1,8 +1,15 @@
 import numpy as np
 import pandas as pd
-import winsound
+import os
+from utilities_alerts import send_alert, send_error
+from utilities_validation import check_duplicate_indices, check_nan_values, run_checks
 pd.options.display.width = 250
 
+# Checking merges for missing indices takes time (see s_merge); for trusted production runs,
+# set the PIPELINE_MERGE_DIAGNOSTICS environment variable to 'no' to skip the checks.
+MERGE_DIAGNOSTICS = os.environ.get('PIPELINE_MERGE_DIAGNOSTICS', 'yes') != 'no'
+
+
 def snake_case(s):
     return s.lower().replace(' ', '_').replace(',', '').replace('(', '').replace(')', '')
 
@@ -28,37 +35,6 @@ def undo_snake_case_series(ser):
     return pd.Series([undo_snake_case(str(s)) for s in ser])
 
 
-def check_duplicate_indices(df, index_cols):
-    # Check for duplicate indices
-
-    df_check = df.copy().set_index(index_cols)
-    dupes = df_check[df_check.index.duplicated(keep=False)]
-
-    if len(dupes) > 0:
-        winsound.Beep(400, 400)
-        print('ERROR: DUPLICATE INDICES FOUND:', dupes)
-        return True
-    else:
-        return False
-
-
-def check_nan_values(df, cols):
-    # Check for NAN values in columns - important, for example, before grouping by those columns
-    for col in cols:
-        if df[col].isna().any():
-            winsound.Beep(400, 700)
-            print('ERROR: NAN VALUE IN COLUMN:', df[df[col].isna()][cols])
-
-"""
-def check_nan_values(df, cols):
-    # Check for NAN values in columns - important, for example, before grouping by those columns
-    nan_found = df[cols].isnull().values.any()
-    print('\nChecking for NAN values in columns (should be false):', nan_found)
-    if (nan_found):
-        print('NAN VALUE FOUND')
-"""
-
-
 def choose_first_notna(df, default_value):
     # Given a df, return a series w/the first values from each row, from L-R, that is not NAN.
     # If all columns are NAN in a given row, use the default value.
@@ -155,14 +131,12 @@ def s_categorical_sort(df, col, sort_order, dtype='str'):
     # DIAGNOSTIC CHECK: check if any values in column are not in sort list are in column
     for c in df[col].drop_duplicates():
         if (c not in sort_order):
-            print('ALERT: value in column not found in sort list:', c, 'not found in', sort_order)
-            winsound.Beep(400, 400)
+            send_alert('sort', 'ALERT: value in column not found in sort list:', c, 'not found in', sort_order)
 
     # DIAGNOSTIC CHECK: make sure values in sort list are in column
     for l in sort_order:
         if (l not in df[col].values):
-            print('ALERT: value in sort list not found in column:', l, 'not found in', col)
-            winsound.Beep(400, 400)
+            send_alert('sort', 'ALERT: value in sort list not found in column:', l, 'not found in', col)
 
     # Sort
     df[col] = pd.Categorical(df[col], sort_order)
@@ -180,8 +154,7 @@ def s_filter(df, col, list=[], substring='', excl_list=[], excl_str='', alert=Tr
 # Returns error if a list item or the substring not found in column
 
     if not isinstance(col, str):
-        print('ALERT: columns passed to s_filter not as a string, may result in unexpected results:', col)
-        winsound.Beep(400,400)
+        send_alert('filter', 'ALERT: columns passed to s_filter not as a string, may result in unexpected results:', col)
 
     # Filter using list of values
     if len(list) > 0:
@@ -191,16 +164,14 @@ def s_filter(df, col, list=[], substring='', excl_list=[], excl_str='', alert=Tr
         if alert:
             for l in list:
                 if (l not in df[col].values):
-                    print('ALERT: value to filter on not found in column:', l, 'not found in', col)
-                    winsound.Beep(400, 400)
+                    send_alert('filter', 'ALERT: value to filter on not found in column:', l, 'not found in', col)
 
     # Filter using substring
     if substring != '':
         df = df[df[col].str.contains(substring)]
 
         if ~(df[col].str.contains(substring).any()):
-            print('ALERT: substring to filter on not found in column:', substring, 'not found in', col)
-            winsound.Beep(400, 400)
+            send_alert('filter', 'ALERT: substring to filter on not found in column:', substring, 'not found in', col)
 
     # Exclude vales with exclusion list
     if len(excl_list) > 0:
@@ -223,7 +194,49 @@ def s_filter_percentile(df, col, pct):
     return(df)
 
 
-def s_merge(df1, df2, how, on='', left_on='', right_on='', alert=True, beep=True, validate='m:m',
+def missing_keys(df1, df2, left_on, right_on):
+# Unique keys in df1[left_on] that are not in df2[right_on]; NaN keys match each other, as in pd.merge
+
+    left_on = left_on if isinstance(left_on, list) else [left_on]
+    right_on = right_on if isinstance(right_on, list) else [right_on]
+    keys = df1[left_on].drop_duplicates()
+    if len(left_on) > 1:
+        found = pd.MultiIndex.from_frame(keys).isin(pd.MultiIndex.from_frame(df2[right_on].drop_duplicates()))
+    else:
+        found = keys[left_on[0]].isin(df2[right_on[0]].drop_duplicates())
+    return keys[~found]
+
+
+def categorize_keys(df1, df2, left_on, right_on):
+# Convert merge keys on both sides to the same categorical dtype, so pandas can join on integer codes.
+# Keys that are already categoricals w/the same categories on both sides (see utilities_dimensions) are left as is.
+
+    left_on = left_on if isinstance(left_on, list) else [left_on]
+    right_on = right_on if isinstance(right_on, list) else [right_on]
+    df1 = df1.copy(deep=False)
+    df2 = df2.copy(deep=False)
+    for l, r in zip(left_on, right_on):
+        if isinstance(df1[l].dtype, pd.CategoricalDtype) and df1[l].dtype == df2[r].dtype:
+            continue
+        categories = pd.Index(pd.concat([df1[l].astype(object), df2[r].astype(object)], ignore_index=True)
+                              .dropna().unique())
+        try:
+            categories = categories.sort_values()
+        except TypeError:
+            pass  # mixed types, e.g., strings and numbers, can't be sorted
+        dtype = pd.CategoricalDtype(categories)
+        df1[l] = df1[l].astype(dtype)
+        df2[r] = df2[r].astype(dtype)
+    return df1, df2
+
+
+def has_categorical_keys(df1, df2, left_on, right_on):
+    left_on = left_on if isinstance(left_on, list) else [left_on]
+    right_on = right_on if isinstance(right_on, list) else [right_on]
+    return any(isinstance(df[c].dtype, pd.CategoricalDtype) for df, cols in [(df1, left_on), (df2, right_on)] for c in cols)
+
+
+def s_merge(df1, df2, how, on='', left_on='', right_on='', alert=True, validate='m:m',
             left_name='left_df', right_name='right_df', exit_on_alert=False, keep_merge_col=False,
             drop_duplicate_cols=True, filename=''):
 # "Smart merge" two dataframes.
@@ -231,52 +244,63 @@ def s_merge(df1, df2, how, on='', left_on='', right_on='', alert=True, beep=True
 # Raises an alert if indices are missing in either dataframe.
 # Note that validate='m:m' does not perform any checks on merge,
 # just as 'm:1' does not check the left side and '1:m' does not check the right.
+# Missing indices are found by comparing the unique keys of each dataframe before merging,
+# and only for the sides that can be missing given "how" (e.g., only the left side for how='left').
+# Alerts are recorded with utilities_alerts.send_alert; set MERGE_DIAGNOSTICS to 'no' to skip these checks entirely.
+# If a key is categorical on either side, keys on both sides are converted to the same categoricals first,
+# so categorical keys are never merged as strings; they stay categorical in the result.
 
     # If left_on/right_on are not provided, use "on" value for both left and right
     if left_on=='':
         left_on=on
         right_on=on
 
+    # Check for missing indices before merging
+    if alert and MERGE_DIAGNOSTICS:
+
+        if how in ['left', 'outer']:
+            missing_left = missing_keys(df1, df2, left_on, right_on)
+            if len(missing_left) > 0:
+                merge_alert(missing_left, 'left', left_name, right_name, filename, exit_on_alert)
+
+        if how in ['right', 'outer']:
+            missing_right = missing_keys(df2, df1, right_on, left_on)
+            if len(missing_right) > 0:
+                merge_alert(missing_right, 'right', right_name, left_name, filename, exit_on_alert)
+
+    if has_categorical_keys(df1, df2, left_on, right_on):
+        df1, df2 = categorize_keys(df1, df2, left_on, right_on)
+
+    # The _merge indicator is only needed if it's being kept
     df = df1.merge(df2, left_on=left_on, right_on=right_on, how=how, suffixes=('', '_x'),
-                   indicator=True, validate=validate)
-
-    # Beep and print missing matches
-    if alert:
-
-        if df['_merge'].str.contains('left_only').any():
-            print('MERGE ALERT: Index in', left_name,'(left) not found in', right_name, '(right)')
-            missing_left = df[df['_merge'] == 'left_only'][left_on].drop_duplicates()
-            print(missing_left)
-            if filename != '':
-                missing_left.to_csv(filename + '_left.csv')
-            if beep:
-                winsound.Beep(400, 700)
-            if exit_on_alert:
-                quit()
-
-        if df['_merge'].str.contains('right_only').any():
-            print('MERGE ALERT: Index in', right_name, '(right) not found in', left_name, '(left)')
-            missing_right = df[df['_merge'] == 'right_only'][right_on].drop_duplicates()
-            print(missing_right)
-            if filename != '':
-                missing_right.to_csv(filename + '_left.csv')
-            if beep:
-                winsound.Beep(400, 700)
-            if exit_on_alert:
-                quit()
-
-    # Drop merge col unless indicated otherwise;
-    # Sometimes it can be helpful to see whether _merge = left, right, or both
-    if keep_merge_col==False:
-        df.drop(columns=['_merge'], inplace=True)
-
-    # Drop duplicate cols created during merge
+                   indicator=keep_merge_col, validate=validate)
+
+    # Drop duplicate cols created during merge, i.e., right-side columns renamed with the '_x' suffix
     if drop_duplicate_cols:
-        df.drop(columns=list(df.filter(regex='_x')), inplace=True)
+        duplicate_cols = [col + '_x' for col in df2.columns
+                          if col + '_x' in df.columns and col + '_x' not in df1.columns and col + '_x' not in df2.columns]
+        df.drop(columns=duplicate_cols, inplace=True)
 
     return df
 
 
+def merge_alert(missing, side, name, other_name, filename, exit_on_alert):
+# Alert on indices in one side of a merge (name) that were not found in the other side (other_name)
+
+    other_side = 'right' if side == 'left' else 'left'
+    send_alert('merge', 'MERGE ALERT: Index in', name, '(' + side + ') not found in', other_name, '(' + other_side + '):',
+          len(missing), 'unique keys, e.g.,', missing.head(5).to_dict('records'),
+          data={'left_name': name if side == 'left' else other_name,
+                'right_name': other_name if side == 'left' else name,
+                'missing_from': other_side,
+                'n_missing_keys': len(missing),
+                'missing_keys': missing.to_dict('records')})
+    if filename != '':
+        missing.to_csv(filename + '_' + side + '.csv')
+    if exit_on_alert:
+        quit()
+
+
 def s_merge_rename(df, new_names, col='', left_col='', right_col='', new_name_col='new_name', alert=True):
 # Merge w/dataframe on col, rename values in col to values in new_name_col
 
@@ -339,12 +363,10 @@ def wavg(group, avg_name, weight_name, alerts=True):
 
     if alerts:
         if d.isnull().values.any():
-            print('Warning: weighted average utility function encountered null value(s) in data!')
-            winsound.Beep(400, 400)
+            send_alert('wavg', 'Warning: weighted average utility function encountered null value(s) in data!')
 
         if w.isnull().values.any():
-            print('Warning: weighted average utility function encountered null value(s) in weights!')
-            winsound.Beep(400, 400)
+            send_alert('wavg', 'Warning: weighted average utility function encountered null value(s) in weights!')
 
     try:
         return (d * w).sum() / w.sum()
@@ -352,6 +374,35 @@ def wavg(group, avg_name, weight_name, alerts=True):
         return d.mean()
 
 
+def grouped_wavg(df, by, avg_name, weight_name, alerts=True, zero_weight_mean=True):
+# Weighted average by group; same result as df.groupby(by).apply(wavg, avg_name, weight_name),
+# but computed w/two grouped sums instead of calling wavg for every group, and null values are checked once.
+# As in wavg, missing weights are treated as zero. Groups whose weights sum to zero fall back to the unweighted mean;
+# set zero_weight_mean=False to return NaN for these groups instead. Note wavg returns NaN for these groups in practice,
+# since 0/0 on numpy floats gives NaN rather than raising ZeroDivisionError; pipeline scripts rely on NaN there
+# (e.g., to fall back to region or world footprints), so they pass zero_weight_mean=False.
+# Returns a series indexed by group.
+
+    d = df[avg_name]
+    w = df[weight_name]
+
+    if alerts:
+        if d.isnull().values.any():
+            send_alert('wavg', 'Warning: weighted average utility function encountered', d.isnull().sum(), 'null value(s) in data!')
+
+        if w.isnull().values.any():
+            send_alert('wavg', 'Warning: weighted average utility function encountered', w.isnull().sum(), 'null value(s) in weights!')
+
+    keys = [df[col] for col in ([by] if isinstance(by, str) else by)]
+    sums = pd.DataFrame({'dw': d * w, 'w': w}).groupby(keys, observed=True).sum()
+    result = sums['dw'] / sums['w']
+
+    if zero_weight_mean:
+        result = result.where(sums['w'] != 0, d.groupby(keys, observed=True).mean())
+
+    return result.rename(None)
+
+
 def wcentile(df, percentile, value_col, weight_col):
     # https://stackoverflow.com/a/32034085
     # TODO: Add documentation, move to utilities script?
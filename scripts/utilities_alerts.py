@@ -0,0 +1,59 @@
+import os
+import sys
+import logging
+import pandas as pd
+from collections import Counter
+
+# Alerts raised by data checks (merges, filters, weighted averages, duplicate indices, etc.).
+# Each alert is logged, counted by kind, and kept as a record so a pipeline step's alerts can be saved with save_alerts.
+# Functions added to SINKS are also called with each alert record, e.g., to send alerts somewhere else.
+# Set the PIPELINE_RAISE_ON_ALERT environment variable to 'yes' to stop at the first alert, e.g., when debugging.
+RAISE_ON_ALERT = os.environ.get('PIPELINE_RAISE_ON_ALERT', 'no') == 'yes'
+SINKS = []
+
+counts = Counter()
+records = []
+
+# Alerts are printed to the console like any other message
+logger = logging.getLogger('pipeline.alerts')
+if not logger.handlers:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def send_alert(kind, *message, level=logging.WARNING, data=None):
+    # Raise an alert, e.g., send_alert('merge', 'MERGE ALERT: Index in', left_name, ...);
+    # message parts are joined with spaces, as print does.
+    # data: optional dict of details to keep in the alert record
+
+    text = ' '.join(str(m) for m in message)
+    record = {'kind': kind, 'level': logging.getLevelName(level), 'message': text}
+    if data is not None:
+        record.update(data)
+
+    counts[kind] += 1
+    records.append(record)
+    logger.log(level, text)
+    for sink in SINKS:
+        sink(record)
+
+    if RAISE_ON_ALERT:
+        raise RuntimeError(text)
+
+
+def send_error(kind, *message, data=None):
+    send_alert(kind, *message, level=logging.ERROR, data=data)
+
+
+def save_alerts(path):
+    # Save the alerts raised so far to a csv file, print a count by kind, then clear them
+
+    if records:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame(records).to_csv(path, index=False)
+        print('Alerts:', dict(counts), '- see', path)
+        records.clear()
+        counts.clear()
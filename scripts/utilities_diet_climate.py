@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-import winsound
 from utilities import *
 pd.options.display.width = 250
 
@@ -47,32 +46,47 @@ def apply_regional_global_wavg(fp, prod, countries):
     # LUC footprints do not use region/world averages, because if there is no country footprint, assume footprint == 0
     fp_not_luc = s_filter(fp, col='footprint_type', excl_str='luc_')
 
-    fp_region = fp_not_luc\
-        .groupby(region_cols).apply(wavg, 'footprint', 'mt_production')\
+    fp_region = grouped_wavg(fp_not_luc, region_cols, 'footprint', 'mt_production', zero_weight_mean=False)\
         .rename('region_footprint').reset_index()
 
-    fp_world = fp_not_luc\
-        .groupby(world_cols).apply(wavg, 'footprint', 'mt_production')\
+    fp_world = grouped_wavg(fp_not_luc, world_cols, 'footprint', 'mt_production', zero_weight_mean=False)\
         .rename('world_footprint').reset_index()
 
-    # Get a list of unique fbs items and associated valid footprint types.
-    fp = fp[['fbs_item_code', 'fbs_item', 'footprint_type']].drop_duplicates()
-
-    # Compute cartesian product of every possible country-item-footprint type trio.
-    # Dropping duplicates gives us every item-footprint type pair (without countries).
-    fp['merge_dummy_var'] = 1
-    countries['merge_dummy_var'] = 1
-    fp = fp.merge(countries, on='merge_dummy_var', how='outer').drop(columns='merge_dummy_var')
-
-    # Merge country, region, and world footprints
-    fp = fp\
-        .merge(fp_country, on=country_cols, how='left')\
-        .merge(fp_region, on=region_cols, how='left')\
-        .merge(fp_world, on=world_cols, how='left')
+    # Get a list of unique fbs items and associated valid footprint types
+    pairs = fp[world_cols].drop_duplicates().reset_index(drop=True)
+    countries = countries.reset_index(drop=True)
+
+    # Look up country, region, and world footprints in dense (item-footprint type pair x country) arrays,
+    # instead of merging them onto every possible country-item-footprint type trio
+    country_index = pd.MultiIndex.from_frame(countries[['country_code', 'country']])
+    if country_index.has_duplicates:
+        raise ValueError('Duplicate countries: ' + str(country_index[country_index.duplicated()].tolist()))
+    region_index = pd.Index(countries['gleam_region'].dropna().unique())
+
+    country_footprint = lookup_array(pairs, fp_country, country_index, ['country_code', 'country'], 'country_footprint')
+    region_footprint = lookup_array(pairs, fp_region, region_index, ['gleam_region'], 'region_footprint')
+    world_footprint = lookup_array(pairs, fp_world.assign(world=0), pd.Index([0]), ['world'], 'world_footprint')
+
+    # Each country gets the footprint of its region, and the world footprint
+    country_region = region_index.get_indexer(countries['gleam_region'])
+    if len(region_index) > 0:
+        region_footprint = np.where(country_region >= 0, region_footprint[:, country_region], np.nan)
+    else:
+        # No countries have a region, so there are no regional footprints
+        region_footprint = np.full(country_footprint.shape, np.nan)
+    world_footprint = np.broadcast_to(world_footprint, country_footprint.shape)
 
     # If a country-item has no matching LUC footprint data, set footprint to 0.
-    conds = fp['footprint_type'].str.contains('luc_', case=False)
-    fp.loc[conds, 'country_footprint'] = fp.loc[conds, 'country_footprint'].fillna(0)
+    luc = pairs['footprint_type'].str.contains('luc_', case=False).to_numpy()
+    country_footprint[luc] = np.nan_to_num(country_footprint[luc], nan=0)
+
+    # Create a row for every country-item-footprint type trio, in the same order as a cartesian product of
+    # item-footprint type pairs and countries
+    fp = pd.concat([pairs.iloc[np.repeat(np.arange(len(pairs)), len(countries))].reset_index(drop=True),
+                    countries.iloc[np.tile(np.arange(len(countries)), len(pairs))].reset_index(drop=True)], axis=1)
+    fp['country_footprint'] = country_footprint.ravel()
+    fp['region_footprint'] = region_footprint.ravel()
+    fp['world_footprint'] = world_footprint.ravel()
 
     # if country footprint exists, use that;
     # if region footprint exists, use that instead;
@@ -85,6 +99,27 @@ def apply_regional_global_wavg(fp, prod, countries):
     return fp
 
 
+def lookup_array(pairs, df, col_index, col_names, value_col):
+# Dense (item-footprint type pairs x col_index) array of value_col from df; NaN where df has no value.
+# Raises an error if df has more than one value for the same cell, which a merge would have duplicated
+
+    row = pd.MultiIndex.from_frame(pairs).get_indexer(pd.MultiIndex.from_frame(df[pairs.columns.tolist()]))
+    if isinstance(col_index, pd.MultiIndex):
+        col = col_index.get_indexer(pd.MultiIndex.from_frame(df[col_names]))
+    else:
+        col = col_index.get_indexer(df[col_names[0]])
+    found = (row >= 0) & (col >= 0)
+
+    cells = pd.Series(row[found] * len(col_index) + col[found])
+    if cells.duplicated().any():
+        dupes = df.loc[found, pairs.columns.tolist() + col_names][cells.duplicated(keep=False).to_numpy()]
+        raise ValueError('Duplicate ' + value_col + ' values for:\n' + dupes.to_string())
+
+    values = np.full((len(pairs), len(col_index)), np.nan)
+    values[row[found], col[found]] = df[value_col].to_numpy()[found]
+    return values
+
+
 def combine_footprint_types(fp, index_cols, results_cols, keep_originals):
 # Sum footprint types (e.g., blue WF + pond blue WF, GHG + LUC GHG)
 # This function may be called more than once, e.g., in item_footprints_by_coo and again in results_combine
@@ -94,13 +129,13 @@ def combine_footprint_types(fp, index_cols, results_cols, keep_originals):
     # Combine GHG footprints
     fp_ghg = s_filter(fp, col='footprint_type', substring='co2', excl_str='total')
     print('\nCombining footprint types: ', fp_ghg['footprint_type'].unique())
-    fp_ghg = fp_ghg.groupby(index_cols)[results_cols].sum().reset_index()
+    fp_ghg = fp_ghg.groupby(index_cols, observed=True)[results_cols].sum().reset_index()
     fp_ghg['footprint_type'] = 'kg_co2e_total'
 
     # Combine abx footprints
     fp_abx = s_filter(fp, col='footprint_type', substring='abx', excl_str='total')
     print('\nCombining footprint types: ', fp_abx['footprint_type'].unique())
-    fp_abx = fp_abx.groupby(index_cols)[results_cols].sum().reset_index()
+    fp_abx = fp_abx.groupby(index_cols, observed=True)[results_cols].sum().reset_index()
     fp_abx['footprint_type'] = 'mg_abx_total'
 
     fp_grouped = pd.concat([fp_ghg, fp_abx], sort=False)
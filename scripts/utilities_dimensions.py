@@ -0,0 +1,61 @@
+import pandas as pd
+import paths
+from utilities_io import CATEGORICAL_COLS
+from utilities_params import load_item_params
+
+# Shared categories for dimension columns (country, item, diet, etc.), which are repeated over millions of rows.
+# Tables encoded with encode_dimensions store these columns as categoricals w/the same categories,
+# so merges and groupbys between them work on integer codes instead of strings.
+# Categories are sorted, so sorting or grouping by a categorical column gives the same order as the original strings;
+# always group with observed=True, otherwise groupby includes every unobserved category.
+# Tables are converted back to strings when read w/read_df (see utilities_io.uncategorize).
+
+# Dimension columns and the dimension they take their categories from;
+# e.g., countries of origin (coo) use the same categories as consumer countries
+DIMENSIONS = {col: col for col in CATEGORICAL_COLS}
+DIMENSIONS.update({'coo': 'country', 'coo_income_class': 'income_class'})
+
+# Categories for each dimension: {dimension: sorted index of values}
+registry = {}
+
+
+def load_registry():
+    # Build the registry from the FAO country list and item parameters, once per process.
+    # Dimensions not listed in either file (e.g., diet, footprint_type) get their categories from the data.
+
+    if not registry:
+        countries = pd.read_csv(paths.interim / 'fao_countries.csv')
+        items = load_item_params()
+        for dim in ['country', 'gleam_region', 'region', 'income_class', 'oecd']:
+            if dim in countries.columns:
+                registry[dim] = categories(countries[dim])
+        for dim in ['fbs_item', 'output_group', 'type']:
+            registry[dim] = categories(items[dim])
+
+    return registry
+
+
+def categories(values):
+    return pd.Index(values).dropna().unique().sort_values()
+
+
+def dimension_dtype(col, values=()):
+    # Categorical dtype for a dimension column; values not in the registry (if any) are added to the categories
+    dim = DIMENSIONS[col]
+    known = load_registry().get(dim, pd.Index([]))
+    new = categories(values).difference(known)
+    if len(new) > 0:
+        known = known.append(new).sort_values()
+        registry[dim] = known
+    return pd.CategoricalDtype(known)
+
+
+def encode_dimensions(df, cols=None):
+    # Convert dimension columns (all of them, or cols) to shared categoricals; other columns are not copied
+
+    cols = [c for c in (cols if cols is not None else df.columns) if c in DIMENSIONS and c in df.columns]
+    df = df.copy(deep=False)
+    for col in cols:
+        values = df[col].cat.categories if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col]
+        df[col] = df[col].astype(dimension_dtype(col, values))
+    return df
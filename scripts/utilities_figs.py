@@ -1,9 +1,15 @@
+import os
+import pickle
+import hashlib
+import inspect
 import numpy as np
 import pandas as pd
 import math
 import paths
-import winsound
 import seaborn as sns
+from pathlib import Path
+from pipeline_scheduler import scan_io, SCRIPTS_DIR
+from pipeline_cache import hash_artifact
 from utilities_figs import *
 from utilities import *
 
@@ -16,6 +22,9 @@ from pandas.api.types import CategoricalDtype
 pd.options.display.max_columns = 999
 pd.options.mode.chained_assignment = None
 
+# Data prepared for figures (see cache_prepared) are saved here, in data/interim
+FIGS_CACHE_DIR = 'figs_cache'
+
 
 def plot_error_bars(ax, df, x_var, y_var, down_var, up_var):
 # Input: long-form dataframe with columns for x var, y var, and up/down y offset for each error bar
@@ -45,6 +54,7 @@ def rotate_x_labels(ax, degrees=45, x_shift=4.2, y_shift=1):
 
 def show_save_plot(show=True, filename='', path='', transparent=False, format=['png']):
 # Show or save figure, then close
+# path is the folder figures are saved to, e.g., paths.figures / 'sankey'
 
     #if show==None:
     #    return
@@ -56,9 +66,9 @@ def show_save_plot(show=True, filename='', path='', transparent=False, format=['
         for f in format:
             if filename != '':
                 if f == 'png':
-                    plt.savefig(path + filename + '.png', format='png', dpi=300, transparent=transparent)
+                    plt.savefig(os.path.join(path, filename + '.png'), format='png', dpi=300, transparent=transparent)
                 elif f == 'pdf':
-                            plt.savefig(path + filename + '.pdf', format='pdf', transparent=transparent)
+                            plt.savefig(os.path.join(path, filename + '.pdf'), format='pdf', transparent=transparent)
                 else:
                     print('ALERT: unrecognized image format')
 
@@ -322,3 +332,62 @@ def plot_strip_items(df, x='item', y='footprint', order='', color='', hue='', pa
     # Put y-axis on the right side, in case we're trying to make a dual-axis plot
     if y_axis == 'right':
         ax.yaxis.tick_right()
+
+
+def hash_code(func, h, seen):
+    # Add the source of a function to hash h, along w/the source of every function it calls
+    # that's defined in the scripts folder (e.g., prep functions and utilities), recursively
+
+    if func in seen:
+        return
+    seen.add(func)
+    h.update(inspect.getsource(func).encode())
+
+    codes = [func.__code__]
+    while codes:
+        code = codes.pop()
+        codes += [c for c in code.co_consts if inspect.iscode(c)]  # Lambdas, comprehensions, etc.
+        for name in code.co_names:
+            f = func.__globals__.get(name)
+            if inspect.isfunction(f) and Path(inspect.getsourcefile(f)).resolve().parent == SCRIPTS_DIR:
+                hash_code(f, h, seen)
+            elif isinstance(f, (str, int, float, list, tuple, dict)):
+                # Module constants, e.g., sort orders
+                h.update((name + repr(f)).encode())
+
+
+def cache_prepared(prep, *args):
+    # Return prep(*args), e.g., a function that reads a figure script's inputs and prepares data for plotting.
+    # The result is saved, and reused as long as the script's input files (see pipeline_scheduler.scan_io),
+    # the code of prep and the functions it calls, and args are unchanged.
+    # This way, changing how figures are drawn (labels, colors, etc.) doesn't repeat reading and preparing data.
+
+    script = Path(inspect.getsourcefile(prep)).stem
+    h = hashlib.sha256()
+    for key in sorted(scan_io(script)[0]):
+        h.update((key + str(hash_artifact(key))).encode())
+    hash_code(prep, h, set())
+    h.update(pickle.dumps(args))
+    key = h.hexdigest()
+
+    file = paths.interim / FIGS_CACHE_DIR / (script + '.' + prep.__name__ + '.pkl')
+    if file.exists():
+        try:
+            with open(file, 'rb') as f:
+                cached_key, data = pickle.load(f)
+            if cached_key == key:
+                print('Using cached figure data:', file.name)
+                return data
+        except Exception:
+            pass  # e.g., written by a different pandas version; prepare data again
+
+    data = prep(*args)
+
+    # Write to a temporary file first so parallel workers never read a partly written file
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_name(file.name + '.' + str(os.getpid()))
+    with open(tmp, 'wb') as f:
+        pickle.dump((key, data), f)
+    os.replace(tmp, file)
+
+    return data
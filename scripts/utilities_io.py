@@ -0,0 +1,241 @@
+import zipfile
+import pandas as pd
+import paths
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from utilities import snake_case
+from utilities_alerts import send_alert
+
+# Parquet requires pyarrow; without it, everything is read and written as .csv, as before
+try:
+    import pyarrow
+    PARQUET = True
+except ImportError:
+    PARQUET = False
+
+# Interim files are stored as .parquet only; set to True to also write .csv copies, e.g., to inspect them in Excel.
+# Files in data/output are always written as .csv since these are the published tables.
+KEEP_INTERIM_CSV = False
+
+# Dimension columns with relatively few unique values, repeated over many rows;
+# these are stored as categoricals, which makes files smaller and faster to read
+CATEGORICAL_COLS = ['country', 'coo', 'fbs_item', 'diet', 'output_group', 'type', 'origin', 'footprint_type',
+                    'gleam_region', 'region', 'income_class', 'coo_income_class', 'oecd', 'scaling_method']
+
+# Tables saved w/save_df(..., keep=True) are also kept in memory, so that later reads in the same process don't parse
+# the file again, e.g., the baseline diet is read by every diet model and by the pipeline script.
+# Only tables that are read again by the same process should be kept, e.g., diet model outputs, which are saved and
+# read in the main process; forked pipeline worker processes start w/a copy of these tables.
+# A table is only reused while the file on disk is still the one that was saved; otherwise the file is read as usual.
+# The least recently used tables are dropped once they take up more than ARTIFACTS_MAX_MB.
+KEEP_ARTIFACTS = True
+ARTIFACTS_MAX_MB = 1000
+
+# Tables kept in memory: {resolved path: (file stamps, df, size in MB)}, in order of last use
+artifacts = OrderedDict()
+
+# Types of FAOSTAT download columns (in snake case), so every chunk of a file is parsed the same way
+FAOSTAT_DTYPES = {'domain': str, 'area': str, 'element': str, 'item': str, 'unit': str, 'flag': str,
+                  'flag_description': str, 'year': 'int64', 'value': 'float64'}
+FAOSTAT_CHUNKSIZE = 500000
+
+
+def parquet_path(path):
+    return Path(path).with_suffix('.parquet')
+
+
+def is_output(path):
+    # True if the file is one of the published tables in data/output
+    return Path(paths.output).resolve() in Path(path).resolve().parents
+
+
+def artifact_key(path):
+    return str(Path(path).resolve())
+
+
+def artifact_stamp(path):
+    # Modification time and size of each file that may hold a saved table (.parquet and .csv)
+    stamps = []
+    for f in [parquet_path(path), Path(path)]:
+        stat = f.stat() if f.exists() else None
+        stamps.append((stat.st_mtime_ns, stat.st_size) if stat is not None else None)
+    return tuple(stamps)
+
+
+def publish_artifact(df, path, spill=True):
+    # Keep a copy of a saved table in memory, w/the same index it would have if read from disk;
+    # tables that weren't spilled to disk have no file stamps to check
+
+    key = artifact_key(path)
+    artifacts.pop(key, None)
+    df = df.reset_index(drop=True)
+    size = df.memory_usage(deep=True).sum() / 1024 ** 2
+    artifacts[key] = (artifact_stamp(path) if spill else None, df, size)
+
+    while sum(a[2] for a in artifacts.values()) > ARTIFACTS_MAX_MB and len(artifacts) > 0:
+        artifacts.popitem(last=False)
+
+
+def get_artifact(path):
+    # The table saved to path by this process, if it's in memory and the file hasn't changed since; otherwise None
+
+    key = artifact_key(path)
+    if key not in artifacts:
+        return None
+    stamp, df, _ = artifacts[key]
+    if stamp is not None and stamp != artifact_stamp(path):
+        del artifacts[key]
+        return None
+    artifacts.move_to_end(key)
+    return df
+
+
+def text_cols(df):
+    # Columns in CATEGORICAL_COLS that hold strings and aren't categorical yet;
+    # string columns are object dtype before pandas 3 and str dtype from pandas 3 on
+    return [c for c in CATEGORICAL_COLS if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype)
+            and (pd.api.types.is_string_dtype(df[c]) or df[c].dtype == object)]
+
+
+def uncategorize(df):
+    # Convert categorical columns back to the dtype of their categories, i.e., what read_csv would return
+    for c in df.select_dtypes('category').columns:
+        df[c] = df[c].astype(df[c].cat.categories.dtype)
+    return df
+
+
+def save_df(df, path, index=False, spill=True, keep=False):
+    # Save a dataframe to path, which is given as a .csv file name as usual.
+    # If pyarrow is available, a typed .parquet file with the same name is written instead,
+    # plus the .csv if the file is in data/output (or KEEP_INTERIM_CSV is True).
+    # keep=True also keeps the table in memory for later reads in this process (see KEEP_ARTIFACTS);
+    # spill=False keeps it in memory only, for tables that are only read again by the same process.
+
+    path = Path(path)
+    if not spill:
+        if not KEEP_ARTIFACTS:
+            raise ValueError('Tables can only be kept in memory if KEEP_ARTIFACTS is True: ' + str(path))
+        publish_artifact(df.reset_index() if index else df, path, spill=False)
+        return
+
+    write_csv = (not PARQUET) or KEEP_INTERIM_CSV or is_output(path)
+
+    if PARQUET:
+        df_p = df.reset_index() if index else df
+        cols = text_cols(df_p)
+        try:
+            df_p.astype({c: 'category' for c in cols}).to_parquet(parquet_path(path), index=False)
+        except (TypeError, ValueError, pyarrow.ArrowException) as e:
+            # e.g., columns that mix strings and numbers can't be stored as parquet; fall back to .csv
+            send_alert('io', 'IO ALERT: could not save', path.name, 'as parquet; saving as csv instead:', e)
+            parquet_path(path).unlink(missing_ok=True)
+            write_csv = True
+
+    if write_csv:
+        df.to_csv(path, index=index)
+
+    if keep and KEEP_ARTIFACTS:
+        publish_artifact(df.reset_index() if index else df, path)
+
+
+def read_df(path, columns=None, categorical=False, **kwargs):
+    # Read a dataframe saved with save_df, or any .csv file.
+    # Reads the .parquet version of the file if it's the most recently written, otherwise the .csv.
+    # Columns: list of columns to read (column projection), returned in the order given.
+    # Categorical: if False, categorical columns are converted back to strings;
+    # careful if setting to True, since groupby on categoricals includes unobserved categories unless observed=True.
+    # Other keyword arguments are passed to read_csv.
+    # Tables saved earlier by this process are copied from memory instead (see KEEP_ARTIFACTS),
+    # unless read_csv arguments are given.
+
+    path = Path(path)
+    pq = parquet_path(path)
+
+    df = get_artifact(path) if KEEP_ARTIFACTS and not kwargs else None
+    if df is not None:
+        df = (df[columns] if columns is not None else df).copy()
+        if categorical:
+            cols = text_cols(df)
+            df[cols] = df[cols].astype('category')
+        else:
+            df = uncategorize(df)
+        return df
+
+    if PARQUET and pq.exists() and (not path.exists() or pq.stat().st_mtime >= path.stat().st_mtime):
+        df = pd.read_parquet(pq, columns=columns)
+        if not categorical:
+            df = uncategorize(df)
+    else:
+        df = pd.read_csv(path, usecols=columns, **kwargs)
+        if categorical:
+            cols = text_cols(df)
+            df[cols] = df[cols].astype('category')
+
+    if columns is not None:
+        df = df[columns]
+
+    return df
+
+
+def read_faostat(path, elements=None, years=None, item_codes=None, units=None, columns=None,
+                 encoding=None, chunksize=FAOSTAT_CHUNKSIZE):
+    # Read a FAOSTAT download (.csv, .xlsx, or a bulk .zip), keeping only rows for the given
+    # elements, years, item codes, and units (None = keep all); elements and units are matched regardless of case.
+    # Column names are converted to snake case, e.g., 'Item Code (FAO)' -> 'item_code_fao'.
+    # Columns: list of (snake case) columns to read.
+    # CSV files are read in chunks and filtered as they're read, so memory use depends on the rows kept,
+    # not on the size of the download.
+
+    path = Path(path)
+
+    def keep(df):
+        df.columns = [snake_case(c) for c in df.columns]
+        conds = pd.Series(True, index=df.index)
+        if elements is not None:
+            conds &= df['element'].str.lower().isin([e.lower() for e in elements])
+        if years is not None:
+            conds &= df['year'].isin(years)
+        if item_codes is not None:
+            conds &= df[item_code_col(df)].isin(item_codes)
+        if units is not None:
+            conds &= df['unit'].str.lower().isin([u.lower() for u in units])
+        return df[conds]
+
+    if path.suffix == '.xlsx':
+        df = keep(pd.read_excel(path))
+        return df if columns is None else df[columns]
+
+    @contextmanager
+    def open_csv():
+        # Bulk downloads are zip files w/several tables; the data is the largest one
+        if path.suffix == '.zip':
+            with zipfile.ZipFile(path) as z:
+                member = max((i for i in z.infolist() if i.filename.endswith('.csv')), key=lambda i: i.file_size)
+                with z.open(member) as f:
+                    yield f
+        else:
+            with open(path, 'rb') as f:
+                yield f
+
+    # Map snake case names to the file's own column names for types and column selection
+    with open_csv() as f:
+        header = pd.read_csv(f, nrows=0, encoding=encoding).columns
+    names = {snake_case(c): c for c in header}
+    dtype = {names[c]: t for c, t in FAOSTAT_DTYPES.items() if c in names}
+    usecols = None
+    if columns is not None:
+        filter_cols = [c for c in ['element', 'year', 'unit'] if c in names] + \
+                      ([item_code_col(names)] if item_codes is not None else [])
+        usecols = [names[c] for c in dict.fromkeys(columns + filter_cols)]
+
+    with open_csv() as f:
+        chunks = [keep(chunk) for chunk in pd.read_csv(f, dtype=dtype, usecols=usecols, encoding=encoding,
+                                                          chunksize=chunksize)]
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=[snake_case(c) for c in usecols or header])
+    return df if columns is None else df[columns]
+
+
+def item_code_col(df):
+    # Some FAOSTAT downloads name the item code column 'Item Code (FAO)'
+    return 'item_code' if 'item_code' in df else 'item_code_fao'
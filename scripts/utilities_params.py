@@ -0,0 +1,125 @@
+import os
+import json
+import pickle
+import hashlib
+import pandas as pd
+import paths
+from pathlib import Path
+from utilities import string_to_int_list
+
+# Parsing excel workbooks is slow, so each sheet is parsed once and kept in memory for the rest of the run.
+# Parsed sheets are also saved to this file, so other pipeline worker processes and later runs can skip parsing too.
+CACHE_FILE = 'parameters_cache.pkl'
+
+# Run parameters can be overridden without editing the workbook, e.g., for sensitivity scenarios (see pipeline_scenarios).
+# Overrides are kept in this environment variable as JSON, e.g., {"abx_aqua_low_high": "low"},
+# so pipeline worker processes started during the run use them too.
+OVERRIDES_VAR = 'PIPELINE_PARAM_OVERRIDES'
+
+# In-memory copies of parsed sheets: {(workbook path, sheet name, skiprows): ((mtime, size), df)}
+sheets = {}
+
+
+def file_stamp(path):
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def hash_contents(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def read_cache_file():
+    file = paths.interim / CACHE_FILE
+    try:
+        with open(file, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        # Missing, or written by a different pandas version; sheets will be parsed again
+        return {}
+
+
+def write_cache_file(entries):
+    # Add parsed sheets to the cache file. The file is read again just before it's replaced, so sheets added by
+    # parallel workers since this process last read it are kept. Written to a temporary file first so parallel
+    # workers never read a partly written file.
+    file = paths.interim / CACHE_FILE
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_name(file.name + '.' + str(os.getpid()))
+    cache = read_cache_file()
+    cache.update(entries)
+    with open(tmp, 'wb') as f:
+        pickle.dump(cache, f)
+    os.replace(tmp, file)
+
+
+def load_sheet(path, sheet_name, skiprows=0, copy=True):
+    # Equivalent to pd.read_excel(path, sheet_name=sheet_name, skiprows=skiprows), but parses the sheet only once.
+    # Sheets are parsed again whenever the workbook changes: the in-memory copy is checked against the file's
+    # modification time and size, and the cache file against a hash of the file's contents.
+    # Returns a copy, so scripts can modify the dataframe as usual.
+
+    path = Path(path)
+    key = (str(path.resolve()), sheet_name, skiprows)
+    stamp = file_stamp(path)
+
+    if key not in sheets or sheets[key][0] != stamp:
+        digest = hash_contents(path)
+        cache = read_cache_file()
+        if key in cache and cache[key][0] == digest:
+            df = cache[key][1]
+        else:
+            df = pd.read_excel(path, sheet_name=sheet_name, skiprows=skiprows)
+            write_cache_file({key: (digest, df)})
+        sheets[key] = (stamp, df)
+
+    df = sheets[key][1]
+    return df.copy() if copy else df
+
+
+def load_params_sheet(sheet_name, copy=True):
+    # Sheets in run_parameters.xlsx, e.g., 'countries_incl'; the first row of each sheet is a description
+    return load_sheet(paths.params, sheet_name, skiprows=1, copy=copy)
+
+
+def get_param_overrides():
+    return json.loads(os.environ.get(OVERRIDES_VAR, '{}'))
+
+
+def set_param_overrides(overrides):
+    # Override run parameters for the rest of the run, e.g., set_param_overrides({'abx_crops_low_high': 'low'});
+    # an empty dict clears all overrides
+    os.environ[OVERRIDES_VAR] = json.dumps(overrides)
+
+
+def apply_param_overrides(run_params):
+    # Apply overrides to the 'parameters' sheet, indexed by parameter
+    for parameter, value in get_param_overrides().items():
+        if parameter not in run_params.index:
+            raise KeyError('Run parameter override for unknown parameter: ' + parameter)
+        run_params.loc[parameter, 'value'] = value
+    return run_params
+
+
+def load_run_params():
+    # The 'parameters' sheet of run_parameters.xlsx, indexed by parameter, w/any overrides applied
+    return apply_param_overrides(load_params_sheet('parameters').set_index('parameter'))
+
+
+def load_item_params():
+    # The 'fbs_items' sheet of item_parameters.xlsx (column names not yet converted to snake case)
+    return load_sheet(paths.input / 'item_parameters.xlsx', 'fbs_items')
+
+
+def get_param(parameter):
+    # Value of a single run parameter, e.g., get_param('abx_aqua_low_high') -> 'mean'
+    overrides = get_param_overrides()
+    if parameter in overrides:
+        return overrides[parameter]
+    run_params = load_params_sheet('parameters', copy=False)
+    return run_params.set_index('parameter').loc[parameter, 'value']
+
+
+def get_param_years(parameter):
+    # Run parameter listing years, as a list of integers, e.g., get_param_years('fao_data_years') -> [2016, ..., 2019]
+    return string_to_int_list(str(get_param(parameter)))
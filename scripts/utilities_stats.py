@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-import winsound
 import scipy.stats as stats
 import statistics
 import statsmodels.api as sm
@@ -47,20 +46,15 @@ def test_kruskal_wallace(df, y, groups, groupby=''):
         df['temp_dummy_var']='one_dummy_group_for_all_values'
         groupby='temp_dummy_var'
 
+    # Tests for all groups are computed at once; see batch_kruskal_wallace
     # TODO: flag an error if any of the groups are not in the df. Right now doing so results in a blank P value.
-    kw = df.groupby(groupby).apply(
-        lambda t: stats.kruskal(*[t[t[pair[0]] == pair[1]][y] for pair in groups])
-    ).rename('kruskal_wallace').reset_index()
-
-    kw[['h_statistic', 'p_value']] = pd.DataFrame(
-        kw['kruskal_wallace'].tolist())  # Statistical test outputs a tuple, this splits the tuple into separate cols
+    kw = batch_kruskal_wallace(df, y, groups, groupby)
 
     # Add descriptive stats
     # https://data.library.virginia.edu/getting-started-with-the-kruskal-wallis-test/
     kw['group'] = groups[0][0]
     kw['y'] = y
     kw['medians_equal_across_groups'] = np.where(kw['p_value'] > 0.05, 'yes', 'no')
-    kw = kw.drop(columns='kruskal_wallace')
     if 'temp_dummy_var' in kw.columns:
         kw = kw.drop(columns='temp_dummy_var')
     return(kw)
@@ -135,37 +129,160 @@ def test_mann_whitney(df, compare_by, x, y, values, hypothesis='two-sided', sig_
     return mw
 
 
-def group_mann_whitney(df, group_by, compare_by, x, y, values, hypothesis='two-sided', filepath='', show=False, sig_levels=[0.001, 0.01, 0.05]):
-# Group a long-form dataframe by 'group_by'.
-# Within each group, perform Mann-Whitney test.
-# 'group_by' must either be a string referring to a single column in df, or a list of length > 1 if grouping over multiple columns.
+def rank_groups(df, group_by, values):
+# Rank values within each group of a long-form dataframe, all groups in one pass (ties get the average rank).
+# Also return the tie term used by rank tests' tie corrections, sum(t^3 - t) over tied values, for each group.
+
+    ranks = df.groupby(group_by)[values].rank(method='average')
+
+    t = df.groupby(group_by + [values]).size().astype(float)
+    ties = (t ** 3 - t).groupby(level=group_by).sum()
+
+    return ranks, ties
+
+
+def batch_mann_whitney(df, group_by, compare_by, x, y, values, hypothesis='two-sided', sig_levels=[0.001, 0.01, 0.05]):
+# Mann-Whitney U tests comparing 'values' where compare_by == x vs. compare_by == y, within every group defined by
+# the list of columns 'group_by', all computed at once instead of one test per group.
+# Returns one row per group w/the same columns as test_mann_whitney, plus the group_by columns.
+# Results match stats.mannwhitneyu w/its default settings: p-values are asymptotic (w/tie and continuity corrections),
+# except for groups where scipy computes exact p-values (no ties and x or y has 8 or fewer values);
+# those are few and small, so they're passed to scipy.
+
+    # All groups, including groups w/o any x or y values
+    index = df.groupby(group_by).size().index
+
+    df = df.loc[df[compare_by].isin([x, y]), group_by + [compare_by, values]]
+    df['side'] = np.where(df[compare_by] == x, 'x', 'y')
+
+    # N, medians, and means of x and y in each group, from a single groupby
+    mw = df.groupby(group_by + ['side'])[values].agg(['count', 'size', 'median', 'mean']).unstack('side')
+    mw = mw.reindex(index=index, columns=pd.MultiIndex.from_product([['count', 'size', 'median', 'mean'], ['x', 'y']]))
+    mw.columns = [side + '_' + stat for stat, side in mw.columns]
+    mw[['x_count', 'x_size', 'y_count', 'y_size']] = mw[['x_count', 'x_size', 'y_count', 'y_size']].fillna(0)
+
+    # Rank sums of x
+    df['rank'], ties = rank_groups(df, group_by, values)
+    rank_sum_x = df[df['side'] == 'x'].groupby(group_by)['rank'].sum().reindex(index, fill_value=0)
+    ties = ties.reindex(index, fill_value=0)
+
+    # U statistic of x (as returned by scipy) and the statistic used for the p-value, depending on the hypothesis
+    n1 = mw['x_size']
+    n2 = mw['y_size']
+    u1 = rank_sum_x - n1 * (n1 + 1) / 2
+    u2 = n1 * n2 - u1
+    u = {'two-sided': np.maximum(u1, u2), 'greater': u1, 'less': u2}[hypothesis]
+
+    # Normal approximation w/tie and continuity corrections
+    n = n1 + n2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sd = np.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+        z = (u - n1 * n2 / 2 - 0.5) / sd
+    p = pd.Series(stats.norm.sf(z), index=index)
+    if hypothesis == 'two-sided':
+        p *= 2
+    mw['u_statistic'] = u1.astype(object)
+    mw['p_value'] = p.clip(0, 1)
+
+    # Like scipy, groups w/nan values return nan
+    has_nan = (mw['x_count'] < mw['x_size']) | (mw['y_count'] < mw['y_size'])
+    mw.loc[has_nan, ['u_statistic', 'p_value']] = np.nan
+
+    # Exact p-values, w/scipy
+    exact = (~has_nan) & (ties == 0) & ((n1 <= 8) | (n2 <= 8)) & (n1 > 0) & (n2 > 0)
+    if exact.any():
+        # Groupby returns groups in the same (sorted) order as index
+        exact_df = df[df.set_index(group_by).index.isin(index[exact])]
+        results = [stats.mannwhitneyu(g.loc[g['side'] == 'x', values].values, g.loc[g['side'] == 'y', values].values,
+                                      alternative=hypothesis) for _, g in exact_df.groupby(group_by)]
+        mw.loc[exact, 'u_statistic'] = [r[0] for r in results]
+        mw.loc[exact, 'p_value'] = [r[1] for r in results]
+
+    # Error checks: Mann Whitney test returns an error if the x and y values are identical sets of numbers,
+    # or if either is empty
+    in_both = df.groupby(group_by + [values])['side'].nunique().eq(2)
+    same = in_both.groupby(level=group_by).all().reindex(index, fill_value=True)
+    empty = ~same & ((n1 == 0) | (n2 == 0))
+    for key in index[same]:
+        print('All numbers are identical in mann whitney U test; skipping a test for', compare_by, key)
+    for key in index[empty]:
+        print('Mann whitney U test with zero values in a group; skipping a test for', compare_by, key)
+    mw.loc[same | empty, 'p_value'] = 9999
+    mw.loc[same, 'u_statistic'] = 'error: all values same'
+    mw.loc[empty, 'u_statistic'] = 'error: zero values in a group'
+    mw.loc[empty, ['x_median', 'y_median', 'x_mean', 'y_mean']] = np.nan
+
+    # Label inputs
+    mw['n'] = n.astype(int)
+    mw['compare_by'] = compare_by
+    mw['x'] = x
+    mw['y'] = y
+    mw['hypothesis'] = hypothesis
+
+    # Compute additional stats
+    mw['median_diff'] = mw['x_median'] - mw['y_median']
+    mw['%_median_diff'] = (mw['median_diff'] / mw['y_median']) * 100
+    mw['mean_diff'] = mw['x_mean'] - mw['y_mean']
+    mw['%_mean_diff'] = (mw['mean_diff'] / mw['y_mean']) * 100
+
+    # Flag significant values
+    mw = flag_sigificance(mw, direction='mean_diff', sig_levels=sig_levels)
 
-    # Create empty dataframe to contain results
-    results = pd.DataFrame()
+    # Flag whether x is larger than y or vice versa
+    conds = [mw['mean_diff'] > 0, mw['mean_diff'] < 0]
+    choices = ['x>y', 'x<y']
+    mw['direction'] = np.select(conds, choices, default='x=y')
+
+    # Arrange cols
+    mw = mw.reset_index()
+    mw = mw[group_by + ['compare_by', 'x', 'y', 'n', 'hypothesis', 'x_median', 'y_median', 'median_diff', '%_median_diff',
+                        'x_mean', 'y_mean', 'mean_diff', '%_mean_diff',
+                        'u_statistic', 'p_value', 'significance', 'sig*', 'sig+/-', 'direction']]
+
+    return mw
+
+
+def batch_kruskal_wallace(df, y, groups, groupby):
+# Kruskal-Wallis H tests within every group defined by groupby (a column or list of columns), all computed at once.
+# Groups is a list of variable-value pairs defining the samples compared; returns one row per group w/the groupby
+# columns, h_statistic, and p_value. Results match stats.kruskal, including nan results if a sample is empty.
 
-    #TODO: There's probably a faster/better way to do this without using a loop.
-    # Iterate over groups, compile results in a dataframe
-    for g in df.groupby(group_by):
+    keys = [groupby] if type(groupby) == str else list(groupby)
+    index = df.groupby(keys).size().index
 
-        # index 1 is the dataframe in a groupby object
-        df = test_mann_whitney(g[1], compare_by, x, y, values, hypothesis, sig_levels=sig_levels)
+    # Stack the samples, labeled by their position in groups; a row can be in more than one sample
+    samples = pd.concat([df.loc[df[pair[0]] == pair[1], keys + [y]].assign(sample=i) for i, pair in enumerate(groups)],
+                        ignore_index=True)
+    samples['rank'], ties = rank_groups(samples, keys, y)
 
-        # If group_by is a single column, add the group name to a single column.
-        if type(g[0]) == str:
-            df[group_by] = g[0]
+    # Size and rank sum of each sample in each group
+    sums = samples.groupby(keys + ['sample'])['rank'].agg(['size', 'sum']).unstack('sample')
+    sums = sums.reindex(index=index, columns=pd.MultiIndex.from_product([['size', 'sum'], range(len(groups))]))
+    n_i = sums['size'].fillna(0)
+    n = n_i.sum(axis=1)
+    ties = ties.reindex(index, fill_value=0)
 
-        # If grouping over multiple columns, add each column to results.
-        elif type(g[0]) == tuple:
-            for t in range(0, len(g[0])):
-                df[group_by[t]] = g[0][t]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = 12 / (n * (n + 1)) * (sums['sum'] ** 2 / n_i).sum(axis=1, min_count=len(groups)) - 3 * (n + 1)
+        h /= 1 - ties / (n ** 3 - n)
 
-        results = pd.concat([results, df], sort=False)
+    # Like scipy, nan if any sample is empty
+    h[(n_i == 0).any(axis=1)] = np.nan
 
-    # Arrange columns
+    kw = pd.DataFrame({'h_statistic': h, 'p_value': stats.chi2.sf(h, len(groups) - 1)}, index=index).reset_index()
+
+    return kw
+
+
+def group_mann_whitney(df, group_by, compare_by, x, y, values, hypothesis='two-sided', filepath='', show=False, sig_levels=[0.001, 0.01, 0.05]):
+# Group a long-form dataframe by 'group_by'.
+# Within each group, perform Mann-Whitney test.
+# 'group_by' must either be a string referring to a single column in df, or a list of length > 1 if grouping over multiple columns.
+
+    # Tests for all groups are computed at once; see batch_mann_whitney
     if type(group_by) == str:
         group_by = [group_by]
-    cols = [c for c in results.columns.tolist() if c not in group_by]
-    results = results[group_by + cols]
+    results = batch_mann_whitney(df, group_by, compare_by, x, y, values, hypothesis, sig_levels=sig_levels)
 
     if show:
         print(results)
@@ -196,22 +313,16 @@ def test_normality(df, y, groupby='', log=True):
     # Shapiro-wilks test for normality, with grouping
     # Confirmed results with https://www.statskingdom.com/320ShapiroWilk.html
     # Off by a hundredth value but otherwise almost exactly the same,
-    sw = df.groupby(groupby).apply(
-        lambda t: stats.shapiro(t[y].values))\
-        .rename('result').reset_index()
+    # Test and N for every group from a single groupby
+    sw = df.groupby(groupby)[y].agg(result=lambda v: tuple(stats.shapiro(v.values)), n='count').reset_index()
 
     # Statistical test outputs a tuple, this splits the tuple into separate cols
-    sw[['statistic', 'p_value']] = pd.DataFrame(
-        sw['result'].tolist())
+    sw[['statistic', 'p_value']] = pd.DataFrame(sw['result'].tolist(), index=sw.index)
     sw = sw.drop(columns='result')
     sw['y'] = y
 
-    # Add N
-    n = df.groupby(groupby)[y].count()\
-        .rename('n').reset_index()
-
-    # Merge
-    sw = s_merge(sw, n, on=groupby, how='left', validate='1:1')
+    # Arrange cols
+    sw = sw[[c for c in sw.columns if c != 'n'] + ['n']]
 
     sw['normal'] = np.where(sw['p_value'] > 0.05, 'yes', 'no')
     if log:
@@ -223,7 +334,7 @@ def test_normality(df, y, groupby='', log=True):
     return sw
 
 
-def test_corr(dff, x, y, test='pearson_r', print_log=False, error_beep=True):
+def test_corr(dff, x, y, test='pearson_r', print_log=False):
 # Run Pearson correlation test on wide-form dataframe df, comparing values in columns x and y.
 # Return single-row dataframe with results.
 # A wide form dataframe is used because both x and y must be the same length.
@@ -235,21 +346,15 @@ def test_corr(dff, x, y, test='pearson_r', print_log=False, error_beep=True):
 
     # Error checks
     if len(df[x]) != len(df[y]):
-        print('ERROR: Pearson test: length of x values != length of y values for',x,y)
-        if error_beep:
-            winsound.Beep(400, 700)
+        send_error('stats', 'ERROR: Pearson test: length of x values != length of y values for',x,y)
 
     if df[x].isnull().values.any():
-        print('ERROR: Pearson test: nan value found in x_vals; dropping row(s) from dataframe for',x,y)
+        send_error('stats', 'ERROR: Pearson test: nan value found in x_vals; dropping row(s) from dataframe for',x,y)
         df = df[df[x].notna()]
-        if error_beep:
-            winsound.Beep(400, 700)
 
     if df[y].isnull().values.any():
-        print('ERROR: Pearson test: nan value found in y_vals; dropping row(s) from dataframe for',x,y)
+        send_error('stats', 'ERROR: Pearson test: nan value found in y_vals; dropping row(s) from dataframe for',x,y)
         df = df[df[y].notna()]
-        if error_beep:
-            winsound.Beep(400, 700)
 
     x_vals = df[x]
     y_vals = df[y]
@@ -0,0 +1,58 @@
+import os
+import pandas as pd
+from utilities_alerts import send_error
+
+# Data checks run on every pipeline step.
+# By default, failed checks print an error and the step keeps running.
+# Set the PIPELINE_STRICT_CHECKS environment variable to 'yes' to stop the step with an error instead,
+# and to also run checks marked strict_only (e.g., checks on tables that are unique by construction).
+STRICT_CHECKS = os.environ.get('PIPELINE_STRICT_CHECKS', 'no') == 'yes'
+
+
+def duplicate_rows(df, index_cols):
+    # Rows whose index_cols values appear more than once; uses hashed keys, without copying df
+    return df.loc[df.duplicated(subset=index_cols, keep=False)]
+
+
+def nan_columns(df, cols):
+    # Columns in cols that contain NAN values, found in a single pass over df[cols]
+    has_nan = df[cols].isna().any()
+    return has_nan[has_nan].index.tolist()
+
+
+def check_duplicate_indices(df, index_cols):
+    # Check for duplicate indices
+    return len(run_checks(df, unique=index_cols)) > 0
+
+
+def check_nan_values(df, cols):
+    # Check for NAN values in columns - important, for example, before grouping by those columns
+    return len(run_checks(df, notna=cols)) > 0
+
+
+def run_checks(df, unique=None, notna=None, name='', strict_only=False):
+    # Run all checks on a table at once:
+    # unique: columns that together should uniquely identify each row;
+    # notna: columns that should not contain NAN values.
+    # Returns a list of failed checks. With strict_only=True, checks only run in strict mode.
+
+    if strict_only and not STRICT_CHECKS:
+        return []
+
+    failed = []
+
+    if notna:
+        for col in nan_columns(df, notna):
+            send_error('nan_values', 'ERROR: NAN VALUE IN COLUMN:', col, name, df.loc[df[col].isna(), notna])
+            failed.append('NAN values in ' + col)
+
+    if unique:
+        dupes = duplicate_rows(df, unique)
+        if len(dupes) > 0:
+            send_error('duplicate_indices', 'ERROR: DUPLICATE INDICES FOUND:', name, dupes)
+            failed.append(str(len(dupes)) + ' rows with duplicate ' + ', '.join(unique))
+
+    if failed and STRICT_CHECKS:
+        raise ValueError('Checks failed' + (' for ' + name if name else '') + ': ' + '; '.join(failed))
+
+    return failed
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Pipeline scripts import each other by name, as when run from the scripts folder
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import diet_footprints_bootstrap as bootstrap
+
+# Centiles from the histogram sketch (SKETCH) must be within 1 bin width of the exact centiles
+# computed from all trials, i.e., (largest - smallest possible total) / SKETCH_BINS for each group.
+
+N_TRIALS = 2000
+
+
+def random_case(seed):
+    # Random discrete footprint distributions and diet quantities, incl. groups that eat nothing (zero-width bins)
+    # and items w/a single footprint value
+
+    rng = np.random.default_rng(seed)
+    n_items = rng.integers(1, 8)
+    n_groups = rng.integers(1, 30)
+
+    dists = []
+    for i in range(n_items):
+        n_values = rng.integers(1, 6)
+        footprints = rng.lognormal(0, 2, n_values)
+        weights = rng.random(n_values)
+        dists.append((footprints, weights / weights.sum()))
+
+    quants = rng.random((n_groups, n_items)) * (rng.random((n_groups, n_items)) < 0.7)
+    quants[0] = 0
+    return quants, dists
+
+
+def check_sketch(quants, dists, fp_type_key=0):
+    samples = bootstrap.sample_footprints(dists, fp_type_key, 0, N_TRIALS)
+    exact = bootstrap.bootstrap_centiles(quants, samples)
+
+    lo, hi = bootstrap.total_bounds(quants, dists)
+    counts = bootstrap.sketch_trials(quants, lo, hi, dists, fp_type_key, [0], [N_TRIALS])
+    sketch = bootstrap.sketch_centiles(counts, lo, hi)
+
+    width = (hi - lo) / bootstrap.SKETCH_BINS
+    tol = width[:, None] + 1e-9 * np.maximum(np.abs(exact), 1)
+    assert np.all(np.abs(sketch - exact) <= tol)
+    return width
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_sketch_centiles_within_one_bin(seed):
+    quants, dists = random_case(seed)
+    width = check_sketch(quants, dists, fp_type_key=seed)
+    assert width[0] == 0
+
+
+def test_sketch_centiles_single_values():
+    # Every item has a single footprint value, so every group's totals are all the same (zero-width bins)
+    dists = [(np.array([2.5]), np.array([1.0])), (np.array([0.4]), np.array([1.0]))]
+    quants = np.array([[1.0, 2.0], [0.0, 0.0], [3.0, 0.0]])
+    width = check_sketch(quants, dists)
+    assert np.all(width == 0)
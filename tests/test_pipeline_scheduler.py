@@ -0,0 +1,42 @@
+import pipeline_scheduler as scheduler
+import utilities_alerts
+
+# scan_io must find the file in any argument of a read/write call, and alert on calls whose file it can't find
+
+SCRIPT = '''
+import paths
+FILE_PATH = paths.figures / 'sankey'
+file = 'item_footprints/item_footprints_abx_meat.csv'
+
+def step():
+    dm = read_df(paths.interim / 'diet_model.csv', columns=['country', 'diet'])
+    meat = pd.read_csv(paths.interim/file)
+    save_df(dm[['country', 'diet']], paths.output/'diet_model_by_country.csv')
+    save_df(dm.query("diet == 'baseline'"), path=paths.output / "baseline.csv")
+    meat.groupby(['country', 'item'])['footprint'].sum().to_csv(FILE_PATH / 'sankey.csv', index=False)
+    # dm.to_csv(paths.output/'commented_out.csv')
+    dm.to_csv(paths.output / name)
+'''
+
+
+def scan(tmp_path, monkeypatch, source):
+    (tmp_path / 'step.py').write_text(source)
+    monkeypatch.setattr(scheduler, 'SCRIPTS_DIR', tmp_path)
+    monkeypatch.setattr(scheduler, 'unresolved', set())
+    monkeypatch.setattr(utilities_alerts, 'records', [])
+    return scheduler.scan_io('step')
+
+
+def test_scan_io_finds_paths_in_any_argument(tmp_path, monkeypatch):
+    inputs, outputs = scan(tmp_path, monkeypatch, SCRIPT)
+    assert inputs == {'interim/diet_model.csv', 'interim/item_footprints/item_footprints_abx_meat.csv'}
+    assert outputs == {'output/diet_model_by_country.csv', 'output/baseline.csv', 'figures/sankey/sankey.csv',
+                       'output'}
+
+
+def test_scan_io_alerts_on_unresolved_paths(tmp_path, monkeypatch):
+    scan(tmp_path, monkeypatch, SCRIPT + '    save_df(dm, output_file(dm))\n')
+    messages = [r['message'] for r in utilities_alerts.records if r['kind'] == 'scan']
+    assert len(messages) == 2
+    assert 'to_csv(paths.output / name)' in messages[0]
+    assert 'save_df(dm, output_file(dm))' in messages[1]
@@ -0,0 +1,30 @@
+import pandas as pd
+import paths
+import utilities_params
+
+# Sheets parsed by parallel workers must all end up in the parameters cache file, whichever worker writes last
+
+
+def test_cache_file_keeps_sheets_added_by_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, 'interim', tmp_path / 'interim')
+    monkeypatch.setattr(utilities_params, 'sheets', {})
+    workbook = tmp_path / 'params.xlsx'
+    with pd.ExcelWriter(workbook) as writer:
+        pd.DataFrame({'a': [1, 2]}).to_excel(writer, sheet_name='first', index=False)
+        pd.DataFrame({'b': [3]}).to_excel(writer, sheet_name='second', index=False)
+
+    # While this process parses 'second', another worker finishes parsing 'first' and saves it to the cache file
+    read_excel = pd.read_excel
+    other_key = (str(workbook.resolve()), 'first', 0)
+
+    def parse_while_other_worker_writes(path, sheet_name, skiprows):
+        df = read_excel(path, sheet_name=sheet_name, skiprows=skiprows)
+        utilities_params.write_cache_file({other_key: (utilities_params.hash_contents(workbook),
+                                                       read_excel(path, sheet_name='first'))})
+        return df
+
+    monkeypatch.setattr(pd, 'read_excel', parse_while_other_worker_writes)
+    utilities_params.load_sheet(workbook, 'second')
+
+    cached = {key[1] for key in utilities_params.read_cache_file()}
+    assert cached == {'first', 'second'}